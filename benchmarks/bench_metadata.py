@@ -0,0 +1,59 @@
+"""
+Benchmarks of parsing and transformation of GEO metadata, run against
+synthetic series of SCALES samples (see conftest.py)
+"""
+
+import copy
+import logging
+
+import pytest
+
+from geofetch import Geofetcher
+
+logging.getLogger("geofetch").setLevel(logging.WARNING)
+
+
+@pytest.fixture
+def geofetcher(make_geofetcher) -> Geofetcher:
+    return make_geofetcher(processed=True)
+
+
+@pytest.fixture
+def processed_samples(geofetcher, parsed_soft) -> list:
+    samples, _ = geofetcher._get_list_of_processed_files(*parsed_soft)
+    return samples
+
+
+def test_read_gsm_metadata(benchmark, geofetcher, series, parsed_soft):
+    gsm_metadata = benchmark(
+        geofetcher._read_gsm_metadata, series.gse, {series.gse: {}}, parsed_soft[1]
+    )
+    assert len(gsm_metadata) == series.n_samples
+
+
+def test_get_list_of_processed_files(benchmark, geofetcher, series, parsed_soft):
+    # filelist.txt of the series is fetched from the stand-in server
+    samples, _ = benchmark(geofetcher._get_list_of_processed_files, *parsed_soft)
+    assert len(samples) == 2 * series.n_samples
+
+
+def test_expand_metadata_list(benchmark, geofetcher, processed_samples):
+    expanded = benchmark.pedantic(
+        geofetcher._expand_metadata_list,
+        setup=lambda: ((copy.deepcopy(processed_samples),), {}),
+        rounds=5,
+    )
+    assert "cell type" in expanded[0]
+
+
+def test_separate_common_meta(benchmark, geofetcher, processed_samples):
+    expanded = geofetcher._expand_metadata_list(copy.deepcopy(processed_samples))
+    samples, project_meta = benchmark(geofetcher._separate_common_meta, expanded)
+    assert "Sample_extract_protocol_ch1" in project_meta[0]
+
+
+@pytest.mark.parametrize("processed", [False, True], ids=["raw", "processed"])
+def test_get_projects(benchmark, make_geofetcher, series, processed):
+    geofetcher = make_geofetcher(processed=processed, data_source="samples")
+    projects = benchmark.pedantic(geofetcher.get_projects, args=(series.gse,), rounds=3)
+    assert len(projects) == 1
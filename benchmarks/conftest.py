@@ -0,0 +1,279 @@
+"""
+Synthetic GEO/SRA metadata and a local HTTP stand-in of NCBI, that serves it.
+
+Metadata of the series is generated with any number of samples, in the shape
+of real GEO SOFT files (characteristics, supplementary files, SRA relations),
+so the benchmarks run offline and can be scaled far beyond the test fixtures.
+"""
+
+import http.server
+import json
+import re
+import threading
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from geofetch import Geofetcher, NCBIClient
+from geofetch.ratelimit import RateLimiter
+from geofetch.soft import parse_soft
+
+# Number of samples of series used in benchmarks
+SCALES = [100, 10000]
+
+
+def gse_soft(gse: str, srp: str, n_samples: int) -> str:
+    """
+    :param gse: GSE accession
+    :param srp: SRA project of the series
+    :param n_samples: number of samples
+    :return: GSE soft file
+    """
+    lines = [
+        f"^SERIES = {gse}",
+        f"!Series_title = Synthetic series {gse}",
+        f"!Series_geo_accession = {gse}",
+        "!Series_status = Public on Jan 01 2020",
+        "!Series_summary = " + "Summary of the series. " * 20,
+        "!Series_overall_design = design: synthetic",
+        *(f"!Series_sample_id = GSM{gse[3:]}{n:05d}" for n in range(n_samples)),
+        f"!Series_relation = SRA: https://www.ncbi.nlm.nih.gov/sra?term={srp}",
+        f"!Series_supplementary_file = ftp://ftp.ncbi.nlm.nih.gov/geo/series/"
+        f"{gse[:-3]}nnn/{gse}/suppl/{gse}_RAW.tar",
+        f"!Series_supplementary_file = ftp://ftp.ncbi.nlm.nih.gov/geo/series/"
+        f"{gse[:-3]}nnn/{gse}/suppl/{gse}_counts.txt.gz",
+    ]
+    return "\r\n".join(lines) + "\r\n"
+
+
+def gsm_soft(gse: str, n_samples: int) -> str:
+    """
+    :param gse: GSE accession
+    :param n_samples: number of samples
+    :return: GSM soft file (all samples of the series)
+    """
+    lines = []
+    for n in range(n_samples):
+        gsm = f"GSM{gse[3:]}{n:05d}"
+        url = f"ftp://ftp.ncbi.nlm.nih.gov/geo/samples/{gsm[:-3]}nnn/{gsm}/suppl/{gsm}"
+        lines += [
+            f"^SAMPLE = {gsm}",
+            f"!Sample_title = Sample {n}",
+            f"!Sample_geo_accession = {gsm}",
+            "!Sample_status = Public on Jan 01 2020",
+            f"!Sample_source_name_ch1 = tissue {n % 7}",
+            "!Sample_organism_ch1 = Homo sapiens",
+            f"!Sample_characteristics_ch1 = cell type: type {n % 5}",
+            f"!Sample_characteristics_ch1 = treatment: drug {n % 3}",
+            "!Sample_characteristics_ch1 = age: 5",
+            "!Sample_molecule_ch1 = genomic DNA",
+            "!Sample_extract_protocol_ch1 = " + "Long protocol text. " * 10,
+            "!Sample_data_processing = Genome_build: hg38",
+            "!Sample_library_selection = ChIP",
+            "!Sample_library_strategy = ChIP-Seq",
+            "!Sample_type = SRA",
+            "!Sample_instrument_model = Illumina NovaSeq 6000",
+            f"!Sample_relation = SRA: https://www.ncbi.nlm.nih.gov/sra?term=SRX{10000000 + n}",
+            f"!Sample_supplementary_file_1 = {url}_peaks.bed.gz",
+            f"!Sample_supplementary_file_2 = {url}_signal.bw",
+            "!sample_table_begin",
+            "ID_REF\tVALUE",
+            "a\t1",
+            "!sample_table_end",
+        ]
+    return "\r\n".join(lines) + "\r\n"
+
+
+def filelist(gse: str, n_samples: int) -> str:
+    """
+    :param gse: GSE accession
+    :param n_samples: number of samples
+    :return: filelist.txt of RAW.tar of the series
+    """
+    rows = ["Archive/File\tName\tTime\tSize\tType"]
+    for n in range(n_samples):
+        for suffix in ("peaks.bed.gz", "signal.bw"):
+            rows.append(
+                f"File\tGSM{gse[3:]}{n:05d}_{suffix}\t01/01/2020\t{1000 + n}\t"
+                f"{suffix.split('.')[0].upper()}"
+            )
+    return "\n".join(rows) + "\n"
+
+
+def sra_runs(gse: str, srp: str, n_samples: int) -> list:
+    """
+    :param gse: GSE accession
+    :param srp: SRA project of the series
+    :param n_samples: number of samples
+    :return: list of run info rows of the project
+    """
+    return [
+        {
+            "Run": f"SRR{10000000 + n}",
+            "Experiment": f"SRX{10000000 + n}",
+            "LibraryLayout": "PAIRED" if n % 2 else "SINGLE",
+            "size_MB": str(10 + n % 100),
+            "SRAStudy": srp,
+            "Sample": f"SRS{10000000 + n}",
+        }
+        for n in range(n_samples)
+    ]
+
+
+class SyntheticSeries:
+    """Metadata of one synthetic GEO series and its SRA project"""
+
+    def __init__(self, n_samples: int, gse: str = None):
+        """
+        :param n_samples: number of samples
+        :param gse: GSE accession. Derived from number of samples if not provided
+        """
+        self.gse = gse or f"GSE{900000 + n_samples}"
+        self.srp = f"SRP{self.gse[3:]}"
+        self.n_samples = n_samples
+        self.gse_soft = gse_soft(self.gse, self.srp, n_samples)
+        self.gsm_soft = gsm_soft(self.gse, n_samples)
+        self.filelist = filelist(self.gse, n_samples)
+        self.runs = sra_runs(self.gse, self.srp, n_samples)
+
+    def gse_lines(self) -> list:
+        return self.gse_soft.splitlines()
+
+    def gsm_lines(self) -> list:
+        return self.gsm_soft.splitlines()
+
+
+class NCBIStandIn:
+    """
+    Local HTTP server, that answers the requests geofetch sends to NCBI
+    (GEO acc.cgi, GEO FTP over https, E-utilities esearch/efetch) with
+    metadata of synthetic series. Requests are routed to it by NCBIClient
+    with base_url set to its url
+    """
+
+    def __init__(self, series: list):
+        """
+        :param series: list of SyntheticSeries served
+        """
+        self.series = {s.gse: s for s in series}
+        self.runs = {s.srp: s.runs for s in series}
+        self.requests = 0
+        handler = type("Handler", (_StandInHandler,), {"stand_in": self})
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def respond(self, method: str, path: str, query: dict) -> tuple:
+        """
+        :param method: HTTP method
+        :param path: path of the request
+        :param query: parameters of the request
+        :return: status code and body of the response
+        """
+        self.requests += 1
+        if path.endswith("acc.cgi"):
+            series = self.series.get(query["acc"])
+            if series is None:
+                return 404, ""
+            return 200, series.gse_soft if query["targ"] == "gse" else series.gsm_soft
+        if path.endswith("filelist.txt"):
+            gse = re.findall(r"GSE\d+", path)[-1]
+            return 200, self.series[gse].filelist
+        if path.endswith("soft.gz"):
+            return 200, ""
+        if path.endswith("esearch.fcgi"):
+            projects = [srp for srp in self.runs if srp in query["term"]]
+            count = sum(len(self.runs[srp]) for srp in projects)
+            return 200, json.dumps(
+                {
+                    "esearchresult": {
+                        "count": str(count),
+                        "webenv": ",".join(projects),
+                        "querykey": "1",
+                    }
+                }
+            )
+        if path.endswith("efetch.fcgi"):
+            rows = [
+                row
+                for srp in query["WebEnv"].split(",")
+                for row in self.runs.get(srp, [])
+            ]
+            start = int(query["retstart"])
+            rows = rows[start : start + int(query["retmax"])]
+            return 200, "<SraRunInfo>%s</SraRunInfo>" % "".join(
+                "<Row>%s</Row>" % "".join(f"<{k}>{v}</{k}>" for k, v in row.items())
+                for row in rows
+            )
+        return 404, ""
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _StandInHandler(http.server.BaseHTTPRequestHandler):
+    stand_in = None
+
+    def _respond(self, method: str, query: dict):
+        url = urlparse(self.path)
+        query.update({k: v[-1] for k, v in parse_qs(url.query).items()})
+        status, body = self.stand_in.respond(method, url.path, query)
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if method != "HEAD":
+            self.wfile.write(data)
+
+    def do_GET(self):
+        self._respond("GET", {})
+
+    def do_HEAD(self):
+        self._respond("HEAD", {})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        form = parse_qs(self.rfile.read(length).decode("utf-8"))
+        self._respond("POST", {k: v[-1] for k, v in form.items()})
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="session", params=SCALES, ids=lambda n: f"{n}_samples")
+def series(request) -> SyntheticSeries:
+    return SyntheticSeries(request.param)
+
+
+@pytest.fixture(scope="session")
+def parsed_soft(series) -> tuple:
+    return parse_soft(series.gse_lines()), parse_soft(series.gsm_lines())
+
+
+@pytest.fixture(scope="session")
+def stand_in(series):
+    with NCBIStandIn([series]) as server:
+        yield server
+
+
+@pytest.fixture
+def make_geofetcher(stand_in, tmp_path):
+    """Factory of Geofetchers, that fetch metadata from the stand-in server"""
+
+    def make(**kwargs) -> Geofetcher:
+        return Geofetcher(
+            metadata_folder=str(tmp_path),
+            disable_progressbar=True,
+            # stand-in is not rate limited like E-utilities
+            client=NCBIClient(
+                base_url=stand_in.url, rate_limiter=RateLimiter(rate=1e6, burst=1000)
+            ),
+            **kwargs,
+        )
+
+    return make
@@ -0,0 +1,68 @@
+"""
+Startup time of geofetch CLI and library imports.
+
+Each command is run in a fresh interpreter, and the median wall time of the
+runs is reported, e.g.:
+    python benchmarks/startup.py --runs 20
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+COMMANDS = {
+    "geofetch --help": [sys.executable, "-m", "geofetch", "--help"],
+    "import geofetch": [sys.executable, "-c", "import geofetch"],
+    "from geofetch import Finder": [
+        sys.executable,
+        "-c",
+        "from geofetch import Finder",
+    ],
+    "from geofetch.utils import parse_accessions": [
+        sys.executable,
+        "-c",
+        "from geofetch.utils import parse_accessions",
+    ],
+    "from geofetch import Geofetcher": [
+        sys.executable,
+        "-c",
+        "from geofetch import Geofetcher",
+    ],
+    "python (baseline)": [sys.executable, "-c", "pass"],
+}
+
+
+def time_command(command: list, runs: int) -> list:
+    """
+    :param command: command to run
+    :param runs: number of runs
+    :return: wall times of runs in seconds
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10, help="Runs of each command")
+    args = parser.parse_args()
+
+    # warm up file system and bytecode caches
+    time_command(COMMANDS["import geofetch"], 1)
+    print(f"{'command':<45} {'median [ms]':>12} {'min [ms]':>10}")
+    for name, command in COMMANDS.items():
+        times = time_command(command, args.runs)
+        print(
+            f"{name:<45} {statistics.median(times) * 1000:>12.0f} "
+            f"{min(times) * 1000:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,28 @@
 """Package-level data"""
 
+import importlib
+from typing import TYPE_CHECKING
+
 import coloredlogs
 import logmuse
 
 from geofetch._version import __version__
-from geofetch.finder import Finder
-from geofetch.geofetch import Geofetcher
+
+if TYPE_CHECKING:
+    from geofetch.client import NCBIClient
+    from geofetch.finder import Finder
+    from geofetch.geofetch import Geofetcher
 
 __author__ = ["Oleksandr Khoroshevskyi", "Vince Reuter", "Nathan Sheffield"]
-__all__ = ["Finder", "Geofetcher", "__version__"]
+__all__ = ["Finder", "Geofetcher", "NCBIClient", "__version__"]
+
+# Public classes are imported from their modules on first access, so that
+# e.g. Finder can be used without importing pandas and peppy (Geofetcher)
+_LAZY_ATTRIBUTES = {
+    "Finder": "geofetch.finder",
+    "Geofetcher": "geofetch.geofetch",
+    "NCBIClient": "geofetch.client",
+}
 
 _LOGGER = logmuse.init_logger("geofetch")
 coloredlogs.install(
@@ -16,3 +30,15 @@ coloredlogs.install(
     datefmt="%H:%M:%S",
     fmt="[%(levelname)s] [%(asctime)s] %(message)s",
 )
+
+
+def __getattr__(name: str):
+    if name in _LAZY_ATTRIBUTES:
+        value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list:
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
@@ -1,6 +1,18 @@
 import sys
 
-from geofetch.geofetch import main
+from geofetch.cli import _parse_cmdl
+
+
+def main():
+    """
+    Run the script. Arguments are parsed before geofetch.geofetch (and pandas,
+    peppy) is imported, so --help and --version return quickly
+    """
+    args = _parse_cmdl(sys.argv[1:])
+    from geofetch.geofetch import main as run_geofetch
+
+    return run_geofetch(args)
+
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,272 @@
+"""
+Asyncio interface for fetching GEO and SRA metadata.
+
+Requests are sent with the shared, rate limited NCBIClient. As the client is
+blocking, requests are run in a thread pool, which size is bounded by the
+requested concurrency, so any number of accessions can be awaited from
+one event loop without spawning a thread per accession. PrefetchWindow fetches
+metadata of accessions ahead of blocking code, that processes them in order.
+"""
+
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Executor, Future, InvalidStateError, ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Iterable, Tuple, Union
+
+from geofetch.cache import MetadataCache
+from geofetch.client import NCBIClient, get_default_client
+from geofetch.const import SRA_RUNINFO_PAGE_SIZE
+from geofetch.utils import Accession, fetch_sra_runinfo
+
+_LOGGER = logging.getLogger(__name__)
+
+SRA_TYPENAMES = ("SRA", "SRP", "SRX")
+DEFAULT_MAX_SOFT_SIZE = 1073741824
+
+
+async def fetch_metadata(
+    accession: str,
+    typename: str = None,
+    outpath: str = None,
+    clean: bool = True,
+    max_soft_size: int = DEFAULT_MAX_SOFT_SIZE,
+    client: NCBIClient = None,
+    executor: Executor = None,
+    cache: MetadataCache = None,
+    sra_page_size: int = SRA_RUNINFO_PAGE_SIZE,
+) -> list:
+    """
+    Fetch metadata of one accession.
+
+    :param accession: GSE, SRP or SRX accession
+    :param typename: type of metadata to fetch: GSE or GSM for soft files,
+        SRA for SRA run info. Type is parsed from accession if unspecified
+    :param outpath: path to the file, where soft file should be saved [Optional]
+    :param clean: if true, soft file won't be saved
+    :param max_soft_size: max soft file size in bytes
+    :param client: http client used to send requests. Shared default client is used if unspecified
+    :param executor: executor where blocking requests are run. Default loop executor is used if unspecified
+    :param cache: cache of metadata responses [Optional]
+    :param sra_page_size: number of SRA runs fetched in one efetch request
+    :return: list of lines of soft file, or list of dicts of SRA runs
+    """
+    typename = (typename or accession[:3]).upper()
+    client = client or get_default_client()
+    if typename in SRA_TYPENAMES:
+        func = partial(
+            fetch_sra_runinfo,
+            accession,
+            client=client,
+            cache=cache,
+            page_size=sra_page_size,
+        )
+    else:
+        func = partial(
+            Accession(accession).fetch_metadata,
+            outpath,
+            typename=typename,
+            clean=clean,
+            max_soft_size=max_soft_size,
+            client=client,
+            cache=cache,
+        )
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, func)
+
+
+async def fetch_metadata_many(
+    accessions: Iterable[Union[str, Tuple[str, str]]],
+    typename: str = None,
+    concurrency: int = 10,
+    outpaths: Dict[Union[str, Tuple[str, str]], str] = None,
+    clean: bool = True,
+    max_soft_size: int = DEFAULT_MAX_SOFT_SIZE,
+    client: NCBIClient = None,
+    cache: MetadataCache = None,
+    sra_page_size: int = SRA_RUNINFO_PAGE_SIZE,
+) -> Dict[Union[str, Tuple[str, str]], Union[list, Exception]]:
+    """
+    Fetch metadata of many accessions, with at most `concurrency` requests in flight.
+
+    :param accessions: accessions to fetch. Item can be also an (accession, typename)
+        tuple, to fetch different types of metadata at once
+    :param typename: type of metadata to fetch: GSE, GSM or SRA.
+        Type is parsed from each accession if unspecified
+    :param concurrency: max number of accessions fetched at the same time
+    :param outpaths: dict of accessions and paths, where their soft files should be saved [Optional]
+    :param clean: if true, soft files won't be saved
+    :param max_soft_size: max soft file size in bytes
+    :param client: http client used to send requests. Shared default client is used if unspecified
+    :param cache: cache of metadata responses [Optional]
+    :param sra_page_size: number of SRA runs fetched in one efetch request
+    :return: dict of accessions and their metadata. If metadata of accession couldn't be
+        fetched, value is the exception that was raised
+    """
+    accessions = list(accessions)
+    outpaths = outpaths or {}
+    semaphore = asyncio.Semaphore(concurrency)
+    # executor is not used as a context manager: its exit would wait for
+    # running requests and block the event loop, if fetching is cancelled
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    async def fetch_one(item: Union[str, Tuple[str, str]]) -> list:
+        accession, item_typename = item if isinstance(item, tuple) else (item, typename)
+        async with semaphore:
+            return await fetch_metadata(
+                accession,
+                typename=item_typename,
+                outpath=outpaths.get(item),
+                clean=clean,
+                max_soft_size=max_soft_size,
+                client=client,
+                executor=executor,
+                cache=cache,
+                sra_page_size=sra_page_size,
+            )
+
+    try:
+        results = await asyncio.gather(
+            *(fetch_one(item) for item in accessions),
+            return_exceptions=True,
+        )
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    for item, result in zip(accessions, results):
+        if isinstance(result, Exception):
+            _LOGGER.warning(f"Couldn't fetch metadata of {item}: {result}")
+    return dict(zip(accessions, results))
+
+
+def _resolve(future: Future, result: Union[list, None]) -> None:
+    """
+    Set result of the future, unless it is already set
+
+    :param future: future to resolve
+    :param result: result of the future
+    """
+    try:
+        future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+class PrefetchWindow:
+    """
+    Metadata of accessions, fetched ahead of a blocking consumer (e.g. code run
+    in a worker thread), which takes it in the same order. Fetching runs at most
+    `size` accessions ahead of the furthest accession taken by the consumer, and
+    metadata is released as soon as it is taken, so memory is bounded by `size`
+    accessions, not by the number of all accessions.
+    """
+
+    def __init__(self, items: Iterable[Tuple[str, str]], size: int = 10):
+        """
+        :param items: (accession, typename) tuples, in the order in which they are taken
+        :param size: max number of accessions fetched ahead of the consumer
+        """
+        self.size = max(1, size)
+        self._futures = {}
+        self._positions = {}
+        for item in items:
+            self._positions.setdefault(item[0], len(self._positions))
+            self._futures[item] = Future()
+        # items, that are not being fetched yet
+        self._pending = deque(self._futures.items())
+        # position of the furthest accession taken by the consumer
+        self._taken = -1
+        self._lock = threading.Lock()
+        self._loop = None
+        self._advanced = None
+
+    async def run(self, outpaths: Dict[Tuple[str, str], str] = None, **kwargs) -> None:
+        """
+        Fetch metadata of items, in the order of items, with at most `size`
+        accessions fetched at the same time. Should be cancelled, if the consumer
+        stops taking metadata before all items are fetched.
+
+        :param outpaths: dict of items and paths, where their soft files should be saved [Optional]
+        :param kwargs: other arguments of fetch_metadata, e.g. client, cache or clean
+        """
+        outpaths = outpaths or {}
+        self._advanced = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=self.size)
+        # futures of items, that are being fetched
+        fetching = {}
+
+        async def fetch_one(item: Tuple[str, str], future: Future) -> None:
+            try:
+                result = await fetch_metadata(
+                    item[0],
+                    typename=item[1],
+                    outpath=outpaths.get(item),
+                    executor=executor,
+                    **kwargs,
+                )
+            except Exception as err:
+                _LOGGER.warning(f"Couldn't fetch metadata of {item}: {err}")
+                result = None
+            _resolve(future, result)
+
+        try:
+            while self._pending:
+                item, future = self._pending[0]
+                if self._positions[item[0]] > self._taken + self.size:
+                    self._advanced.clear()
+                    # consumer may have advanced, before the event was cleared
+                    if self._positions[item[0]] > self._taken + self.size:
+                        await self._advanced.wait()
+                    continue
+                self._pending.popleft()
+                task = asyncio.ensure_future(fetch_one(item, future))
+                fetching[task] = future
+                task.add_done_callback(fetching.pop)
+            if fetching:
+                await asyncio.gather(*fetching)
+        finally:
+            with self._lock:
+                self._loop = None
+            for task in fetching:
+                task.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+            # consumer shouldn't wait for metadata, that won't be fetched anymore;
+            # metadata that was fetched can still be taken, until window is closed
+            for future in [*fetching.values(), *(f for _, f in self._pending)]:
+                _resolve(future, None)
+            self._pending.clear()
+
+    def take(self, accession: str, typename: str) -> Union[list, None]:
+        """
+        Take metadata of accession, waiting until it is fetched. Metadata can be taken once.
+
+        :param accession: GSE accession
+        :param typename: type of metadata, e.g. GSE or GSM
+        :return: metadata, or None if it isn't fetched by this window or couldn't be fetched
+        """
+        with self._lock:
+            future = self._futures.pop((accession, typename), None)
+            if future is None:
+                return None
+            if self._positions[accession] > self._taken:
+                self._taken = self._positions[accession]
+                if self._loop is not None:
+                    self._loop.call_soon_threadsafe(self._advanced.set)
+        return future.result()
+
+    def close(self) -> None:
+        """
+        Release metadata, that wasn't taken. Consumer waiting for metadata, that
+        won't be fetched anymore, gets None.
+        """
+        with self._lock:
+            futures = list(self._futures.values())
+            self._futures.clear()
+        for _, future in self._pending:
+            _resolve(future, None)
+        self._pending.clear()
+        for future in futures:
+            _resolve(future, None)
@@ -0,0 +1,400 @@
+"""Persistent on-disk cache of GEO and SRA metadata responses."""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterable, Iterator, NamedTuple, Union
+
+from geofetch.client import NCBIClient, get_default_client
+from geofetch.const import CACHE_BODIES_DIR, CACHE_DB_NAME, SOFT_CHUNK_SIZE
+
+_LOGGER = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    accession TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched REAL NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (accession, endpoint)
+)
+"""
+
+
+class CacheEntry(NamedTuple):
+    """Cached response. Body of the response is stored in a file"""
+
+    path: str
+    etag: Union[str, None]
+    last_modified: Union[str, None]
+    # time (unix timestamp) when the response was fetched or last revalidated
+    fetched: float
+
+    @property
+    def body(self) -> str:
+        """Text of the response"""
+        with open(self.path, "r", encoding="utf-8", newline="") as f:
+            return f.read()
+
+    def iter_chunks(self, chunk_size: int = SOFT_CHUNK_SIZE) -> Iterator[str]:
+        """
+        :param chunk_size: max number of characters in one chunk
+        :return: iterator of text chunks of the response
+        """
+        with open(self.path, "r", encoding="utf-8", newline="") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+
+class MetadataCache:
+    """
+    Cache of metadata responses (SOFT files, SRA run info, filelists), keyed by
+    accession and endpoint (e.g. GSE, GSM, sra_runinfo). Bodies of responses are
+    stored in files, so they can be streamed in and out of the cache, and their
+    headers and times of use in SQLite database.
+
+    Entries younger than ttl are used without any request. Older entries are
+    revalidated with ETag/Last-Modified headers, if server provided them, and
+    refetched otherwise. When the cache grows over max_size, least recently
+    used entries are evicted.
+
+    Lookups are counted in stats: hits (fresh entries), revalidated (stale entries
+    confirmed by the server) and misses.
+    """
+
+    def __init__(self, cache_dir: str, ttl: float = 86400, max_size: int = None):
+        """
+        :param cache_dir: directory where cache database and response bodies are stored
+        :param ttl: time (in seconds) after which entries have to be revalidated
+        :param max_size: max size of cached responses in bytes. Unlimited if not provided
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, CACHE_DB_NAME)
+        self.bodies_dir = os.path.join(cache_dir, CACHE_BODIES_DIR)
+        os.makedirs(self.bodies_dir, exist_ok=True)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """
+        Open connection to the database, commit the transaction on exit.
+        New connection is opened on every call, so cache can be used from
+        many threads and processes at once.
+        """
+        conn = sqlite3.connect(self.path, timeout=60)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _body_path(self, accession: str, endpoint: str) -> str:
+        """
+        :param accession: accession of the response
+        :param endpoint: endpoint (type of metadata) of the response
+        :return: path of the file with body of the response
+        """
+        key = hashlib.sha256(f"{endpoint}/{accession}".encode("utf-8")).hexdigest()
+        return os.path.join(self.bodies_dir, key)
+
+    def get(self, accession: str, endpoint: str) -> Union[CacheEntry, None]:
+        """
+        Get cached response, no matter if it is fresh or not
+
+        :param accession: accession of the response
+        :param endpoint: endpoint (type of metadata) of the response
+        :return: cached entry or None if it is not cached
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT etag, last_modified, fetched FROM entries "
+                "WHERE accession = ? AND endpoint = ?",
+                (accession, endpoint),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE entries SET accessed = ? WHERE accession = ? AND endpoint = ?",
+                (time.time(), accession, endpoint),
+            )
+        path = self._body_path(accession, endpoint)
+        if not os.path.isfile(path):
+            return None
+        return CacheEntry(path, *row)
+
+    def is_fresh(self, entry: Union[CacheEntry, None]) -> bool:
+        """
+        :param entry: cached entry
+        :return: True if entry exists and can be used without revalidation
+        """
+        return entry is not None and time.time() - entry.fetched < self.ttl
+
+    def lookup(self, accession: str, endpoint: str) -> Union[CacheEntry, None]:
+        """
+        Get cached response, if it is fresh. Lookup is counted as hit or miss
+
+        :param accession: accession of the response
+        :param endpoint: endpoint (type of metadata) of the response
+        :return: fresh cached entry or None
+        """
+        entry = self.get(accession, endpoint)
+        if self.is_fresh(entry):
+            self._count("hits")
+            return entry
+        self._count("misses")
+        return None
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def put(
+        self,
+        accession: str,
+        endpoint: str,
+        body: str,
+        etag: str = None,
+        last_modified: str = None,
+    ) -> None:
+        """
+        Save response in the cache, evicting old entries if cache is too large
+
+        :param accession: accession of the response
+        :param endpoint: endpoint (type of metadata) of the response
+        :param body: text of the response
+        :param etag: ETag header of the response [Optional]
+        :param last_modified: Last-Modified header of the response [Optional]
+        """
+        for _ in self.put_stream(accession, endpoint, [body], etag, last_modified):
+            pass
+
+    def put_stream(
+        self,
+        accession: str,
+        endpoint: str,
+        chunks: Iterable[str],
+        etag: str = None,
+        last_modified: str = None,
+    ) -> Iterator[str]:
+        """
+        Save response in the cache, while its text chunks are passed on. Response is
+        saved only once all chunks were consumed, so incomplete responses are never cached.
+
+        :param accession: accession of the response
+        :param endpoint: endpoint (type of metadata) of the response
+        :param chunks: iterable of text chunks of the response
+        :param etag: ETag header of the response [Optional]
+        :param last_modified: Last-Modified header of the response [Optional]
+        :return: iterator of the same chunks
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.bodies_dir, suffix=".tmp")
+        completed = False
+        try:
+            with open(fd, "w", encoding="utf-8", newline="") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, self._body_path(accession, endpoint))
+            completed = True
+        finally:
+            if not completed and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (accession, endpoint, size, etag, last_modified, now, now),
+            )
+        self.evict()
+
+    def touch(self, accession: str, endpoint: str) -> None:
+        """
+        Mark entry as revalidated now
+
+        :param accession: accession of the response
+        :param endpoint: endpoint (type of metadata) of the response
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE entries SET fetched = ?, accessed = ? "
+                "WHERE accession = ? AND endpoint = ?",
+                (now, now, accession, endpoint),
+            )
+
+    @property
+    def size(self) -> int:
+        """Size of all cached responses in bytes"""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()[0]
+
+    def evict(self) -> None:
+        """
+        Remove least recently used entries until cache fits in max_size
+        """
+        if self.max_size is None:
+            return
+        with self._connect() as conn:
+            total = conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()[0]
+            if total <= self.max_size:
+                return
+            rows = conn.execute(
+                "SELECT accession, endpoint, size FROM entries ORDER BY accessed"
+            ).fetchall()
+            for accession, endpoint, size in rows:
+                if total <= self.max_size:
+                    break
+                _LOGGER.debug(f"Evicting {accession} ({endpoint}) from metadata cache")
+                conn.execute(
+                    "DELETE FROM entries WHERE accession = ? AND endpoint = ?",
+                    (accession, endpoint),
+                )
+                self._remove_body(accession, endpoint)
+                total -= size
+
+    def clear(self) -> None:
+        """Remove all entries from the cache"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT accession, endpoint FROM entries").fetchall()
+            conn.execute("DELETE FROM entries")
+        for accession, endpoint in rows:
+            self._remove_body(accession, endpoint)
+
+    def _remove_body(self, accession: str, endpoint: str) -> None:
+        try:
+            os.remove(self._body_path(accession, endpoint))
+        except FileNotFoundError:
+            pass
+
+    def fetch(
+        self,
+        url: str,
+        accession: str,
+        endpoint: str,
+        client: NCBIClient = None,
+        **kwargs,
+    ) -> str:
+        """
+        Get text of the response from the cache, or request it (GET) if it is missing or stale.
+        Stale entries are revalidated with conditional request, if possible.
+
+        :param url: url of the resource
+        :param accession: accession of the response
+        :param endpoint: endpoint (type of metadata) of the response
+        :param client: http client used to send requests.
+            Shared default client is used if unspecified
+        :param kwargs: other arguments passed to client.get
+        :return: text of the response
+        """
+        return "".join(self.stream(url, accession, endpoint, client=client, **kwargs))
+
+    def stream(
+        self,
+        url: str,
+        accession: str,
+        endpoint: str,
+        client: NCBIClient = None,
+        **kwargs,
+    ) -> Iterator[str]:
+        """
+        Stream text chunks of the response, see stream_entry
+
+        :param url: url of the resource
+        :param accession: accession of the response
+        :param endpoint: endpoint (type of metadata) of the response
+        :param client: http client used to send requests.
+            Shared default client is used if unspecified
+        :param kwargs: other arguments passed to client.get
+        :return: iterator of text chunks of the response
+        """
+        entry = self.get(accession, endpoint)
+        return self.stream_entry(
+            url, accession, endpoint, entry, client=client, **kwargs
+        )
+
+    def stream_entry(
+        self,
+        url: str,
+        accession: str,
+        endpoint: str,
+        entry: Union[CacheEntry, None],
+        client: NCBIClient = None,
+        chunk_size: int = SOFT_CHUNK_SIZE,
+        **kwargs,
+    ) -> Iterator[str]:
+        """
+        Stream text chunks of the response from the cache, or request it (GET) if it is
+        missing or stale. Stale entries are revalidated with conditional request, if possible.
+        Requested response is saved in the cache while it is streamed, so it is never
+        held in memory as a whole.
+
+        :param url: url of the resource
+        :param accession: accession of the response
+        :param endpoint: endpoint (type of metadata) of the response
+        :param entry: cached entry of the response, as returned by get
+        :param client: http client used to send requests.
+            Shared default client is used if unspecified
+        :param chunk_size: max number of characters in one chunk
+        :param kwargs: other arguments passed to client.get
+        :return: iterator of text chunks of the response
+        """
+        if self.is_fresh(entry):
+            _LOGGER.debug(f"Using cached {endpoint} metadata of {accession}")
+            self._count("hits")
+            yield from entry.iter_chunks(chunk_size)
+            return
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        client = client or get_default_client()
+        response = client.get(url, headers=headers, stream=True, **kwargs)
+        try:
+            if response.status_code == 304 and entry is not None:
+                _LOGGER.debug(
+                    f"Cached {endpoint} metadata of {accession} is up to date"
+                )
+                self.touch(accession, endpoint)
+                self._count("revalidated")
+                yield from entry.iter_chunks(chunk_size)
+                return
+            self._count("misses")
+            if not response.ok:
+                raise Exception(f"Error in requesting file: {url}")
+
+            response.encoding = "UTF-8"
+            yield from self.put_stream(
+                accession,
+                endpoint,
+                response.iter_content(chunk_size=chunk_size, decode_unicode=True),
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+            )
+        finally:
+            response.close()
@@ -5,6 +5,27 @@ import logmuse
 from ubiquerg import VersionInHelpParser
 
 from geofetch._version import __version__
+from geofetch.const import (
+    CACHE_MAX_SIZE,
+    CACHE_TTL,
+    CONVERT_JOBS,
+    DOWNLOAD_PER_HOST,
+    DOWNLOAD_WORKERS,
+    FINDER_PAGE_SIZE,
+    HTTP_POOL_SIZE,
+    HTTP_READ_TIMEOUT,
+    MOCK_ERROR_STATUS,
+    NCBI_API_KEY_ENV,
+    OUTPUT_FORMATS,
+    PREFETCH_JOBS,
+    PROFILE_TOP_N,
+    PROFILERS,
+    PROMETHEUS_SUFFIX,
+    RETMAX,
+    SRA_BATCH_SIZE,
+    SRA_RUNINFO_MAX_PAGE_SIZE,
+    SRA_RUNINFO_PAGE_SIZE,
+)
 
 
 def _safe_echo(var):
@@ -158,6 +179,32 @@ To download all processed data of GSE57303:
         help="Optional: Add .pep.yaml file that points .yaml PEP file",
     )
 
+    parser.add_argument(
+        "--output-format",
+        choices=OUTPUT_FORMATS,
+        default="csv",
+        help="Optional: Format of sample and subsample tables. Parquet tables are "
+        "typed and compressed, and require pyarrow. They are written next to csv "
+        "tables, which are referenced by the PEP [Default: csv]",
+    )
+
+    parser.add_argument(
+        "--sra-page-size",
+        type=int,
+        default=SRA_RUNINFO_PAGE_SIZE,
+        help="Optional: Number of SRA runs fetched in one E-utilities request "
+        f"(1-{SRA_RUNINFO_MAX_PAGE_SIZE}). All runs of the project are fetched, in "
+        f"as many requests as needed [Default: {SRA_RUNINFO_PAGE_SIZE}]",
+    )
+
+    parser.add_argument(
+        "--sra-batch-size",
+        type=int,
+        default=SRA_BATCH_SIZE,
+        help="Optional: Number of SRA projects searched in one E-utilities request, "
+        f"when raw data of many accessions is processed [Default: {SRA_BATCH_SIZE}]",
+    )
+
     parser.add_argument(
         "--max-soft-size",
         type=str,
@@ -173,6 +220,148 @@ To download all processed data of GSE57303:
         "for reference: https://github.com/ncbi/sra-tools/wiki/08.-prefetch-and-fasterq-dump#check-the-maximum-size-limit-of-the-prefetch-tool",
     )
 
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Optional: Number of accessions, which metadata is fetched and parsed "
+        "concurrently. Output is identical to the serial run. [Default: 1]",
+    )
+
+    parser.add_argument(
+        "--http-pool-size",
+        type=int,
+        default=HTTP_POOL_SIZE,
+        help="Optional: Number of keep-alive connections kept open to each NCBI host. "
+        f"[Default: {HTTP_POOL_SIZE}]",
+    )
+
+    parser.add_argument(
+        "--http-timeout",
+        type=float,
+        default=HTTP_READ_TIMEOUT,
+        help="Optional: Read timeout of requests sent to NCBI, in seconds. "
+        f"[Default: {HTTP_READ_TIMEOUT}]",
+    )
+
+    parser.add_argument(
+        "--api-key",
+        default=_safe_echo(NCBI_API_KEY_ENV) or None,
+        help="Optional: NCBI API key. Raises E-utilities rate limit from 3 to 10 "
+        f"requests per second. [Default: ${NCBI_API_KEY_ENV}]",
+    )
+
+    parser.add_argument(
+        "--rate-limit-lock",
+        default=None,
+        help="Optional: Path to the lock file used to share E-utilities rate limit "
+        "between geofetch processes running at the same time.",
+    )
+
+    parser.add_argument(
+        "--ncbi-base-url",
+        default=_safe_echo("GEOFETCH_NCBI_BASE_URL") or None,
+        help="Optional: Url of the server, where requests to NCBI are sent instead, "
+        "e.g. local mock server started with 'python -m geofetch.mockserver' "
+        "[Default: $GEOFETCH_NCBI_BASE_URL]",
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Optional: Directory of persistent metadata cache. Soft files, SRA run info "
+        "and filelists are cached there, so re-runs skip accessions that didn't change.",
+    )
+
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=CACHE_TTL,
+        help="Optional: Time (in hours) after which cached metadata is revalidated "
+        f"with GEO/SRA. Ignored if --refresh-metadata is set. [Default: {CACHE_TTL}]",
+    )
+
+    parser.add_argument(
+        "--cache-max-size",
+        default=CACHE_MAX_SIZE,
+        help="Optional: Max size of metadata cache, least recently used entries are "
+        "evicted. Supported input formats : 12B, 12KB, 12MB, 12GB. "
+        f"[Default: {CACHE_MAX_SIZE}]",
+    )
+
+    parser.add_argument(
+        "--run-report",
+        default=None,
+        help="Optional: Save report of the run to this file: time spent in each stage "
+        "of each accession, HTTP requests, retries, received bytes and cache hits. "
+        f"Saved in Prometheus text format if file ends with {PROMETHEUS_SUFFIX}, "
+        "as JSON otherwise.",
+    )
+
+    parser.add_argument(
+        "--profile",
+        choices=PROFILERS,
+        default=None,
+        help="Optional: Profile the run. Profile is saved together with a summary of "
+        "top hot functions (or allocating lines, for tracemalloc) and peak memory. "
+        "pyinstrument has to be installed.",
+    )
+
+    parser.add_argument(
+        "--profile-dir",
+        default=None,
+        help="Optional: Directory where profiles are saved "
+        "[Default: metadata folder]",
+    )
+
+    parser.add_argument(
+        "--profile-top",
+        type=int,
+        default=PROFILE_TOP_N,
+        help="Optional: Number of hot functions listed in the profile summary "
+        f"[Default: {PROFILE_TOP_N}]",
+    )
+
+    parser.add_argument(
+        "--download-workers",
+        type=int,
+        default=DOWNLOAD_WORKERS,
+        help="Optional: Number of processed files downloaded at the same time. "
+        f"[Default: {DOWNLOAD_WORKERS}]",
+    )
+
+    parser.add_argument(
+        "--download-per-host",
+        type=int,
+        default=DOWNLOAD_PER_HOST,
+        help="Optional: Max number of processed files downloaded at the same time "
+        f"from one host. [Default: {DOWNLOAD_PER_HOST}]",
+    )
+
+    parser.add_argument(
+        "--prefetch-jobs",
+        type=int,
+        default=PREFETCH_JOBS,
+        help="Optional: Number of prefetch processes (SRA runs downloaded) "
+        f"run at the same time. [Default: {PREFETCH_JOBS}]",
+    )
+
+    parser.add_argument(
+        "--prefetch-budget",
+        type=float,
+        default=None,
+        help="Optional: Max total size (in MB, from SRA run info) of runs downloaded "
+        "at the same time. [Default: unlimited]",
+    )
+
+    parser.add_argument(
+        "--convert-jobs",
+        type=int,
+        default=CONVERT_JOBS,
+        help="Optional: Number of runs converted to bam at the same time. Runs are "
+        f"converted while next runs are downloaded. [Default: {CONVERT_JOBS}]",
+    )
+
     processed_group.add_argument(
         "-p",
         "--processed",
@@ -292,3 +481,167 @@ To download all processed data of GSE57303:
 
     logmuse.add_logging_options(parser)
     return parser.parse_args(cmdl)
+
+
+def _parse_finder_cmdl(cmdl):
+    """
+    parser of incremental sync of gse accessions
+    """
+    parser = VersionInHelpParser(
+        description="Incremental sync of GEO (GSE) accessions",
+        usage="""geofinder -s <state_file> [<args>]
+
+The example how to list gse accessions published since the last sync:
+    geofinder -s gse_state.json --start-date 2024/01/01 -o new_gse.txt
+
+""",
+        version=__version__,
+    )
+
+    parser.add_argument(
+        "-s",
+        "--state-file",
+        dest="state_file",
+        required=True,
+        help="required: a file, where the watermark (date of the last successful "
+        "sync) and known gse accessions are kept. It is created in the first sync",
+    )
+
+    parser.add_argument(
+        "--start-date",
+        dest="start_date",
+        default=None,
+        help="Optional: The oldest publication date searched in the first sync "
+        "[format: YYYY/MM/DD]. All gse accessions are searched if not provided",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--filters",
+        default=None,
+        help="Optional: Filters added to the query, e.g. "
+        "'\"homo sapiens\"[Organism]'. State file has to be used with the same filters",
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        help="Optional: A file, where found gse accessions should be saved. "
+        "Accessions are printed if not provided",
+    )
+
+    parser.add_argument(
+        "--reseen",
+        action="store_true",
+        help="Optional: Output also known gse accessions found again (e.g. "
+        "published on the day of the last sync), not only new ones",
+    )
+
+    parser.add_argument(
+        "--page-size",
+        dest="page_size",
+        type=int,
+        default=FINDER_PAGE_SIZE,
+        help="Optional: Number of accessions fetched in one E-utilities request "
+        f"[Default: {FINDER_PAGE_SIZE}]",
+    )
+
+    parser.add_argument(
+        "--retmax",
+        type=int,
+        default=RETMAX,
+        help="Optional: Max number of accessions found in one sync. Sync fails, "
+        f"if more accessions were found [Default: {RETMAX}]",
+    )
+
+    logmuse.add_logging_options(parser)
+    return parser.parse_args(cmdl)
+
+
+def _parse_mockserver_cmdl(cmdl):
+    """
+    parser of local mock server of NCBI
+    """
+    parser = VersionInHelpParser(
+        description="Local mock server of NCBI, that records and replays responses",
+        usage="""python -m geofetch.mockserver <recordings> [<args>]
+
+The example how to record responses of NCBI, and then replay them offline:
+    python -m geofetch.mockserver recordings --record
+    geofetch -i GSE67303 --just-metadata --ncbi-base-url http://127.0.0.1:8765
+    python -m geofetch.mockserver recordings --latency 0.2 --error-rate 0.1
+
+""",
+        version=__version__,
+    )
+
+    parser.add_argument(
+        "recordings",
+        help="required: a directory of recorded responses",
+    )
+
+    parser.add_argument(
+        "--record",
+        action="store_true",
+        help="Optional: Forward requests that were not recorded yet to NCBI, "
+        "and record responses. By default, only recorded responses are served",
+    )
+
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Optional: Address the server listens on [Default: 127.0.0.1]",
+    )
+
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8765,
+        help="Optional: Port the server listens on [Default: 8765]",
+    )
+
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Optional: Delay (in seconds) added to every response [Default: 0]",
+    )
+
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0.0,
+        help="Optional: Max random delay (in seconds) added to latency [Default: 0]",
+    )
+
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Optional: Fraction of requests (0-1) answered with an error [Default: 0]",
+    )
+
+    parser.add_argument(
+        "--error-status",
+        type=int,
+        default=MOCK_ERROR_STATUS,
+        help="Optional: Status code of injected errors, e.g. 503 or 429 "
+        f"[Default: {MOCK_ERROR_STATUS}]",
+    )
+
+    parser.add_argument(
+        "--retry-after",
+        type=float,
+        default=None,
+        help="Optional: Value of Retry-After header of injected errors",
+    )
+
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Optional: Seed of random latency and errors, for reproducible runs",
+    )
+
+    return parser.parse_args(cmdl)
@@ -0,0 +1,225 @@
+"""Shared, connection-pooled HTTP client for all requests sent to NCBI."""
+
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Tuple, Union
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from geofetch.const import (
+    EUTILS_HOST,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_POOL_SIZE,
+    HTTP_READ_TIMEOUT,
+    NCBI_API_KEY_ENV,
+    NCBI_BASE_URL_ENV,
+    NCBI_HOSTS,
+    NCBI_RATE_LIMIT,
+    NCBI_RATE_LIMIT_API_KEY,
+    NUM_RETRIES,
+)
+from geofetch.ratelimit import RateLimiter
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class NCBIClient:
+    """
+    HTTP client that keeps connections to NCBI alive between requests.
+
+    One instance should be shared by every component that talks to NCBI
+    (GEO SOFT files, E-utilities, GEO FTP over https), so that the TCP and TLS
+    handshake is paid once per host instead of once per request.
+
+    Requests to E-utilities are throttled to the rate permitted by NCBI
+    (3 requests/s, or 10 requests/s with an API key), and NCBI API key is
+    added to them, if provided.
+
+    Requests to NCBI hosts can be sent to another server (base_url), e.g. to
+    local mock server, that serves recorded responses.
+
+    Sent requests, retries, error responses and received bytes (Content-Length
+    of responses) are counted in stats.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = HTTP_POOL_SIZE,
+        timeout: Union[float, Tuple[float, float]] = (
+            HTTP_CONNECT_TIMEOUT,
+            HTTP_READ_TIMEOUT,
+        ),
+        session: requests.Session = None,
+        api_key: str = None,
+        rate_limit_lock: str = None,
+        rate_limiter: RateLimiter = None,
+        base_url: str = None,
+    ):
+        """
+        :param pool_size: maximum number of connections kept alive per host
+        :param timeout: default timeout for requests, in seconds. Either one value
+            or a (connect, read) tuple
+        :param session: use this session instead of creating a new one [Optional]
+        :param api_key: NCBI API key. If not provided, $NCBI_API_KEY is used [Optional]
+        :param rate_limit_lock: path to the lock file used to share E-utilities
+            rate limit between geofetch processes [Optional]
+        :param rate_limiter: use this rate limiter for E-utilities requests,
+            instead of the one shared by all clients with the same settings [Optional]
+        :param base_url: url of the server, where requests to NCBI hosts are sent instead,
+            with the host as the first segment of the path (e.g. http://127.0.0.1:8765).
+            If not provided, $GEOFETCH_NCBI_BASE_URL is used [Optional]
+        """
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.session = session or self._create_session(pool_size)
+        self.api_key = api_key or os.getenv(NCBI_API_KEY_ENV) or None
+        self.rate_limiter = rate_limiter or RateLimiter.shared(
+            NCBI_RATE_LIMIT_API_KEY if self.api_key else NCBI_RATE_LIMIT,
+            lock_file=rate_limit_lock,
+        )
+        self.base_url = (base_url or os.getenv(NCBI_BASE_URL_ENV) or "").rstrip("/")
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def _create_session(pool_size: int) -> requests.Session:
+        """
+        Create requests session with keep-alive connection pool
+
+        :param pool_size: maximum number of connections kept alive per host
+        :return: requests session
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Send request using pooled session. Requests to E-utilities are rate limited,
+        and retried if NCBI responds with 429 (Too Many Requests).
+
+        :param method: HTTP method (e.g. 'GET')
+        :param url: url of the request
+        :param kwargs: other arguments passed to requests.Session.request
+        :return: response object
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        is_eutils = urlparse(url).hostname == EUTILS_HOST
+        if is_eutils and self.api_key:
+            kwargs["params"] = {**(kwargs.get("params") or {}), "api_key": self.api_key}
+        url = self.routed_url(url)
+
+        ntry = 0
+        while True:
+            if is_eutils:
+                self.rate_limiter.acquire()
+            _LOGGER.debug(f"{method} {url}")
+            response = self.session.request(method, url, **kwargs)
+            self._count_response(response, kwargs.get("stream", False))
+            if response.status_code != 429 or ntry >= NUM_RETRIES:
+                return response
+            ntry += 1
+            self._count("retries")
+            sleeptime = self._retry_after(response, default=ntry)
+            _LOGGER.info(
+                f"Too many requests to NCBI, retrying in {sleeptime}s ({ntry}/{NUM_RETRIES})"
+            )
+            response.close()
+            time.sleep(sleeptime)
+
+    def _count(self, name: str, value: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[name] += value
+
+    def _count_response(self, response: requests.Response, stream: bool) -> None:
+        """
+        Count request, its error status and bytes of the response
+
+        :param response: received response
+        :param stream: whether response body is streamed (not read yet)
+        """
+        length = response.headers.get("Content-Length")
+        if length is not None and length.isdigit():
+            received = int(length)
+        else:
+            received = 0 if stream else len(response.content)
+        with self._stats_lock:
+            self.stats["requests"] += 1
+            self.stats["bytes"] += received
+            if response.status_code >= 400:
+                self.stats["errors"] += 1
+
+    def routed_url(self, url: str) -> str:
+        """
+        Get url, where request to the url is actually sent
+
+        :param url: url of the request
+        :return: url on the base_url server for urls of NCBI hosts, if base_url is set.
+            Otherwise, unchanged url
+        """
+        parsed = urlparse(url)
+        if (
+            not self.base_url
+            or parsed.scheme not in ("http", "https")
+            or parsed.hostname not in NCBI_HOSTS
+        ):
+            return url
+        query = f"?{parsed.query}" if parsed.query else ""
+        return f"{self.base_url}/{parsed.hostname}{parsed.path}{query}"
+
+    @staticmethod
+    def _retry_after(response: requests.Response, default: float) -> float:
+        """
+        Get number of seconds to wait from Retry-After header
+
+        :param response: response with 429 status code
+        :param default: value to use if header is missing or is not a number
+        :return: number of seconds to wait
+        """
+        try:
+            return float(response.headers["Retry-After"])
+        except (KeyError, ValueError):
+            return default
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def head(self, url: str, **kwargs) -> requests.Response:
+        return self.request("HEAD", url, **kwargs)
+
+    def close(self):
+        """Close all pooled connections"""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+_DEFAULT_CLIENT = None
+_DEFAULT_CLIENT_LOCK = threading.Lock()
+
+
+def get_default_client() -> NCBIClient:
+    """
+    Get process-wide client, that is used when no client was provided explicitly
+
+    :return: shared NCBIClient instance
+    """
+    global _DEFAULT_CLIENT
+    with _DEFAULT_CLIENT_LOCK:
+        if _DEFAULT_CLIENT is None:
+            _DEFAULT_CLIENT = NCBIClient()
+        return _DEFAULT_CLIENT
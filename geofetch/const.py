@@ -35,12 +35,83 @@ EXP_SUPP_METADATA_FILE = "_series.csv"
 FILE_RAW_NAME_SAMPLE_PATTERN = "_raw.csv"
 FILE_RAW_NAME_SUBSAMPLE_PATTERN = "_raw_subtable.csv"
 
+# Formats of sample and subsample tables. Parquet output requires pyarrow
+OUTPUT_FORMATS = ("csv", "parquet")
+PARQUET_SUFFIX = ".parquet"
+PARQUET_COMPRESSION = "zstd"
+# Profilers of geofetch runs (--profile), and number of hot functions listed in summary
+PROFILERS = ("cprofile", "pyinstrument", "tracemalloc")
+PROFILE_TOP_N = 20
+# Run reports are saved as JSON, or in Prometheus text format if file has this extension
+PROMETHEUS_SUFFIX = ".prom"
+
 # How many times should we retry failing prefetch call?
 NUM_RETRIES = 3
+# Prefetch scheduler: number of prefetch processes run at the same time,
+# base delay (seconds) of exponential backoff between retries of failed run
+# and interval (seconds) in which running processes are polled
+PREFETCH_JOBS = 2
+PREFETCH_BACKOFF = 2
+PREFETCH_POLL_INTERVAL = 0.5
+# Number of downloaded runs converted (sam-dump/fasterq-dump) at the same time
+CONVERT_JOBS = 1
 REQUEST_SLEEP = 0.4
 
-NCBI_ESEARCH = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=sra&term={SRP_NUMBER}&retmax=999&rettype=uilist&retmode=json"
-NCBI_EFETCH = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=sra&id={ID}&rettype=runinfo&retmode=xml"
+# Size of chunks (in bytes) in which soft files are streamed from GEO
+SOFT_CHUNK_SIZE = 1048576
+
+# HTTP client: number of keep-alive connections per host and timeouts (seconds)
+HTTP_POOL_SIZE = 10
+HTTP_CONNECT_TIMEOUT = 10
+HTTP_READ_TIMEOUT = 120
+
+# NCBI E-utilities rate limits (requests per second), without and with API key
+# more info: https://www.ncbi.nlm.nih.gov/books/NBK25497/#chapter2.Usage_Guidelines_and_Requiremen
+EUTILS_HOST = "eutils.ncbi.nlm.nih.gov"
+NCBI_RATE_LIMIT = 3
+NCBI_RATE_LIMIT_API_KEY = 10
+NCBI_API_KEY_ENV = "NCBI_API_KEY"
+
+# Requests to NCBI hosts can be sent to another server (e.g. local mock server,
+# see geofetch.mockserver), with the host as the first segment of the path:
+# https://eutils.ncbi.nlm.nih.gov/entrez/... -> {base_url}/eutils.ncbi.nlm.nih.gov/entrez/...
+NCBI_HOSTS = ("www.ncbi.nlm.nih.gov", EUTILS_HOST, "ftp.ncbi.nlm.nih.gov")
+NCBI_BASE_URL_ENV = "GEOFETCH_NCBI_BASE_URL"
+# Status code of errors injected by the mock server
+MOCK_ERROR_STATUS = 503
+
+# Metadata cache: name of the database file, time to live (hours) and max size
+CACHE_DB_NAME = "geofetch_cache.sqlite"
+# directory (in cache dir) of files with bodies of cached responses
+CACHE_BODIES_DIR = "bodies"
+CACHE_TTL = 24
+CACHE_MAX_SIZE = "1GB"
+
+# Downloads of processed files: number of parallel transfers, max number of
+# transfers to one host, retries of failed transfer and chunk size (bytes)
+DOWNLOAD_WORKERS = 4
+DOWNLOAD_PER_HOST = 2
+DOWNLOAD_RETRIES = 4
+# Base and max delay (seconds) of exponential backoff between retries of failed transfer
+DOWNLOAD_BACKOFF = 1
+DOWNLOAD_MAX_BACKOFF = 10
+# HTTP statuses (besides 5xx) of failed transfers that may succeed, if they are retried
+DOWNLOAD_TRANSIENT_STATUSES = (408, 416, 429)
+DOWNLOAD_CHUNK_SIZE = 1048576
+# Suffix of partially downloaded files, that are resumed on the next run
+DOWNLOAD_PART_SUFFIX = ".part"
+# FTP hosts that serve the same files over HTTPS (keep-alive, no new login per file)
+HTTPS_MIRRORED_FTP_HOSTS = ("ftp.ncbi.nlm.nih.gov",)
+
+# SRA run info is searched with results kept on the E-utilities history server,
+# and fetched from there in pages of SRA_RUNINFO_PAGE_SIZE runs (max 10000)
+NCBI_ESEARCH = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=sra&term={SRP_NUMBER}&usehistory=y&retmax=0&retmode=json"
+NCBI_EFETCH = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=sra&WebEnv={WEBENV}&query_key={QUERY_KEY}&retstart={RETSTART}&retmax={RETMAX}&rettype=runinfo&retmode=xml"
+SRA_RUNINFO_PAGE_SIZE = 10000
+SRA_RUNINFO_MAX_PAGE_SIZE = 10000
+# Number of SRA projects searched at once (OR-joined terms) when run info
+# of many accessions is fetched
+SRA_BATCH_SIZE = 100
 
 NEW_GENOME_COL_NAME = "ref_genome"
 
@@ -61,6 +132,13 @@ ETOOLS_GEO_BASE = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db
 ETOOLS_GEO_GSE_BASE = f"{ETOOLS_GEO_BASE}&term=GSE[ETYP]"
 
 ETOOLS_ENDING = "&retmax={retmax}&usehistory=y"
+# Finder.iter_gse keeps search results on the E-utilities history server and
+# pages through them (referenced by query key) FINDER_PAGE_SIZE ids at a time (max 10000)
+ETOOLS_PAGE_ENDING = "&retstart={retstart}&retmax={retmax}&usehistory=y"
+ETOOLS_HISTORY_PAGE = (
+    f"{ETOOLS_GEO_BASE}&term=%23{{query_key}}&WebEnv={{webenv}}{ETOOLS_PAGE_ENDING}"
+)
+FINDER_PAGE_SIZE = 5000
 
 TODAY_DATE = "3000"
 
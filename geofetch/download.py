@@ -0,0 +1,353 @@
+"""Concurrent in-process downloader of GEO supplementary (processed) files."""
+
+import logging
+import os
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Tuple, Union
+from urllib.parse import urlparse
+
+import requests
+from rich.progress import (
+    BarColumn,
+    DownloadColumn,
+    Progress,
+    TextColumn,
+    TimeRemainingColumn,
+    TransferSpeedColumn,
+)
+from urllib3.exceptions import NewConnectionError
+
+from geofetch.client import NCBIClient, get_default_client
+from geofetch.const import (
+    DOWNLOAD_BACKOFF,
+    DOWNLOAD_CHUNK_SIZE,
+    DOWNLOAD_MAX_BACKOFF,
+    DOWNLOAD_PART_SUFFIX,
+    DOWNLOAD_PER_HOST,
+    DOWNLOAD_RETRIES,
+    DOWNLOAD_TRANSIENT_STATUSES,
+    DOWNLOAD_WORKERS,
+    HTTP_READ_TIMEOUT,
+    HTTPS_MIRRORED_FTP_HOSTS,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class DownloadException(Exception):
+    """Exceptional condition(s) dealing with downloading files."""
+
+    def __init__(self, reason: str = "", transient: bool = True):
+        """
+        Optionally provide explanation for exceptional condition.
+
+        :param str reason: some context, e.g. url of the file that couldn't be downloaded
+        :param bool transient: whether download may succeed, if it's retried
+        """
+        super(DownloadException, self).__init__(reason)
+        self.transient = transient
+
+
+def is_transient(err: Exception) -> bool:
+    """
+    Check if failed transfer may succeed, if it's retried. Timeouts, dropped
+    connections, server errors and incomplete files are transient; unknown
+    hosts, refused connections, client errors (e.g. 404) and local file
+    system errors are not.
+
+    :param err: error raised by the transfer
+    :return: whether transfer should be retried
+    """
+    if isinstance(err, DownloadException):
+        return err.transient
+    if isinstance(err, requests.ConnectionError):
+        reason = getattr(err.args[0], "reason", None) if err.args else None
+        return not isinstance(reason, NewConnectionError)
+    if isinstance(err, requests.RequestException):
+        # timeouts, broken chunked encoding
+        return True
+    if isinstance(err, urllib.error.URLError):
+        return not isinstance(err.reason, (socket.gaierror, ConnectionRefusedError))
+    if isinstance(err, ConnectionRefusedError):
+        return False
+    return isinstance(err, (TimeoutError, ConnectionError, EOFError))
+
+
+def https_url(url: str) -> str:
+    """
+    Rewrite ftp url to https, if the host serves the same files over HTTPS
+
+    :param url: url of the file
+    :return: https url, or unchanged url
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == "ftp" and parsed.hostname in HTTPS_MIRRORED_FTP_HOSTS:
+        return parsed._replace(scheme="https").geturl()
+    return url
+
+
+class Downloader:
+    """
+    Downloads files in process, with a few parallel transfers. HTTP(S) transfers
+    reuse keep-alive connections of NCBIClient; ftp urls of NCBI are downloaded
+    over HTTPS and other ftp urls with urllib.
+    """
+
+    def __init__(
+        self,
+        workers: int = DOWNLOAD_WORKERS,
+        per_host: int = DOWNLOAD_PER_HOST,
+        retries: int = DOWNLOAD_RETRIES,
+        client: NCBIClient = None,
+        disable_progressbar: bool = False,
+    ):
+        """
+        :param workers: number of files downloaded at the same time
+        :param per_host: max number of files downloaded at the same time from one host
+        :param retries: number of retries of failed download
+        :param client: http client used to send requests. Shared default client is used if unspecified
+        :param disable_progressbar: set true to disable progressbar
+        """
+        self.workers = max(1, workers)
+        self.per_host = max(1, per_host)
+        self.retries = retries
+        self.client = client or get_default_client()
+        self.disable_progressbar = disable_progressbar
+        self._host_slots = {}
+        self._host_slots_lock = threading.Lock()
+
+    def _host_slot(self, url: str) -> threading.BoundedSemaphore:
+        """
+        :param url: url of the file
+        :return: semaphore that limits number of transfers from the host of url
+        """
+        host = urlparse(url).hostname
+        with self._host_slots_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_slots[host]
+
+    @staticmethod
+    def _progress(disable: bool) -> Progress:
+        """
+        :param disable: set true to disable progressbar
+        :return: progress bar of transfers
+        """
+        return Progress(
+            TextColumn("{task.description}"),
+            BarColumn(),
+            DownloadColumn(),
+            TransferSpeedColumn(),
+            TimeRemainingColumn(),
+            disable=disable,
+        )
+
+    def download(
+        self,
+        url: str,
+        file_path: str,
+        progress: Progress = None,
+        expected_size: int = None,
+    ) -> str:
+        """
+        Download one file. Data is written to file_path.part, which is resumed
+        (with HTTP Range request) after failure or restart, and renamed to
+        file_path once its size is verified. Complete existing files are not
+        downloaded again; existing files larger than expected_size are kept
+        (with a warning) and not downloaded again either.
+
+        :param url: url of the file
+        :param file_path: path where file should be saved
+        :param progress: progress bar, where transfer should be shown [Optional]
+        :param expected_size: size of the file in bytes (e.g. from filelist.txt).
+            If unknown, Content-Length of the response is used to verify the file [Optional]
+        :return: path of the file
+        :raise DownloadException: if file couldn't be downloaded
+        """
+        if os.path.exists(file_path):
+            size = os.path.getsize(file_path)
+            if expected_size is None or size == expected_size:
+                _LOGGER.info(f"\033[38;5;242mFile {file_path} exists.\033[0m")
+                return file_path
+            if size > expected_size:
+                # expected size (e.g. from a stale filelist.txt) may be out of date,
+                # the file is kept, so that a complete download is never lost
+                _LOGGER.warning(
+                    f"File {file_path} is larger than expected ({size} > {expected_size} "
+                    f"bytes). Expected size may be out of date, keeping the file"
+                )
+                return file_path
+            _LOGGER.warning(
+                f"File {file_path} is incomplete ({size} of {expected_size} bytes), "
+                f"downloading it again"
+            )
+            os.replace(file_path, file_path + DOWNLOAD_PART_SUFFIX)
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+
+        source_url = https_url(url)
+        ntry = 0
+        while True:
+            try:
+                with self._host_slot(source_url):
+                    self._transfer(source_url, file_path, progress, expected_size)
+                return file_path
+            except (OSError, DownloadException) as err:
+                transient = is_transient(err)
+                if not transient or ntry >= self.retries:
+                    raise DownloadException(f"{url}: {err}", transient) from err
+                _LOGGER.error(str(err))
+                # The server times out if we are hitting it too frequently,
+                # so we should sleep a bit to reduce frequency
+                sleeptime = min(DOWNLOAD_BACKOFF * 2**ntry, DOWNLOAD_MAX_BACKOFF)
+                _LOGGER.info(f"Sleeping for {sleeptime} seconds")
+                time.sleep(sleeptime)
+                ntry += 1
+
+    def download_many(
+        self,
+        files: Iterable[Union[Tuple[str, str], Tuple[str, str, int]]],
+        disable_progressbar: bool = None,
+    ) -> Dict[str, DownloadException]:
+        """
+        Download files concurrently
+
+        :param files: (url, file_path) or (url, file_path, expected_size) tuples of files to download
+        :param disable_progressbar: set true to disable progressbar. Value set
+            in the constructor is used if unspecified
+        :return: dict of urls of files that couldn't be downloaded and errors
+        """
+        files = [(*item, None)[:3] for item in files]
+        failed = {}
+        if not files:
+            return failed
+        if disable_progressbar is None:
+            disable_progressbar = self.disable_progressbar
+        with self._progress(disable_progressbar) as progress, ThreadPoolExecutor(
+            max_workers=self.workers
+        ) as executor:
+            futures = {
+                executor.submit(self.download, url, file_path, progress, size): url
+                for url, file_path, size in files
+            }
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    file_path = future.result()
+                    _LOGGER.info(
+                        f"\033[92mFile {file_path} has been downloaded successfully\033[0m"
+                    )
+                except DownloadException as err:
+                    _LOGGER.error(f"Couldn't download {url}. {err}")
+                    failed[url] = err
+        return failed
+
+    def _transfer(
+        self,
+        url: str,
+        file_path: str,
+        progress: Progress = None,
+        expected_size: int = None,
+    ) -> None:
+        """
+        Stream url to file_path.part, starting from the data that is already there.
+        File is renamed to file_path only when it is complete.
+
+        :param url: url of the file
+        :param file_path: path where file should be saved
+        :param progress: progress bar, where transfer should be shown [Optional]
+        :param expected_size: size of the file in bytes [Optional]
+        """
+        part_path = file_path + DOWNLOAD_PART_SUFFIX
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if expected_size is not None and offset > expected_size:
+            offset = 0
+        task = None
+        try:
+            if expected_size is None or offset < expected_size:
+                with _open_transfer(self.client, url, offset) as (chunks, start, total):
+                    if start:
+                        _LOGGER.info(f"Resuming download of {url} from byte {start}")
+                    if expected_size is None:
+                        expected_size = total
+                    if progress is not None:
+                        task = progress.add_task(
+                            os.path.basename(file_path),
+                            total=expected_size,
+                            completed=start,
+                        )
+                    with open(part_path, "ab" if start else "wb") as f:
+                        for chunk in chunks:
+                            f.write(chunk)
+                            if task is not None:
+                                progress.advance(task, len(chunk))
+        finally:
+            if task is not None:
+                progress.remove_task(task)
+
+        size = os.path.getsize(part_path)
+        if expected_size is not None and size != expected_size:
+            if size > expected_size:
+                os.remove(part_path)
+            raise DownloadException(
+                f"Size of downloaded file {file_path} ({size} bytes) "
+                f"doesn't match expected size ({expected_size} bytes)"
+            )
+        os.replace(part_path, file_path)
+
+
+@contextmanager
+def _open_transfer(
+    client: NCBIClient, url: str, offset: int = 0
+) -> Iterator[Tuple[Iterator, int, int]]:
+    """
+    Open transfer of one file, over HTTP(S) with client, or with urllib for other schemes.
+    HTTP transfers are started at offset, if server supports range requests. If the
+    range can't be satisfied, transfer of the whole file is started again, unless
+    the file is offset bytes long (i.e. data before offset is already complete).
+
+    :param client: http client used to send requests
+    :param url: url of the file
+    :param offset: byte from which transfer should start
+    :return: iterator of chunks of the file, byte where transfer actually starts
+        and size of the whole file (None if unknown)
+    """
+    if urlparse(url).scheme in ("http", "https"):
+        headers = {"Range": f"bytes={offset}-"} if offset else None
+        response = client.get(url, stream=True, headers=headers)
+        try:
+            if response.status_code == 416:
+                # range not satisfiable: partial file is already complete,
+                # or it's not valid anymore and transfer is started again
+                total = response.headers.get("Content-Range", "").rpartition("/")[2]
+                if total.isdigit() and int(total) == offset:
+                    yield iter(()), offset, offset
+                    return
+                _LOGGER.warning(f"Couldn't resume download of {url}, starting again")
+                response.close()
+                response = client.get(url, stream=True)
+            if not response.ok:
+                raise DownloadException(
+                    f"Error in requesting file: {url} [{response.status_code}]",
+                    transient=response.status_code >= 500
+                    or response.status_code in DOWNLOAD_TRANSIENT_STATUSES,
+                )
+            start = offset if response.status_code == 206 else 0
+            length = response.headers.get("Content-Length")
+            total = start + int(length) if length else None
+            content_range = response.headers.get("Content-Range", "")
+            if start and content_range.rpartition("/")[2].isdigit():
+                total = int(content_range.rpartition("/")[2])
+            yield response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE), start, total
+        finally:
+            response.close()
+    else:
+        with urllib.request.urlopen(url, timeout=HTTP_READ_TIMEOUT) as response:
+            yield iter(
+                lambda: response.read(DOWNLOAD_CHUNK_SIZE), b""
+            ), 0, response.length
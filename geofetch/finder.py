@@ -1,16 +1,21 @@
+import json
 import logging
 import os
 import re
+import sys
 from datetime import datetime, timedelta
+from typing import Iterator, Tuple
 
-import coloredlogs
-import requests
 import xmltodict
 
+from .client import NCBIClient, get_default_client
 from .const import (
     DATE_FILTER,
     ETOOLS_ENDING,
     ETOOLS_GEO_GSE_BASE,
+    ETOOLS_HISTORY_PAGE,
+    ETOOLS_PAGE_ENDING,
+    FINDER_PAGE_SIZE,
     RETMAX,
     THREE_MONTH_FILTER,
     TODAY_DATE,
@@ -18,12 +23,19 @@ from .const import (
 
 __author__ = "Oleksandr Khoroshevskyi"
 
-_LOGGER = logging.getLogger("__name__")
-coloredlogs.install(
-    logger=_LOGGER,
-    datefmt="%H:%M:%S",
-    fmt="[%(levelname)s] [%(asctime)s] %(message)s",
-)
+_LOGGER = logging.getLogger(__name__)
+
+
+class FinderException(Exception):
+    """Exceptional condition(s) dealing with searching GEO."""
+
+    def __init__(self, reason: str = ""):
+        """
+        Optionally provide explanation for exceptional condition.
+
+        :param str reason: some context, e.g. reason why search couldn't be completed
+        """
+        super(FinderException, self).__init__(reason)
 
 
 class Finder:
@@ -33,13 +45,19 @@ class Finder:
     while initialization of the class
     """
 
-    def __init__(self, filters: str = None, retmax: int = RETMAX):
+    def __init__(
+        self, filters: str = None, retmax: int = RETMAX, client: NCBIClient = None
+    ):
         """
         :param filters: filters that have to be added to the query.
             Filter Patterns can be found here:
             https://www.ncbi.nlm.nih.gov/books/NBK3837/#EntrezHelp.Using_the_Advanced_Search_Pag
         :param retmax: maximum number of retrieved accessions.
+        :param client: http client used to query NCBI. Shared default client
+            is used if not provided.
         """
+        self.client = client or get_default_client()
+        self.retmax = retmax
         self.query_customized_ending = ETOOLS_ENDING.format(retmax=retmax)
         self.query_filter_str = self._create_filter_str(filters)
         self.last_result = []
@@ -99,6 +117,99 @@ class Finder:
         self.last_result = gse_id_list
         return gse_id_list
 
+    def iter_gse(
+        self,
+        start_date: str = None,
+        end_date: str = None,
+        page_size: int = FINDER_PAGE_SIZE,
+    ) -> Iterator[str]:
+        """
+        Lazily iterate over gse accessions, optionally limited to the period of time.
+        Results of the search are kept on E-utilities history server and fetched
+        from there in pages, so only one page of ids is held in memory at a time.
+        :param start_date: the oldest date of update [input format: 'YYYY/MM/DD'].
+            All gse accessions are searched if not provided
+        :param end_date: the nearest date of update [input format: 'YYYY/MM/DD']. By default, today
+        :param page_size: number of accessions fetched in one request (max 10000)
+        :return: iterator of gse accessions
+        """
+        date_filter = None
+        if start_date is not None:
+            date_filter = DATE_FILTER.format(
+                start_date=start_date, end_date=end_date or TODAY_DATE
+            )
+        for uid in self._iter_search_query(
+            self._compose_url(date_filter, ending=""), page_size
+        ):
+            yield self.uid_to_gse(uid)
+
+    def sync(
+        self,
+        state_file: str,
+        start_date: str = None,
+        page_size: int = FINDER_PAGE_SIZE,
+    ) -> Tuple[list, list]:
+        """
+        Incrementally sync gse accessions with the state file. Only accessions published
+        since the watermark (date of the last successful sync, inclusive) until today are
+        searched. Known accessions found again (e.g. published on the day of the
+        watermark) are returned as re-seen. New accessions are added to the known set and
+        the watermark is advanced only if the whole search succeeded, so the failed sync
+        can be simply run again.
+
+        Accessions updated after their publication are not reported: GEO DataSets
+        (gds) summaries returned by E-utilities carry only the publication date (PDAT),
+        which is also the date the search is filtered by. Last update date of a series
+        is available in its soft file (!Series_last_update_date), so tracking updates
+        would need a request per known accession in every sync, which is what the
+        incremental sync avoids.
+        :param state_file: path to the json file with the watermark and known gse accessions.
+            It is created in the first sync
+        :param start_date: the oldest publication date searched in the first sync
+            [input format: 'YYYY/MM/DD']. All gse accessions are searched if not provided
+        :param page_size: number of accessions fetched in one request (max 10000)
+        :return: list of new gse accessions and list of known gse accessions found again
+        :raise FinderException: if search couldn't be completed
+        """
+        state = self._read_sync_state(state_file)
+        if state and state.get("filters", "") != self.query_filter_str:
+            raise FinderException(
+                f"State file '{state_file}' was created with different filters: "
+                f"'{state.get('filters', '')}'"
+            )
+        known = set(state.get("gse", []))
+        window_start = state.get("watermark") or start_date
+        window_end = datetime.today().strftime("%Y/%m/%d")
+        date_filter = None
+        if window_start is not None:
+            date_filter = DATE_FILTER.format(
+                start_date=window_start, end_date=window_end
+            )
+        found = dict.fromkeys(
+            self.uid_to_gse(uid)
+            for uid in self._iter_search_query(
+                self._compose_url(date_filter, ending=""), page_size, strict=True
+            )
+        )
+        new_gse = [gse for gse in found if gse not in known]
+        reseen_gse = [gse for gse in found if gse in known]
+
+        self._write_sync_state(
+            state_file,
+            {
+                "watermark": window_end,
+                "window": {"start": window_start, "end": window_end},
+                "filters": self.query_filter_str,
+                "gse": sorted(known.union(new_gse)),
+            },
+        )
+        _LOGGER.info(
+            f"Synced gse accessions from {window_start or 'the beginning'} to "
+            f"{window_end}: {len(new_gse)} new, {len(reseen_gse)} re-seen"
+        )
+        self.last_result = new_gse + reseen_gse
+        return new_gse, reseen_gse
+
     @staticmethod
     def uid_to_gse(uid: str) -> str:
         """
@@ -119,14 +230,13 @@ class Finder:
         """
         return list(set(new_list) - set(old_list))
 
-    @staticmethod
-    def _run_search_query(url: str) -> list:
+    def _run_search_query(self, url: str) -> list:
         """
         Run get request and return list of uids found
         :param url: url of the query
         :return: list of UIDs
         """
-        x = requests.get(url)
+        x = self.client.get(url)
         if x.status_code != 200:
             _LOGGER.error("Request status != 200. Error. Check your request")
             return []
@@ -141,6 +251,100 @@ class Finder:
         except Exception:
             return []
 
+    def _iter_search_query(
+        self, url: str, page_size: int, strict: bool = False
+    ) -> Iterator[str]:
+        """
+        Run search on E-utilities history server and page through uids found.
+        At most retmax uids are returned
+        :param url: url of the query, without retmax, retstart and history parameters
+        :param page_size: number of uids fetched in one request
+        :param strict: raise exception if not all uids found can be returned,
+            instead of logging an error
+        :return: iterator of UIDs
+        :raise FinderException: in strict mode, if search couldn't be completed
+        """
+        page_size = max(1, min(page_size, self.retmax))
+        page = self._get_search_page(
+            url + ETOOLS_PAGE_ENDING.format(retstart=0, retmax=page_size)
+        )
+        if page is None:
+            if strict:
+                raise FinderException(f"Search failed: {url}")
+            return
+        if strict and int(page["Count"]) > self.retmax:
+            raise FinderException(
+                f"Found {page['Count']} elements, more than retmax ({self.retmax})"
+            )
+        total = min(int(page["Count"]), self.retmax)
+        _LOGGER.info(f"Found elements: {page['Count']}")
+        fetched = 0
+        while True:
+            uids = (page.get("IdList") or {}).get("Id", [])[: total - fetched]
+            yield from uids
+            fetched += len(uids)
+            if fetched >= total or not uids:
+                return
+            page = self._get_search_page(
+                ETOOLS_HISTORY_PAGE.format(
+                    query_key=page["QueryKey"],
+                    webenv=page["WebEnv"],
+                    retstart=fetched,
+                    retmax=min(page_size, total - fetched),
+                )
+            )
+            if page is None:
+                message = f"Search stopped after {fetched} of {total} elements"
+                if strict:
+                    raise FinderException(message)
+                _LOGGER.error(message)
+                return
+
+    def _get_search_page(self, url: str) -> dict:
+        """
+        Run get request and parse one page of search results
+        :param url: url of the query
+        :return: eSearchResult dict, or None if request failed
+        """
+        x = self.client.get(url)
+        if x.status_code != 200:
+            _LOGGER.error("Request status != 200. Error. Check your request")
+            return None
+        try:
+            return xmltodict.parse(x.text, force_list=("Id",))["eSearchResult"]
+        except Exception as err:
+            _LOGGER.error(f"Couldn't parse search results: {err}")
+            return None
+
+    @staticmethod
+    def _read_sync_state(state_file: str) -> dict:
+        """
+        Read sync state from the file
+        :param state_file: path to the state file
+        :return: dict of sync state. Empty if file doesn't exist
+        """
+        if not os.path.exists(state_file):
+            return {}
+        with open(state_file, "r") as fp:
+            return json.load(fp)
+
+    @staticmethod
+    def _write_sync_state(state_file: str, state: dict) -> None:
+        """
+        Atomically replace the state file. State is written to a temporary file,
+        that is renamed to state_file only once it is complete.
+        :param state_file: path to the state file
+        :param state: dict of sync state
+        """
+        tmp_path = f"{state_file}.tmp"
+        try:
+            with open(tmp_path, "w") as fp:
+                json.dump(state, fp, indent=2)
+            os.replace(tmp_path, state_file)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
     @staticmethod
     def _create_filter_str(filters: str = None) -> str:
         """
@@ -152,16 +356,19 @@ class Finder:
             return ""
         return f"+(AND+{filters})"
 
-    def _compose_url(self, date_filter: str = None) -> str:
+    def _compose_url(self, date_filter: str = None, ending: str = None) -> str:
         """
         Compose final url by adding date filter
         :param date_filter: date filter that has to be used in the query
+        :param ending: ending of the url. By default, retmax and usehistory parameters
         :return: string of final url
         """
         if date_filter is None:
             date_filter = ""
+        if ending is None:
+            ending = self.query_customized_ending
 
-        return f"{ETOOLS_GEO_GSE_BASE}{self.query_filter_str}{date_filter}{self.query_customized_ending}"
+        return f"{ETOOLS_GEO_GSE_BASE}{self.query_filter_str}{date_filter}{ending}"
 
     def generate_file(self, file_path: str, gse_list: list = None):
         """
@@ -180,3 +387,25 @@ class Finder:
             for item in gse_list:
                 fp.write("%s\n" % item)
             _LOGGER.info("File has been saved!")
+
+
+def main():
+    """Run incremental sync of gse accessions."""
+    from .cli import _parse_finder_cmdl
+
+    args = _parse_finder_cmdl(sys.argv[1:])
+    finder = Finder(filters=args.filters, retmax=args.retmax)
+    try:
+        new_gse, reseen_gse = finder.sync(
+            args.state_file, start_date=args.start_date, page_size=args.page_size
+        )
+    except FinderException as err:
+        _LOGGER.error(f"Sync failed, state file was not changed. {err}")
+        return 1
+    gse_list = new_gse + reseen_gse if args.reseen else new_gse
+    if args.output:
+        finder.generate_file(args.output, gse_list)
+    else:
+        for gse in gse_list:
+            print(gse)
+    return 0
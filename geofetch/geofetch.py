@@ -1,52 +1,80 @@
+import argparse
+import asyncio
+import contextvars
 import copy
 import csv
+import importlib.util
 import logging
 import os
 import re
 import sys
-import time
-from typing import Dict, List, NoReturn, Tuple, Union
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial, wraps
+from typing import Dict, Iterable, Iterator, List, NoReturn, Tuple, Union
 
 import logmuse
 import pandas as pd
 import peppy
-import requests
-import xmltodict
 import yaml
 from rich.progress import track
 from ubiquerg import expandpath
 
+from geofetch import aio
+from geofetch.cache import MetadataCache
 from geofetch.cli import _parse_cmdl
+from geofetch.client import NCBIClient
 from geofetch.const import (
+    CACHE_MAX_SIZE,
+    CACHE_TTL,
     CONFIG_PROCESSED_TEMPLATE_NAME,
     CONFIG_RAW_TEMPLATE_NAME,
     CONFIG_SRA_TEMPLATE_NAME,
+    CONVERT_JOBS,
+    DOWNLOAD_PER_HOST,
+    DOWNLOAD_WORKERS,
     EXP_SUPP_METADATA_FILE,
-    EXPERIMENT_PATTERN,
     FILE_RAW_NAME_SAMPLE_PATTERN,
     FILE_RAW_NAME_SUBSAMPLE_PATTERN,
     GSE_PATTERN,
-    NCBI_EFETCH,
-    NCBI_ESEARCH,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_POOL_SIZE,
+    HTTP_READ_TIMEOUT,
     NEW_GENOME_COL_NAME,
-    NUM_RETRIES,
-    PROJECT_PATTERN,
+    OUTPUT_FORMATS,
+    PARQUET_COMPRESSION,
+    PARQUET_SUFFIX,
+    PREFETCH_JOBS,
+    PROFILE_TOP_N,
+    PROFILERS,
     SAMPLE_SUPP_METADATA_FILE,
     SER_SUPP_FILE_PATTERN,
+    SRA_BATCH_SIZE,
+    SRA_RUNINFO_MAX_PAGE_SIZE,
+    SRA_RUNINFO_PAGE_SIZE,
     SUPP_FILE_PATTERN,
     TEMPLATES_DIR,
     PIPELINE_INTERFACE_CONVERT_TEMPLATE_NAME,
     LOOPER_SRA_CONVERT,
     LOOPER_CONFIG_FILE_NAME,
 )
+from geofetch.download import Downloader
+from geofetch.prefetch import PrefetchScheduler, run_size_mb
+from geofetch.profiling import RunProfiler, profile_file_prefix
+from geofetch.report import RunReport
+from geofetch.soft import SoftDocument, add_soft_value, as_soft_document, parse_soft
 from geofetch.utils import (
     Accession,
-    _check_file_existance,
     _create_dot_yaml,
     _dict_to_list_converter,
+    _expand_metadata_columns,
+    _file_size,
     _filter_gsm,
     _get_list_of_keys,
     _get_value,
+    _load_sra_convert_modifiers,
+    _map_ordered,
     _read_tar_filelist,
     _sanitize_config_string,
     _sanitize_name,
@@ -56,22 +84,58 @@ from geofetch.utils import (
     _unify_list_keys,
     _update_columns,
     _which,
-    build_prefetch_command,
+    _yaml_dumped,
+    _yaml_plain_scalar,
+    _yaml_quoted_scalar,
     clean_soft_files,
     convert_size,
+    fetch_sra_runinfo,
+    fetch_sra_runinfo_many,
     gse_content_to_dict,
     is_prefetch_callable,
+    iter_soft_file,
     parse_accessions,
-    parse_SOFT_line,
     run_subprocess,
 )
 
 _LOGGER = logging.getLogger(__name__)
 
+# ids of Geofetchers, whose run is in progress in the current thread or task
+_running_geofetchers = contextvars.ContextVar("running_geofetchers", default=())
+
+
+def _reported_run(method):
+    """
+    Record run report of the Geofetcher method (or coroutine), and profile it, if
+    profiler is set. Nested calls (e.g. fetch_all called by get_projects) are
+    recorded in the report and profile of the outermost call. Concurrent runs
+    of one Geofetcher are not allowed.
+    """
+    if asyncio.iscoroutinefunction(method):
+
+        @wraps(method)
+        async def async_wrapper(self, *args, **kwargs):
+            with self._run(method.__name__):
+                return await method(self, *args, **kwargs)
+
+        return async_wrapper
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._run(method.__name__):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
 
 class Geofetcher:
     """
-    Class to download or get projects, metadata, data from GEO and SRA
+    Class to download or get projects, metadata, data from GEO and SRA.
+
+    Geofetcher keeps the state of its run (settings of the run, prefetched
+    metadata, run report), so one instance can't be used by concurrent runs
+    (e.g. overlapping get_projects_async calls, or calls from multiple threads).
+    Such runs raise RuntimeError; separate instances should be used instead.
     """
 
     def __init__(
@@ -109,6 +173,29 @@ class Geofetcher:
         add_convert_modifier: bool = False,
         opts=None,
         max_prefetch_size=None,
+        http_pool_size: int = HTTP_POOL_SIZE,
+        http_timeout: float = HTTP_READ_TIMEOUT,
+        client: NCBIClient = None,
+        workers: int = 1,
+        api_key: str = None,
+        rate_limit_lock: str = None,
+        ncbi_base_url: str = None,
+        cache_dir: str = None,
+        cache_ttl: float = CACHE_TTL,
+        cache_max_size: str = CACHE_MAX_SIZE,
+        cache: MetadataCache = None,
+        download_workers: int = DOWNLOAD_WORKERS,
+        download_per_host: int = DOWNLOAD_PER_HOST,
+        prefetch_jobs: int = PREFETCH_JOBS,
+        prefetch_budget: float = None,
+        convert_jobs: int = CONVERT_JOBS,
+        output_format: str = "csv",
+        sra_page_size: int = SRA_RUNINFO_PAGE_SIZE,
+        sra_batch_size: int = SRA_BATCH_SIZE,
+        run_report: str = None,
+        profile: str = None,
+        profile_dir: str = None,
+        profile_top: int = PROFILE_TOP_N,
         **kwargs,
     ):
         """
@@ -176,6 +263,49 @@ class Geofetcher:
         :param opts: opts object [Optional]
         :param str | int max_prefetch_size: argmuent to prefetch command's --max-size option;
             for reference: https://github.com/ncbi/sra-tools/wiki/08.-prefetch-and-fasterq-dump#check-the-maximum-size-limit-of-the-prefetch-tool
+        :param http_pool_size: number of keep-alive connections to each NCBI host [Default: 10]
+        :param http_timeout: read timeout of requests to NCBI, in seconds [Default: 120]
+        :param client: http client shared by all requests to NCBI. If not provided,
+                new client is created using http_pool_size and http_timeout [Optional]
+        :param workers: number of accessions, which metadata is fetched and parsed concurrently.
+                Results are merged in the input order, so output is the same as in serial run [Default: 1]
+        :param api_key: NCBI API key, raises E-utilities rate limit from 3 to 10 requests per second.
+                [Default: $NCBI_API_KEY]
+        :param rate_limit_lock: path to the lock file used to share E-utilities rate limit
+                between geofetch processes running at the same time [Optional]
+        :param ncbi_base_url: url of the server, where requests to NCBI hosts are sent instead,
+                e.g. local mock server (python -m geofetch.mockserver) [Default: $GEOFETCH_NCBI_BASE_URL]
+        :param cache_dir: directory of persistent metadata cache. Soft files, SRA run info and
+                filelists are cached there, so re-runs skip accessions that didn't change [Optional]
+        :param cache_ttl: time (in hours) after which cached metadata is revalidated.
+                Ignored (all entries are revalidated) if refresh_metadata is set [Default: 24]
+        :param cache_max_size: max size of metadata cache, least recently used entries are evicted.
+                Supported input formats : 12B, 12KB, 12MB, 12GB. [Default value: 1GB]
+        :param cache: metadata cache instance. Overrides cache_dir, cache_ttl and cache_max_size [Optional]
+        :param download_workers: number of processed files downloaded at the same time [Default: 4]
+        :param download_per_host: max number of processed files downloaded at the same time
+                from one host [Default: 2]
+        :param prefetch_jobs: number of prefetch processes (SRA runs downloaded) run at the same time [Default: 2]
+        :param prefetch_budget: max total size (in MB, from size_MB column of SRA run info) of runs
+                downloaded at the same time. Unlimited if not provided [Optional]
+        :param convert_jobs: number of runs converted to bam at the same time. Runs are converted
+                while next runs are downloaded [Default: 1]
+        :param output_format: format of sample and subsample tables: csv or parquet.
+                Parquet tables are typed and compressed, and require pyarrow. They are written
+                next to the csv tables, which are referenced by the PEP, as peppy can't read
+                Parquet tables [Default: csv]
+        :param sra_page_size: number of SRA runs fetched in one efetch request. All runs
+                of the project are fetched, in as many pages as needed (1-10000) [Default: 10000]
+        :param sra_batch_size: number of SRA projects searched in one E-utilities query,
+                when raw data metadata of many accessions is fetched [Default: 100]
+        :param run_report: path to the file, where report of the run is saved: time spent in each stage
+                of each accession, HTTP requests, retries, received bytes and cache hits. Saved in
+                Prometheus text format if path ends with .prom, as JSON otherwise [Default: None]
+        :param profile: profiler of fetch_all and get_projects runs: cprofile, pyinstrument
+                or tracemalloc. Profile of each run is saved together with a summary of top hot
+                functions and peak memory. pyinstrument has to be installed [Default: None]
+        :param profile_dir: directory where profiles are saved [Default: metadata folder]
+        :param profile_top: number of hot functions listed in the profile summary [Default: 20]
         :param kwargs: other values
         """
 
@@ -215,7 +345,10 @@ class Geofetcher:
         self.config_template = config_template
 
         # if user specified a pipeline interface path for samples, add it into the project config
+        self.pipeline_samples = None
+        self.pipeline_project = pipeline_project
         if pipeline_samples and pipeline_samples != "null":
+            self.pipeline_samples = pipeline_samples
             self.file_pipeline_samples = pipeline_samples
             self.file_pipeline_samples = (
                 f"pipeline_interfaces: {self.file_pipeline_samples}"
@@ -282,11 +415,139 @@ class Geofetcher:
         if bam_conversion and not just_metadata and not _which("samtools"):
             raise SystemExit("For SAM/BAM processing, samtools should be on PATH.")
 
+        if output_format not in OUTPUT_FORMATS:
+            raise SystemExit(
+                f"Unsupported output format: {output_format}. "
+                f"Supported formats: {', '.join(OUTPUT_FORMATS)}"
+            )
+        if output_format == "parquet" and not importlib.util.find_spec("pyarrow"):
+            raise SystemExit(
+                "For Parquet output, pyarrow should be installed "
+                "(pip install geofetch[parquet])."
+            )
+        self.output_format = output_format
+        if profile is not None and profile not in PROFILERS:
+            raise SystemExit(
+                f"Unsupported profiler: {profile}. "
+                f"Supported profilers: {', '.join(PROFILERS)}"
+            )
+        if profile == "pyinstrument" and not importlib.util.find_spec("pyinstrument"):
+            raise SystemExit(
+                "For pyinstrument profiles, pyinstrument should be installed "
+                "(pip install geofetch[profile])."
+            )
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.profile_top = profile_top
+        self.sra_page_size = max(1, min(sra_page_size, SRA_RUNINFO_MAX_PAGE_SIZE))
+        self.sra_batch_size = max(1, sra_batch_size)
+
         self.just_object = False
         self.max_prefetch_size = (
             "50g" if max_prefetch_size is None else max_prefetch_size
         )
 
+        self.workers = workers
+        # metadata fetched ahead of fetch_all by the current run, keyed by (type, accession)
+        self._prefetched = {}
+        # soft files fetched ahead of fetch_all by get_projects_async
+        self._metadata_window = None
+        self.client = client or NCBIClient(
+            pool_size=http_pool_size,
+            timeout=(HTTP_CONNECT_TIMEOUT, http_timeout),
+            api_key=api_key,
+            rate_limit_lock=rate_limit_lock,
+            base_url=ncbi_base_url,
+        )
+        if cache is None and cache_dir:
+            cache = MetadataCache(
+                expandpath(cache_dir),
+                ttl=0 if refresh_metadata else float(cache_ttl) * 3600,
+                max_size=convert_size(cache_max_size.lower()),
+            )
+        self.cache = cache
+        self.downloader = Downloader(
+            workers=download_workers,
+            per_host=download_per_host,
+            client=self.client,
+            disable_progressbar=self.disable_progressbar,
+        )
+        self.prefetch_scheduler = PrefetchScheduler(
+            jobs=prefetch_jobs,
+            budget_mb=prefetch_budget,
+            max_size=self.max_prefetch_size,
+        )
+        self.convert_jobs = max(1, convert_jobs)
+        self.run_report = run_report
+        # report of the last (or current) run of fetch_all or get_projects
+        self.report = RunReport(self.client, self.cache)
+        self._run_lock = threading.Lock()
+
+    @contextmanager
+    def _run(self, name: str) -> Iterator[None]:
+        """
+        Context of a run. Outermost run creates new run report and starts the profiler,
+        if it is set. Report is saved to the run_report file, if it is set.
+
+        :param name: name of the run, e.g. name of the method
+        :raise RuntimeError: if another run of this Geofetcher is in progress
+        """
+        running = _running_geofetchers.get()
+        if id(self) in running:
+            # nested run, e.g. fetch_all called by get_projects
+            yield
+            return
+        if not self._run_lock.acquire(blocking=False):
+            raise RuntimeError(
+                f"Can't start {name}: another run of this Geofetcher is in progress. "
+                f"Use separate Geofetcher instances for concurrent runs."
+            )
+        token = _running_geofetchers.set(running + (id(self),))
+        try:
+            with self._outermost_run(name):
+                yield
+        finally:
+            _running_geofetchers.reset(token)
+            self._run_lock.release()
+
+    @contextmanager
+    def _outermost_run(self, name: str) -> Iterator[None]:
+        """
+        Context of the outermost run: new run report, and profile of the run.
+        Metadata prefetched by the run is dropped at its end, so that it's never
+        used by later runs.
+
+        :param name: name of the run, e.g. name of the method
+        """
+        self.report = RunReport(self.client, self.cache)
+        profiler = None
+        if self.profile:
+            profiler = RunProfiler(
+                self.profile,
+                profile_file_prefix(
+                    expandpath(self.profile_dir or self.metadata_expanded), name
+                ),
+                top_n=self.profile_top,
+            )
+            profiler.start()
+        try:
+            yield
+        finally:
+            self._prefetched.clear()
+            if profiler is not None:
+                self.report.profile = profiler.stop()
+                _LOGGER.info(
+                    f"Profile ({self.profile}): {profiler.profile_path}, "
+                    f"summary: {profiler.summary_path}, peak memory: "
+                    f"{self.report.profile['peak_memory'] / 1024 ** 2:.1f}MB"
+                )
+            self.report.finish()
+            if self.run_report:
+                _LOGGER.info(
+                    f"Run report: {self.report.write(expandpath(self.run_report))}"
+                )
+
+    @_reported_run
     def get_projects(
         self, input: str, just_metadata: bool = True, discard_soft: bool = True
     ) -> dict:
@@ -357,6 +618,140 @@ class Geofetcher:
 
         return new_pr_dict
 
+    @_reported_run
+    async def get_projects_async(
+        self,
+        input: str,
+        just_metadata: bool = True,
+        discard_soft: bool = True,
+        concurrency: int = 10,
+    ) -> dict:
+        """
+        Asyncio version of get_projects. Projects are created in a worker thread,
+        so the event loop is not blocked, while soft files are fetched by
+        geofetch.aio engine, at most `concurrency` accessions ahead of the
+        accession that is processed. Soft files of each accession are released
+        as soon as it is processed, so memory doesn't grow with the number of
+        accessions. Calls on one Geofetcher can't overlap (RuntimeError is raised);
+        use separate instances to run them concurrently.
+
+        :param input: GSE number, or path to file of GSE numbers
+        :param just_metadata: process only metadata
+        :param discard_soft:  clean run, without downloading soft files
+        :param concurrency: max number of accessions fetched ahead of processing
+        :return: peppy project or list of project, if acc_anno is set.
+        """
+        self.discard_soft = discard_soft
+        acc_GSE_list = parse_accessions(input, self.metadata_expanded, just_metadata)
+        items = self._prefetch_items(list(acc_GSE_list.keys())[self.skip :])
+        window = aio.PrefetchWindow(items, size=concurrency)
+        prefetch = asyncio.ensure_future(self._prefetch_metadata(window, items))
+        self._metadata_window = window
+        try:
+            loop = asyncio.get_running_loop()
+            # context is copied, so get_projects is a nested call of this run
+            return await loop.run_in_executor(
+                None,
+                contextvars.copy_context().run,
+                partial(self.get_projects, input, just_metadata, discard_soft),
+            )
+        finally:
+            prefetch.cancel()
+            await asyncio.gather(prefetch, return_exceptions=True)
+            window.close()
+            self._metadata_window = None
+
+    def _prefetch_items(self, accessions: List[str]) -> List[Tuple[str, str]]:
+        """
+        Get soft files of accessions, that are not saved in metadata folder yet,
+        and should be prefetched. For raw data, only GSM soft files are prefetched:
+        GSE soft files of all accessions are read at once, by the batched SRA
+        run info query of fetch_all.
+
+        :param accessions: list of GSE accessions, in the order of processing
+        :return: list of (accession, type) tuples
+        """
+        typenames = ["GSE", "GSM"] if self.processed else ["GSM"]
+        return [
+            (acc_GSE, typename)
+            for acc_GSE in accessions
+            for typename in typenames
+            if not os.path.isfile(self._soft_file_path(acc_GSE, typename))
+            or self.refresh_metadata
+        ]
+
+    async def _prefetch_metadata(
+        self, window: aio.PrefetchWindow, items: List[Tuple[str, str]]
+    ) -> None:
+        """
+        Fetch soft files of the window, to be taken by fetch_all
+
+        :param window: window of soft files
+        :param items: (accession, type) tuples of soft files in the window
+        """
+        with self.report.span("prefetch_metadata"):
+            try:
+                await window.run(
+                    outpaths={
+                        (acc_GSE, typename): self._soft_file_path(acc_GSE, typename)
+                        for acc_GSE, typename in items
+                    },
+                    clean=self.discard_soft,
+                    max_soft_size=self.max_soft_size,
+                    client=self.client,
+                    cache=self.cache,
+                )
+            except asyncio.CancelledError:
+                # projects were created before all soft files were fetched
+                pass
+
+    def _prefetch_sra_runinfo(self, accessions: List[str]) -> NoReturn:
+        """
+        Fetch SRA run info of raw data accessions at once, with batched E-utilities
+        queries of few SRA projects, and store it to be used by fetch_all.
+        GSE soft files, which link accessions to SRA projects, are fetched
+        (concurrently, if workers > 1) and stored as well.
+
+        :param accessions: list of GSE accessions
+        """
+        accessions = [
+            acc_GSE
+            for acc_GSE in accessions
+            if self.refresh_metadata
+            or not os.path.isfile(
+                os.path.join(self.metadata_expanded, acc_GSE + "_SRA.csv")
+            )
+        ]
+
+        def find_srp(acc_GSE: str) -> Union[str, None]:
+            try:
+                with self.report.span("soft_gse", acc_GSE):
+                    gse_content = self._get_soft_content(
+                        acc_GSE, "GSE", self._soft_file_path(acc_GSE, "GSE")
+                    )
+            except Exception as err:
+                _LOGGER.debug(f"Couldn't get soft file of {acc_GSE}: {err}")
+                return None
+            self._prefetched[("GSE", acc_GSE)] = gse_content
+            return parse_soft(gse_content).srp
+
+        srp_list = [
+            srp
+            for srp in _map_ordered(find_srp, accessions, workers=self.workers)
+            if srp and ("SRA", srp) not in self._prefetched
+        ]
+        with self.report.span("sra_runinfo_batch"):
+            sra_runinfo = fetch_sra_runinfo_many(
+                srp_list,
+                client=self.client,
+                cache=self.cache,
+                batch_size=self.sra_batch_size,
+                page_size=self.sra_page_size,
+            )
+        for srp, content in sra_runinfo.items():
+            self._prefetched[("SRA", srp)] = content
+
+    @_reported_run
     def fetch_all(self, input: str, name: str = None) -> Union[NoReturn, peppy.Project]:
         """
         Main function driver/workflow
@@ -392,104 +787,69 @@ class Geofetcher:
 
         processed_metadata_samples = []
         processed_metadata_series = []
+        # runs, that prefetch couldn't download, reported at the end
+        failed_runs = {}
 
         acc_GSE_keys = acc_GSE_list.keys()
         nkeys = len(acc_GSE_keys)
-        ncount = 0
-        for acc_GSE in track(
-            acc_GSE_list.keys(),
+        if self.skip > 0:
+            _LOGGER.info(f"Skipped {self.skip} accessions. Starting now.")
+        acc_to_process = list(enumerate(acc_GSE_keys, start=1))[self.skip :]
+
+        # SRA run info of all accessions is fetched at once, in batched queries
+        if not self.processed and len(acc_to_process) > 1:
+            self._prefetch_sra_runinfo([acc_GSE for _, acc_GSE in acc_to_process])
+
+        # metadata of each accession is fetched and parsed (concurrently, if
+        # workers > 1), but results are merged here in the order of input
+        accessions_meta = _map_ordered(
+            lambda acc: self._fetch_accession_meta(acc[1], acc[0], nkeys, acc_GSE_list),
+            acc_to_process,
+            workers=self.workers,
+        )
+        file_gse_content_dict = None
+        # raw data is converted in the background, while next runs are downloaded
+        conversion_pool = (
+            ThreadPoolExecutor(max_workers=self.convert_jobs)
+            if self.bam_conversion
+            and self.bam_folder != ""
+            and not (self.just_metadata or self.processed)
+            else None
+        )
+        for (ncount, acc_GSE), acc_meta in track(
+            zip(acc_to_process, accessions_meta),
             description="Processing... ",
+            total=len(acc_to_process),
             disable=self.disable_progressbar,
         ):
+            if acc_meta is None:
+                continue
             try:
-                ncount += 1
-                if ncount <= self.skip:
-                    continue
-                elif ncount == self.skip + 1:
-                    _LOGGER.info(f"Skipped {self.skip} accessions. Starting now.")
-
-                if not self.just_object or not self.acc_anno:
-                    _LOGGER.info(
-                        f"\033[38;5;200mProcessing accession {ncount} of {nkeys}: '{acc_GSE}'\033[0m"
-                    )
-
-                if len(re.findall(GSE_PATTERN, acc_GSE)) != 1:
-                    _LOGGER.debug(len(re.findall(GSE_PATTERN, acc_GSE)))
-                    _LOGGER.warning(
-                        "This does not appear to be a correctly formatted GSE accession! "
-                        "Continue anyway..."
-                    )
-
-                if len(acc_GSE_list[acc_GSE]) > 0:
-                    _LOGGER.info(
-                        f"Limit to: {list(acc_GSE_list[acc_GSE])}"
-                    )  # a list of GSM#s
-
-                # For each GSE acc, produce a series of metadata files
-                file_gse = os.path.join(self.metadata_expanded, acc_GSE + "_GSE.soft")
-                file_gsm = os.path.join(self.metadata_expanded, acc_GSE + "_GSM.soft")
-                file_sra = os.path.join(self.metadata_expanded, acc_GSE + "_SRA.csv")
-
-                if not os.path.isfile(file_gse) or self.refresh_metadata:
-                    file_gse_content = Accession(acc_GSE).fetch_metadata(
-                        file_gse,
-                        clean=self.discard_soft,
-                        max_soft_size=self.max_soft_size,
-                    )
-                else:
-                    _LOGGER.info(f"Found previous GSE file: {file_gse}")
-                    with open(file_gse, "r") as gse_file_obj:
-                        file_gse_content = gse_file_obj.read().split("\n")
-                    file_gse_content = [
-                        elem for elem in file_gse_content if len(elem) > 0
-                    ]
-
-                file_gse_content_dict = gse_content_to_dict(file_gse_content)
-
-                if not os.path.isfile(file_gsm) or self.refresh_metadata:
-                    file_gsm_content = Accession(acc_GSE).fetch_metadata(
-                        file_gsm,
-                        typename="GSM",
-                        clean=self.discard_soft,
-                        max_soft_size=self.max_soft_size,
-                    )
-                else:
-                    _LOGGER.info(f"Found previous GSM file: {file_gsm}")
-                    with open(file_gsm, "r") as gsm_file_obj:
-                        file_gsm_content = gsm_file_obj.read().split("\n")
-                    file_gsm_content = [
-                        elem for elem in file_gsm_content if len(elem) > 0
-                    ]
-
-                gsm_enter_dict = acc_GSE_list[acc_GSE]
+                file_gse_content_dict = acc_meta["gse_meta_dict"]
 
                 # download processed data
                 if self.processed:
-                    (
-                        meta_processed_samples,
-                        meta_processed_series,
-                    ) = self.fetch_processed_one(
-                        gse_file_content=file_gse_content,
-                        gsm_file_content=file_gsm_content,
-                        gsm_filter_list=gsm_enter_dict,
-                    )
+                    meta_processed_samples = acc_meta["meta_processed_samples"]
+                    meta_processed_series = acc_meta["meta_processed_series"]
 
                     # download processed files:
                     if not self.just_metadata:
-                        self._download_processed_data(
-                            acc_gse=acc_GSE,
-                            meta_processed_samples=meta_processed_samples,
-                            meta_processed_series=meta_processed_series,
-                        )
+                        with self.report.span("download_processed", acc_GSE):
+                            self._download_processed_data(
+                                acc_gse=acc_GSE,
+                                meta_processed_samples=meta_processed_samples,
+                                meta_processed_series=meta_processed_series,
+                            )
 
                     # generating PEPs for processed files:
                     if self.acc_anno:
-                        self._generate_processed_meta(
-                            acc_GSE,
-                            meta_processed_samples,
-                            meta_processed_series,
-                            gse_meta_dict=file_gse_content_dict,
-                        )
+                        with self.report.span("write", acc_GSE):
+                            self._generate_processed_meta(
+                                acc_GSE,
+                                meta_processed_samples,
+                                meta_processed_series,
+                                gse_meta_dict=file_gse_content_dict,
+                            )
 
                     else:
                         # adding metadata from current experiment to the project
@@ -497,44 +857,32 @@ class Geofetcher:
                         processed_metadata_series.extend(meta_processed_series)
 
                 else:
-                    # read gsm metadata
-                    gsm_metadata = self._read_gsm_metadata(
-                        acc_GSE, acc_GSE_list, file_gsm_content
-                    )
-
-                    # download sra metadata
-                    srp_list_result = self._get_SRA_meta(
-                        file_gse_content, gsm_metadata, file_sra
-                    )
-                    if not srp_list_result:
-                        _LOGGER.info("No SRP data, continuing ....")
-                        _LOGGER.warning("No raw pep will be created! ....")
-                        # delete current acc if no raw data was found
-                        # del metadata_dict[acc_GSE]
-                        pass
-                    else:
-                        _LOGGER.info("Parsing SRA file to download SRR records")
-                    gsm_multi_table, gsm_metadata, runs = self._process_sra_meta(
-                        srp_list_result, gsm_enter_dict, gsm_metadata
-                    )
+                    gsm_metadata = acc_meta["gsm_metadata"]
+                    gsm_multi_table = acc_meta["gsm_multi_table"]
 
                     # download raw data:
                     if not self.just_metadata:
-                        for run in runs:
-                            # download raw data
-                            _LOGGER.info(f"Getting SRR: {run}  in ({acc_GSE})")
-                            self._download_raw_data(run)
+                        with self.report.span("download_raw", acc_GSE):
+                            failed_runs.update(
+                                self._download_raw_runs(
+                                    acc_GSE,
+                                    acc_meta["runs"],
+                                    acc_meta["run_sizes"],
+                                    conversion_pool=conversion_pool,
+                                )
+                            )
                     else:
                         _LOGGER.info("Dry run, no data will be downloaded")
 
                     # save one project
                     if self.acc_anno and nkeys > 1:
-                        self._write_raw_annotation_new(
-                            name=acc_GSE,
-                            metadata_dict=gsm_metadata,
-                            subannot_dict=gsm_multi_table,
-                            gse_meta_dict=file_gse_content_dict,
-                        )
+                        with self.report.span("write", acc_GSE):
+                            self._write_raw_annotation_new(
+                                name=acc_GSE,
+                                metadata_dict=gsm_metadata,
+                                subannot_dict=gsm_multi_table,
+                                gse_meta_dict=file_gse_content_dict,
+                            )
 
                     else:
                         metadata_dict_combined.update(gsm_metadata)
@@ -543,7 +891,16 @@ class Geofetcher:
                 _LOGGER.warning(f"Couldn't process {acc_GSE}: {e}", exc_info=True)
                 continue
 
+        if conversion_pool is not None:
+            _LOGGER.info("Waiting for conversions of raw data to finish ...")
+            with self.report.span("convert_raw"):
+                conversion_pool.shutdown(wait=True)
         _LOGGER.info(f"Finished processing {len(acc_GSE_list)} accession(s)")
+        if failed_runs:
+            _LOGGER.error(
+                f"\033[91mPrefetch of {len(failed_runs)} run(s) failed: "
+                f"{', '.join(failed_runs)}. Try these samples later\033[0m"
+            )
 
         # Logging cleaning process:
         if self.discard_soft:
@@ -555,30 +912,180 @@ class Geofetcher:
         # saving PEPs for processed data
         if self.processed:
             if not self.acc_anno:
-                return_value = self._generate_processed_meta(
-                    name=self.project_name,
-                    meta_processed_samples=processed_metadata_samples,
-                    meta_processed_series=processed_metadata_series,
-                    gse_meta_dict=(
-                        file_gse_content_dict if len(acc_GSE_list.keys()) == 1 else None
-                    ),
-                )
+                with self.report.span("write"):
+                    return_value = self._generate_processed_meta(
+                        name=self.project_name,
+                        meta_processed_samples=processed_metadata_samples,
+                        meta_processed_series=processed_metadata_series,
+                        gse_meta_dict=(
+                            file_gse_content_dict
+                            if len(acc_GSE_list.keys()) == 1
+                            else None
+                        ),
+                    )
                 if self.just_object:
                     return return_value
 
         # saving PEPs for raw data
         else:
-            return_value = self._write_raw_annotation_new(
-                f"{self.project_name}_PEP",
-                metadata_dict_combined,
-                subannotation_dict_combined,
-                gse_meta_dict=(
-                    file_gse_content_dict if len(acc_GSE_list.keys()) == 1 else None
-                ),
-            )
+            with self.report.span("write"):
+                return_value = self._write_raw_annotation_new(
+                    f"{self.project_name}_PEP",
+                    metadata_dict_combined,
+                    subannotation_dict_combined,
+                    gse_meta_dict=(
+                        file_gse_content_dict if len(acc_GSE_list.keys()) == 1 else None
+                    ),
+                )
             if self.just_object:
                 return return_value
 
+    def _fetch_accession_meta(
+        self, acc_GSE: str, ncount: int, nkeys: int, acc_GSE_list: dict
+    ) -> Union[dict, None]:
+        """
+        Fetch and parse all metadata of one GSE accession: GSE and GSM soft files,
+        SRA run info (raw data) or list of processed files (processed data).
+        Nothing is downloaded or written to the project here, so this method
+        can be run for few accessions concurrently.
+
+        :param acc_GSE: GSE accession
+        :param ncount: number of the accession in the input
+        :param nkeys: number of all accessions in the input
+        :param acc_GSE_list: dict of GSE accessions and GSM limits, from parse_accessions
+        :return: dict of parsed metadata of accession, or None if accession couldn't be processed
+        """
+        try:
+            if not self.just_object or not self.acc_anno:
+                _LOGGER.info(
+                    f"\033[38;5;200mProcessing accession {ncount} of {nkeys}: '{acc_GSE}'\033[0m"
+                )
+
+            if len(re.findall(GSE_PATTERN, acc_GSE)) != 1:
+                _LOGGER.debug(len(re.findall(GSE_PATTERN, acc_GSE)))
+                _LOGGER.warning(
+                    "This does not appear to be a correctly formatted GSE accession! "
+                    "Continue anyway..."
+                )
+
+            if len(acc_GSE_list[acc_GSE]) > 0:
+                _LOGGER.info(
+                    f"Limit to: {list(acc_GSE_list[acc_GSE])}"
+                )  # a list of GSM#s
+
+            # For each GSE acc, produce a series of metadata files
+            file_gse = self._soft_file_path(acc_GSE, "GSE")
+            file_gsm = self._soft_file_path(acc_GSE, "GSM")
+            file_sra = os.path.join(self.metadata_expanded, acc_GSE + "_SRA.csv")
+
+            # soft files are streamed and tokenised in one pass
+            with self.report.span("soft_gse", acc_GSE):
+                file_gse_content = parse_soft(
+                    self._get_soft_content(acc_GSE, "GSE", file_gse, stream=True)
+                )
+            file_gse_content_dict = gse_content_to_dict(file_gse_content)
+            with self.report.span("soft_gsm", acc_GSE):
+                file_gsm_content = parse_soft(
+                    self._get_soft_content(acc_GSE, "GSM", file_gsm, stream=True)
+                )
+
+            gsm_enter_dict = acc_GSE_list[acc_GSE]
+
+            if self.processed:
+                with self.report.span("processed_files", acc_GSE):
+                    (
+                        meta_processed_samples,
+                        meta_processed_series,
+                    ) = self.fetch_processed_one(
+                        gse_file_content=file_gse_content,
+                        gsm_file_content=file_gsm_content,
+                        gsm_filter_list=gsm_enter_dict,
+                    )
+                return {
+                    "gse_meta_dict": file_gse_content_dict,
+                    "meta_processed_samples": meta_processed_samples,
+                    "meta_processed_series": meta_processed_series,
+                }
+
+            # read gsm metadata
+            with self.report.span("gsm_metadata", acc_GSE):
+                gsm_metadata = self._read_gsm_metadata(
+                    acc_GSE, acc_GSE_list, file_gsm_content
+                )
+
+            # download sra metadata
+            with self.report.span("sra_runinfo", acc_GSE):
+                srp_list_result = self._get_SRA_meta(
+                    file_gse_content, gsm_metadata, file_sra
+                )
+            if not srp_list_result:
+                _LOGGER.info("No SRP data, continuing ....")
+                _LOGGER.warning("No raw pep will be created! ....")
+            else:
+                _LOGGER.info("Parsing SRA file to download SRR records")
+            with self.report.span("sra_process", acc_GSE):
+                gsm_multi_table, gsm_metadata, runs = self._process_sra_meta(
+                    srp_list_result, gsm_enter_dict, gsm_metadata
+                )
+            return {
+                "gse_meta_dict": file_gse_content_dict,
+                "gsm_metadata": gsm_metadata,
+                "gsm_multi_table": gsm_multi_table,
+                "runs": runs,
+                "run_sizes": {
+                    line["Run"]: run_size_mb(line.get("size_MB"))
+                    for line in srp_list_result
+                },
+            }
+        except Exception as e:
+            _LOGGER.warning(f"Couldn't process {acc_GSE}: {e}", exc_info=True)
+            return None
+
+    def _soft_file_path(self, acc_GSE: str, typename: str) -> str:
+        """
+        Get path to the soft file of accession in metadata folder
+
+        :param acc_GSE: GSE accession
+        :param typename: type of the soft file: GSE or GSM
+        :return: path to the soft file
+        """
+        return os.path.join(self.metadata_expanded, f"{acc_GSE}_{typename}.soft")
+
+    def _get_soft_content(
+        self, acc_GSE: str, typename: str, file_path: str, stream: bool = False
+    ) -> Union[list, Iterator[str]]:
+        """
+        Get content of GSE or GSM soft file. Content is taken from metadata that was
+        prefetched (e.g. by get_projects_async), from the previously saved file, or
+        is downloaded from GEO.
+
+        :param acc_GSE: GSE accession
+        :param typename: type of the soft file: GSE or GSM
+        :param file_path: path where soft file is saved
+        :param stream: if True, lazy iterator of lines is returned instead of list,
+            so the soft file is never held in memory as a whole. It can be consumed only once.
+        :return: lines of the soft file
+        """
+        prefetched = self._prefetched.pop((typename, acc_GSE), None)
+        if prefetched is None and self._metadata_window is not None:
+            prefetched = self._metadata_window.take(acc_GSE, typename)
+        if prefetched is not None:
+            return prefetched
+
+        if not os.path.isfile(file_path) or self.refresh_metadata:
+            content = Accession(acc_GSE).stream_metadata(
+                file_path,
+                typename=typename,
+                clean=self.discard_soft,
+                max_soft_size=self.max_soft_size,
+                client=self.client,
+                cache=self.cache,
+            )
+        else:
+            _LOGGER.info(f"Found previous {typename} file: {file_path}")
+            content = iter_soft_file(file_path)
+        return content if stream else list(content)
+
     def _process_sra_meta(
         self,
         srp_list_result: list = None,
@@ -665,11 +1172,78 @@ class Geofetcher:
 
         return gsm_multi_table, gsm_metadata, runs
 
-    def _download_raw_data(self, run_name: str) -> NoReturn:
+    def _download_raw_runs(
+        self,
+        acc_GSE: str,
+        runs: list,
+        run_sizes: dict = None,
+        conversion_pool: Executor = None,
+    ) -> Dict[str, int]:
+        """
+        Download raw data of runs from SRA, running few prefetch processes at the same time,
+        and convert them to bam files (if requested). Each run is converted as soon as it is
+        downloaded, in conversion_pool, so conversion overlaps with download of next runs.
+
+        :param acc_GSE: GSE accession the runs belong to
+        :param runs: list of SRR numbers
+        :param run_sizes: dict of SRR numbers and sizes of runs in MB, from SRA run info [Optional]
+        :param conversion_pool: executor where runs are converted. If not provided, new pool of
+            convert_jobs workers is used and all conversions are finished before return [Optional]
+        :return: dict of runs that couldn't be downloaded and return codes of prefetch
+        """
+        run_sizes = run_sizes or {}
+        to_download = []
+        for run_name in runs:
+            _LOGGER.info(f"Getting SRR: {run_name}  in ({acc_GSE})")
+            if not self._raw_data_exists(run_name):
+                to_download.append((run_name, run_sizes.get(run_name)))
+
+        if not (self.bam_conversion and self.bam_folder != ""):
+            failed = self.prefetch_scheduler.run(to_download)
+        elif conversion_pool is None:
+            with ThreadPoolExecutor(max_workers=self.convert_jobs) as conversion_pool:
+                failed = self.prefetch_scheduler.run(
+                    to_download,
+                    on_done=partial(self._submit_conversion, conversion_pool),
+                )
+        else:
+            failed = self.prefetch_scheduler.run(
+                to_download,
+                on_done=partial(self._submit_conversion, conversion_pool),
+            )
+
+        if failed:
+            _LOGGER.warning(
+                f"Error occurred while downloading SRA files of {acc_GSE}: "
+                f"{', '.join(failed)}"
+            )
+        return failed
+
+    def _submit_conversion(self, conversion_pool: Executor, run_name: str) -> Future:
+        """
+        Start conversion of downloaded run in the background
+
+        :param conversion_pool: executor where run is converted
+        :param run_name: Run name from SRA
+        :return: future of the conversion
+        """
+        future = conversion_pool.submit(self._convert_raw_data, run_name)
+
+        def report_error(done: Future):
+            if done.exception() is not None:
+                _LOGGER.warning(
+                    f"Error occurred while converting {run_name}: {done.exception()}"
+                )
+
+        future.add_done_callback(report_error)
+        return future
+
+    def _raw_data_exists(self, run_name: str) -> bool:
         """
-        Download raw data from SRA by providing run name
+        Check if run was already converted to bam or fastq file
 
         :param run_name: Run name from SRA
+        :return: True if bam or fastq file of the run exists
         """
         bam_file = (
             ""
@@ -684,46 +1258,48 @@ class Geofetcher:
 
         if os.path.exists(bam_file):
             _LOGGER.info(f"BAM found: {bam_file} . Skipping...")
-        elif os.path.exists(fq_file):
+            return True
+        if os.path.exists(fq_file):
             _LOGGER.info(f"FQ found: {fq_file} .Skipping...")
-        else:
-            try:
-                self._download_SRA_file(run_name)
-            except Exception as err:
-                _LOGGER.warning(f"Error occurred while downloading SRA file: {err}")
+            return True
+        return False
 
-            if self.bam_conversion and self.bam_folder != "":
-                try:
-                    # converting sra to bam using
-                    # TODO: sam-dump has a built-in prefetch. I don't have to do
-                    # any of this stuff... This also solves the bad sam-dump issues.
-                    self._sra_to_bam_conversion_sam_dump(bam_file, run_name)
-
-                    # checking if bam_file converted correctly, if not --> use fastq-dump
-                    st = os.stat(bam_file)
-                    if st.st_size < 100:
-                        _LOGGER.warning(
-                            "Bam conversion failed with sam-dump. Trying fastq-dump..."
-                        )
-                        self._sra_to_bam_conversion_fastq_damp(
-                            bam_file, run_name, self.picard_path
-                        )
-
-                except FileNotFoundError as err:
-                    _LOGGER.info(
-                        f"SRA file doesn't exist, please download it first: {err}"
-                    )
+    def _convert_raw_data(self, run_name: str) -> NoReturn:
+        """
+        Convert downloaded SRA file to bam file
+
+        :param run_name: Run name from SRA
+        """
+        bam_file = os.path.join(self.bam_folder, run_name + ".bam")
+        try:
+            # converting sra to bam using
+            # TODO: sam-dump has a built-in prefetch. I don't have to do
+            # any of this stuff... This also solves the bad sam-dump issues.
+            self._sra_to_bam_conversion_sam_dump(bam_file, run_name)
+
+            # checking if bam_file converted correctly, if not --> use fastq-dump
+            st = os.stat(bam_file)
+            if st.st_size < 100:
+                _LOGGER.warning(
+                    "Bam conversion failed with sam-dump. Trying fastq-dump..."
+                )
+                self._sra_to_bam_conversion_fastq_damp(
+                    bam_file, run_name, self.picard_path
+                )
+
+        except FileNotFoundError as err:
+            _LOGGER.info(f"SRA file doesn't exist, please download it first: {err}")
 
     def fetch_processed_one(
         self,
-        gse_file_content: list,
-        gsm_file_content: list,
+        gse_file_content: Union[SoftDocument, list],
+        gsm_file_content: Union[SoftDocument, list],
         gsm_filter_list: dict,
     ) -> Tuple:
         """
         Fetche one processed GSE project and return its metadata
-        :param gsm_file_content: gse soft file content
-        :param gse_file_content: gsm soft file content
+        :param gsm_file_content: gse soft file content (parsed or list of lines)
+        :param gse_file_content: gsm soft file content (parsed or list of lines)
         :param gsm_filter_list: list of gsm that have to be downloaded
         :return: Tuple of project list of gsm samples and gse samples
         """
@@ -824,41 +1400,45 @@ class Geofetcher:
         self, acc_gse: str, meta_processed_samples: list, meta_processed_series: list
     ) -> NoReturn:
         """
-        Download processed data from GEO by providing project annotation list
+        Download processed data from GEO by providing project annotation list.
+        Files are downloaded concurrently, files that couldn't be downloaded are reported.
         :param acc_gse: accession number of the project
         :param meta_processed_samples: list of annotation of samples
         :param meta_processed_series: list of annotation of series
         :return: Noreturn
         """
+        if not self.geo_folder:
+            _LOGGER.error("You must provide a geo_folder to download processed data.")
+            sys.exit(1)
+
         data_geo_folder = os.path.join(self.geo_folder, acc_gse)
         _LOGGER.debug("Data folder: " + data_geo_folder)
 
-        if self.supp_by == "all":
-            processed_samples_files = [
-                each_file["file_url"] for each_file in meta_processed_samples
-            ]
-            for file_url in processed_samples_files:
-                self._download_processed_file(file_url, data_geo_folder)
-
-            processed_series_files = [
-                each_file["file_url"] for each_file in meta_processed_series
-            ]
-            for file_url in processed_series_files:
-                self._download_processed_file(file_url, data_geo_folder)
-
-        elif self.supp_by == "samples":
-            processed_samples_files = [
-                each_file["file_url"] for each_file in meta_processed_samples
-            ]
-            for file_url in processed_samples_files:
-                self._download_processed_file(file_url, data_geo_folder)
-
-        elif self.supp_by == "series":
-            processed_series_files = [
-                each_file["file_url"] for each_file in meta_processed_series
-            ]
-            for file_url in processed_series_files:
-                self._download_processed_file(file_url, data_geo_folder)
+        processed_files = []
+        if self.supp_by in ["all", "samples"]:
+            processed_files.extend(meta_processed_samples)
+        if self.supp_by in ["all", "series"]:
+            processed_files.extend(meta_processed_series)
+
+        # sizes of sample files are known from filelist.txt, downloads are verified against them
+        failed = self.downloader.download_many(
+            [
+                (
+                    each_file["file_url"],
+                    os.path.join(
+                        data_geo_folder, os.path.basename(each_file["file_url"])
+                    ),
+                    _file_size(each_file),
+                )
+                for each_file in processed_files
+            ],
+            disable_progressbar=self.disable_progressbar,
+        )
+        if failed:
+            _LOGGER.error(
+                f"\033[91m{len(failed)} of {len(processed_files)} files of {acc_gse} "
+                f"couldn't be downloaded: {', '.join(failed)}\033[0m"
+            )
 
     def _expand_metadata_dict(self, metadata_dict: dict) -> dict:
         """
@@ -874,116 +1454,15 @@ class Geofetcher:
     def _expand_metadata_list(self, metadata_list: list) -> list:
         """
         Expanding all lists of all items in the list by creating new items or joining them
-
-        :param list metadata_list: list of dicts that store metadata
-        :return list: expanded metadata list
-        """
-        _LOGGER.info("Expanding metadata list...")
-        list_of_keys = _get_list_of_keys(metadata_list)
-        for key_in_list in list_of_keys:
-            if key_in_list == "Sample_characteristics_ch1":
-                pass
-            metadata_list = self._expand_metadata_list_item(metadata_list, key_in_list)
-        return metadata_list
-
-    def _expand_metadata_list_item(self, metadata_list: list, dict_key: str):
-        """
-        Expand list of one element (item) in the list by creating new items or joining them
         ["first1: fff", ...] -> separate columns
 
         :param list metadata_list: list of dicts that store metadata
-        :param str dict_key: key in the dictionaries that have to be expanded
         :return list: expanded metadata list
         """
+        _LOGGER.info("Expanding metadata list...")
         try:
-            element_is_list = any(
-                isinstance(list_item.get(dict_key), list)
-                or (
-                    len(list_item.get(dict_key).split(": ")) == 2
-                    if list_item.get(dict_key)
-                    else False
-                )
-                for list_item in metadata_list
-            )
-
-            # # checking if some items have two keys:
-            # # This code should deal with strings with few keys. e.g. "key1: key2: value"
-            # if not element_is_list:
-            #     if any(
-            #         (len(list_item.get(dict_key).split(": ")) > 0)
-            #         for list_item in metadata_list
-            #     ):
-            #         element_is_list = True
-
-            if element_is_list:
-                for n_elem in range(len(metadata_list)):
-                    try:
-                        if not isinstance(metadata_list[n_elem][dict_key], list):
-                            metadata_list[n_elem][dict_key] = [
-                                metadata_list[n_elem][dict_key]
-                            ]
-                        else:
-                            pass
-
-                        just_string = False
-                        this_string = ""
-                        for elem in metadata_list[n_elem][dict_key]:
-                            separated_elements = elem.split(": ")
-                            if len(separated_elements) >= 2:
-                                # if first element is larger than 40 then treat it like simple string
-                                if len(separated_elements[0]) > 40:
-                                    just_string = True
-                                    if this_string != "":
-                                        this_string = ", ".join([this_string, elem])
-                                    else:
-                                        this_string = elem
-                                # additional elem for all bed files
-                                elif len(separated_elements[0].split("(")) > 1:
-                                    just_string = True
-                                    if this_string != "":
-                                        this_string = "(".join([this_string, elem])
-                                    else:
-                                        this_string = elem
-                                else:
-                                    list_of_elem = [
-                                        separated_elements[0],
-                                        ": ".join(separated_elements[1:]),
-                                    ]
-                                    sample_char = dict([list_of_elem])
-                                    for samp_key, samp_val in sample_char.items():
-                                        if samp_key not in metadata_list[n_elem]:
-                                            metadata_list[n_elem][samp_key] = samp_val
-                                        else:
-                                            metadata_list[n_elem][samp_key] = ". ".join(
-                                                [
-                                                    str(metadata_list[n_elem][samp_key])
-                                                    + samp_val
-                                                ]
-                                            )
-                                    # metadata_list[n_elem].update(sample_char)
-                            else:
-                                just_string = True
-                                if this_string != "":
-                                    this_string = ", ".join([this_string, elem])
-                                else:
-                                    this_string = elem
-
-                        if just_string:
-                            metadata_list[n_elem][dict_key] = this_string
-                        else:
-                            del metadata_list[n_elem][dict_key]
-                    except KeyError:
-                        # _LOGGER.warning(
-                        #     f"expand_metadata_list: Key Error: {err}, continuing ..."
-                        # )
-                        pass
-
-                return metadata_list
-            else:
-                _LOGGER.debug(
-                    f"Metadata with {dict_key} was not expanded, as item is not list"
-                )
-                return metadata_list
+            with self.report.span("expand_metadata"):
+                return _expand_metadata_columns(metadata_list)
         except KeyError as err:
             _LOGGER.warning(f"expand_metadata_list: Key Error: {err}")
             return metadata_list
@@ -1007,6 +1486,8 @@ class Geofetcher:
             w.writeheader()
             for item in gsm_metadata:
                 w.writerow(gsm_metadata[item])
+        if self.output_format == "parquet":
+            self._write_parquet(gsm_metadata.values(), self._parquet_path(fp), keys)
         _LOGGER.info(
             f"\033[92mSample annotation sheet: {file_annotation} . Saved!\033[0m"
         )
@@ -1049,29 +1530,37 @@ class Geofetcher:
         processed_metadata = self._find_genome(processed_metadata)
 
         # filtering huge annotation strings that are repeating for each sample
-        processed_metadata, proj_meta = self._separate_common_meta(
-            processed_metadata,
-            self.const_limit_project,
-            self.const_limit_discard,
-            self.attr_limit_truncate,
-        )
-
-        template = self._create_config_processed(
-            file_annotation_path, proj_meta, meta_in_series=gse_meta_dict
-        )
+        with self.report.span("separate_common_meta"):
+            processed_metadata, proj_meta = self._separate_common_meta(
+                processed_metadata,
+                self.const_limit_project,
+                self.const_limit_discard,
+                self.attr_limit_truncate,
+            )
 
         if not just_object:
+            template = self._create_config_processed(
+                file_annotation_path, proj_meta, meta_in_series=gse_meta_dict
+            )
             with open(file_annotation_path, "w", encoding="utf-8") as m_file:
                 dict_writer = csv.DictWriter(m_file, processed_metadata[0].keys())
                 dict_writer.writeheader()
                 dict_writer.writerows(processed_metadata)
+            if self.output_format == "parquet":
+                self._write_parquet(
+                    processed_metadata,
+                    self._parquet_path(file_annotation_path),
+                    list(processed_metadata[0].keys()),
+                )
             _LOGGER.info(
                 "\033[92mFile %s has been saved successfully\033[0m"
                 % file_annotation_path
             )
 
             # save .yaml file
-            yaml_name = os.path.split(file_annotation_path)[1][:-4] + ".yaml"
+            yaml_name = (
+                os.path.splitext(os.path.split(file_annotation_path)[1])[0] + ".yaml"
+            )
             config = os.path.join(pep_file_folder, yaml_name)
             self._write(config, template, msg_pre="  Config file: ")
 
@@ -1085,7 +1574,9 @@ class Geofetcher:
         else:
             pd_value = pd.DataFrame(processed_metadata)
 
-            conf = yaml.load(template, Loader=yaml.Loader)
+            conf = self._create_config_processed_dict(
+                file_annotation_path, proj_meta, meta_in_series=gse_meta_dict
+            )
             proj = peppy.Project().from_pandas(pd_value, config=conf)
             proj_exp_data = conf.get("experiment_metadata")
             if proj_exp_data:
@@ -1160,12 +1651,13 @@ class Geofetcher:
 
         metadata_dict = self._check_sample_name_standard(metadata_dict)
 
-        metadata_dict, proj_meta = self._separate_common_meta(
-            metadata_dict,
-            self.const_limit_project,
-            self.const_limit_discard,
-            self.attr_limit_truncate,
-        )
+        with self.report.span("separate_common_meta"):
+            metadata_dict, proj_meta = self._separate_common_meta(
+                metadata_dict,
+                self.const_limit_project,
+                self.const_limit_discard,
+                self.attr_limit_truncate,
+            )
 
         # Write combined subannotation table
         if len(subannot_dict) > 0:
@@ -1175,11 +1667,10 @@ class Geofetcher:
         else:
             subanot_path_yaml = ""
 
-        template = self._create_config_raw(
-            proj_meta, proj_root_sample, subanot_path_yaml, gse_meta_dict
-        )
-
         if not self.just_object:
+            template = self._create_config_raw(
+                proj_meta, proj_root_sample, subanot_path_yaml, gse_meta_dict
+            )
             self._write_gsm_annotation(metadata_dict, proj_root_sample)
 
             if len(subannot_dict) > 0:
@@ -1223,7 +1714,10 @@ class Geofetcher:
                 )
 
         else:
-            meta_df = pd.DataFrame.from_dict(metadata_dict, orient="index")
+            # records are much faster to convert than dict of dicts (orient="index")
+            meta_df = pd.DataFrame(
+                list(metadata_dict.values()), index=list(metadata_dict.keys())
+            )
 
             # open list:
             new_sub_list = []
@@ -1238,7 +1732,12 @@ class Geofetcher:
                 sub_meta_df = None
             else:
                 sub_meta_df = [sub_meta_df]
-            conf = yaml.load(template, Loader=yaml.Loader)
+            conf = self._create_config_raw_dict(
+                proj_meta,
+                proj_root_sample,
+                proj_root_subsample if len(subannot_dict) > 0 else None,
+                gse_meta_dict,
+            )
 
             proj = peppy.Project().from_pandas(meta_df, sub_meta_df, conf)
             proj_exp_data = conf.get("experiment_metadata")
@@ -1357,6 +1856,124 @@ class Geofetcher:
 
         return template
 
+    def _create_config_processed_dict(
+        self,
+        file_annotation_path: str,
+        proj_meta: list,
+        meta_in_series: dict = None,
+    ) -> dict:
+        """
+        Compose config of processed data project, without rendering and loading
+        config file. Result is equal to loaded output of _create_config_processed
+
+        :param file_annotation_path: root to the annotation file
+        :param proj_meta: common metadata that has to added to config
+        :param meta_in_series: dict of experiment metadata
+        :return: project config
+        """
+        config = {
+            "pep_version": "2.1.0",
+            "project_name": _yaml_plain_scalar(self.project_name),
+            "sample_table": _yaml_plain_scalar(os.path.basename(file_annotation_path)),
+        }
+        if meta_in_series:
+            config.update(_yaml_dumped(meta_in_series))
+        config["sample_modifiers"] = {
+            "append": {
+                "output_file_path": "FILES",
+                **self._config_appended_columns(proj_meta),
+            },
+            "derive": {
+                "attributes": ["output_file_path"],
+                "sources": {
+                    "FILES": _yaml_plain_scalar(f"{self.geo_folder}/{{gse}}/{{file}}")
+                },
+            },
+        }
+        config.update(self._config_looper())
+        return config
+
+    def _create_config_raw_dict(
+        self,
+        proj_meta: list,
+        proj_root_sample: str,
+        proj_root_subsample: str = None,
+        meta_in_series: dict = None,
+    ) -> dict:
+        """
+        Compose config of raw data project, without rendering and loading
+        config file. Result is equal to loaded output of _create_config_raw.
+        Config is rendered from template, if custom template was specified
+
+        :param proj_meta: common metadata that has to added to config
+        :param proj_root_sample: path to sampletable file
+        :param proj_root_subsample: path to subannotation file, if project has one
+        :param meta_in_series: dict of experiment metadata
+        :return: project config
+        """
+        geofetchdir = os.path.dirname(__file__)
+        default_template = os.path.join(
+            geofetchdir, TEMPLATES_DIR, CONFIG_RAW_TEMPLATE_NAME
+        )
+        append = self._config_appended_columns(proj_meta)
+        if self.config_template not in (None, default_template) or (
+            self.add_convert_modifier and not append
+        ):
+            subanot_path_yaml = (
+                f"subsample_table: {os.path.basename(proj_root_subsample)}"
+                if proj_root_subsample
+                else ""
+            )
+            template = self._create_config_raw(
+                proj_meta, proj_root_sample, subanot_path_yaml, meta_in_series
+            )
+            return yaml.load(template, Loader=yaml.Loader)
+
+        config = {
+            "name": _yaml_plain_scalar(self.project_name),
+            "pep_version": "2.1.0",
+            "sample_table": _yaml_plain_scalar(os.path.basename(proj_root_sample)),
+        }
+        if meta_in_series:
+            config.update(_yaml_dumped(meta_in_series))
+        if proj_root_subsample:
+            config["subsample_table"] = _yaml_plain_scalar(
+                os.path.basename(proj_root_subsample)
+            )
+        if append:
+            sample_modifiers = {"append": append}
+            if self.add_convert_modifier:
+                sra_convert = _load_sra_convert_modifiers()
+                append.update(sra_convert.pop("append"))
+                sample_modifiers.update(sra_convert)
+            config["sample_modifiers"] = sample_modifiers
+        config.update(self._config_looper())
+        return config
+
+    def _config_appended_columns(self, proj_meta: list) -> dict:
+        """
+        :param proj_meta: common metadata that has to added to config
+        :return: columns appended to all samples: common metadata and pipeline interfaces
+        """
+        append = {
+            _yaml_plain_scalar(key, is_key=True): _yaml_quoted_scalar(value)
+            for meta in proj_meta
+            for key, value in meta.items()
+        }
+        if self.pipeline_samples:
+            append["pipeline_interfaces"] = _yaml_plain_scalar(self.pipeline_samples)
+        return append
+
+    def _config_looper(self) -> dict:
+        """
+        :return: looper section of project config, if project pipeline interface was specified
+        """
+        if not self.pipeline_project:
+            return {}
+        return {
+            "looper": {"pipeline_interfaces": _yaml_plain_scalar(self.pipeline_project)}
+        }
+
     @staticmethod
     def _check_sample_name_standard(metadata_dict: dict) -> dict:
         """
@@ -1404,52 +2021,47 @@ class Geofetcher:
             input_is_dict = True
             meta_list = _dict_to_list_converter(proj_dict=meta_list)
 
-        list_of_keys = _get_list_of_keys(meta_list)
-        list_keys_diff = []
-        # finding columns with common values
-        for this_key in list_of_keys:
-            value = ""
-            for nb_sample in enumerate(meta_list):
-                try:
-                    if nb_sample[0] == 0:
-                        value = meta_list[nb_sample[0]][this_key]
-                        if len(str(value)) < max_len and len(str(value)) < del_limit:
-                            list_keys_diff.append(this_key)
-                            break
-                    else:
-                        if value != meta_list[nb_sample[0]][this_key]:
-                            list_keys_diff.append(this_key)
-                            break
-                except KeyError:
-                    pass
-
-        list_keys_diff = set(list_keys_diff)
+        # collecting values of each key (column) in one pass over samples
+        columns = {key: [] for key in _get_list_of_keys(meta_list)}
+        for sample in meta_list:
+            for key, value in sample.items():
+                columns[key].append(value)
 
-        # separating sample and common metadata and creating 2 lists
+        # finding columns with common values, that are separated from sample metadata.
+        # Values are compared with value of the first sample. Column, that is
+        # missing in the first sample, is common only if it's empty in all samples
+        common_keys = set()
         new_meta_project = []
-        for this_key in list_of_keys:
-            first_key = True
-            for nb_sample in enumerate(meta_list):
-                try:
-                    if this_key not in list_keys_diff:
-                        if first_key:
-                            if len(str(nb_sample[1][this_key])) <= del_limit:
-                                new_str = nb_sample[1][this_key]
-                                if isinstance(nb_sample[1][this_key], str):
-                                    new_str = nb_sample[1][this_key].replace('"', "")
-                                    # new_str = re.sub("[^A-Za-z0-9]+", " ", new_str)
-                                new_meta_project.append({this_key: new_str})
-                            first_key = False
-                        del meta_list[nb_sample[0]][this_key]
-                except KeyError:
-                    pass
-
-        # Truncate huge information in metadata
+        for this_key, values in columns.items():
+            if meta_list and this_key in meta_list[0]:
+                value = values[0]
+                other_values = values[1:]
+                if len(str(value)) < max_len and len(str(value)) < del_limit:
+                    continue
+            else:
+                value = ""
+                other_values = values
+            if any(value != other_value for other_value in other_values):
+                continue
+
+            common_keys.add(this_key)
+            if values and len(str(values[0])) <= del_limit:
+                new_str = values[0]
+                if isinstance(new_str, str):
+                    new_str = new_str.replace('"', "")
+                new_meta_project.append({this_key: new_str})
+
+        # separating sample metadata and truncating huge information in it
         new_list = []
         for this_item in meta_list:
             new_item_list = {}
             for key, value in this_item.items():
-                if len(str(value)) < attr_limit_truncate:
+                if key in common_keys:
+                    continue
+                if (
+                    len(value if isinstance(value, str) else str(value))
+                    < attr_limit_truncate
+                ):
                     new_item_list[key] = value
                 else:
                     new_item_list[key] = value[0:attr_limit_truncate] + " ..."
@@ -1461,33 +2073,6 @@ class Geofetcher:
             meta_list = _dict_to_list_converter(proj_list=meta_list)
         return meta_list, new_meta_project
 
-    def _download_SRA_file(self, run_name: str):
-        """
-        Download SRA file by ising 'prefetch' utility from the SRA Toolkit
-        more info: (http://www.ncbi.nlm.nih.gov/books/NBK242621/)
-
-        :param str run_name: SRR number of the SRA file
-        """
-
-        # Set up a simple loop to try a few times in case of failure
-        t = 0
-        while True:
-            t = t + 1
-            subprocess_return = run_subprocess(
-                build_prefetch_command(run_id=run_name, max_size=self.max_prefetch_size)
-            )
-
-            if subprocess_return == 0:
-                break
-
-            if t >= NUM_RETRIES:
-                raise RuntimeError(
-                    f"Prefetch retries of {run_name} failed. Try this sample later"
-                )
-
-            _LOGGER.info("Prefetch attempt failed, wait a few seconds to try again")
-            time.sleep(t * 2)
-
     def _sra_to_bam_conversion_sam_dump(self, bam_file: str, run_name: str) -> NoReturn:
         """
         Convert SRA file to BAM file by using samtools function "sam-dump"
@@ -1571,26 +2156,65 @@ class Geofetcher:
         _LOGGER.info(f"Sample subannotation sheet: {filepath}")
         fp = expandpath(filepath)
         _LOGGER.info(f"Writing: {fp}")
+        if not isinstance(tabular_data, list):
+            tabular_data = [tabular_data]
         with open(fp, "w") as openfile:
             writer = csv.writer(openfile, delimiter=",")
             # write header
             writer.writerow(column_names or ["sample_name", "SRX", "SRR"])
-            if not isinstance(tabular_data, list):
-                tabular_data = [tabular_data]
             for table in tabular_data:
                 for key, values in table.items():
                     _LOGGER.debug(f"{key}: {values}")
                     writer.writerows(values)
+        if self.output_format == "parquet":
+            self._write_parquet(
+                (
+                    row
+                    for table in tabular_data
+                    for rows in table.values()
+                    for row in rows
+                ),
+                self._parquet_path(fp),
+                column_names or ["sample_name", "SRX", "SRR"],
+            )
         return fp
 
+    @staticmethod
+    def _parquet_path(file_path: str) -> str:
+        """
+        :param file_path: path of csv sample or subsample table
+        :return: path of Parquet copy of the table, written next to it
+        """
+        return os.path.splitext(file_path)[0] + PARQUET_SUFFIX
+
+    @staticmethod
+    def _write_parquet(
+        rows: Iterable[Union[dict, list]], file_path: str, columns: list
+    ) -> str:
+        """
+        Write table to compressed Apache Parquet file. Columns keep types of values
+        (strings, numbers), columns with values of mixed types are saved as strings.
+
+        :param rows: dicts (missing keys are saved as nulls, other keys are ignored)
+            or lists of values
+        :param file_path: path to the file to write
+        :param columns: names of columns
+        :return str: path to file written
+        """
+        table = pd.DataFrame(list(rows), columns=columns)
+        for column in table.columns[table.dtypes == object]:
+            values = table[column]
+            table[column] = values.where(values.isna(), values.astype(str))
+        table.to_parquet(file_path, index=False, compression=PARQUET_COMPRESSION)
+        return file_path
+
     def _download_file(
-        self, file_url: str, data_folder: str, new_name: str = None, sleep_after=0.5
+        self, file_url: str, data_folder: str, new_name: str = None
     ) -> NoReturn:
         """
         Given an url for a file, downloading file to specified folder
         :param str file_url: the URL of the file to download
         :param str data_folder: path to the folder where data should be downloaded
-        :param float sleep_after: time to sleep after downloading
         :param str new_name: new file name in the
         """
         filename = os.path.basename(file_url)
@@ -1598,183 +2222,80 @@ class Geofetcher:
             full_filepath = os.path.join(data_folder, filename)
         else:
             full_filepath = os.path.join(data_folder, new_name)
-
-        if not os.path.exists(full_filepath):
-            _LOGGER.info("\033[38;5;242m")  # set color to gray
-            # if dir does not exist:
-            if not os.path.exists(data_folder):
-                os.makedirs(data_folder)
-            ret = run_subprocess(
-                ["wget", "--no-clobber", file_url, "-O", full_filepath]
-            )
-            _LOGGER.info(f"\033[38;5;242m{ret}\033[0m")
-            time.sleep(sleep_after)
-            _LOGGER.info("\033[0m")  # Reset to default terminal color
-        else:
-            _LOGGER.info(f"\033[38;5;242mFile {full_filepath} exists.\033[0m")
+        self.downloader.download(file_url, full_filepath)
 
     def _get_list_of_processed_files(
-        self, file_gse_content: list, file_gsm_content: list
+        self,
+        file_gse_content: Union[SoftDocument, list],
+        file_gsm_content: Union[SoftDocument, list],
     ) -> tuple:
         """
         Given a paths to GSE and GSM metafile create a list of dicts of metadata of processed files
-        :param list file_gse_content: list of lines of gse metafile
-        :param list file_gsm_content: list of lines of gse metafile
+        :param file_gse_content: parsed gse metafile, or list of lines of gse metafile
+        :param file_gsm_content: parsed gsm metafile, or list of lines of gsm metafile
         :return: tuple[list of metadata of processed sample files and series files]
         """
         tar_re = re.compile(r".*\.tar$")
         gse_numb = None
         meta_processed_samples = []
         meta_processed_series = {"GSE": "", "files": []}
-        for line in file_gse_content:
-            if re.compile(r"!Series_geo_accession").search(line):
-                gse_numb = _get_value(line)
-                meta_processed_series["GSE"] = gse_numb
-            found = re.findall(SER_SUPP_FILE_PATTERN, line)
-
-            if found:
-                pl = parse_SOFT_line(line)
-                file_url = pl[list(pl.keys())[0]].rstrip()
-                filename = os.path.basename(file_url)
-                _LOGGER.debug(f"Processed GSE file found: {str(file_url)}")
-
-                # search for tar file:
-                if tar_re.search(filename):
-                    # find and download filelist - file with information about files in tar
-                    index = file_url.rfind("/")
-                    tar_files_list_url = (
-                        "https" + file_url[3 : index + 1] + "filelist.txt"
-                    )
-                    # file_list_name
-                    filelist_path = os.path.join(
-                        self.metadata_expanded, gse_numb + "_file_list.txt"
-                    )
-
-                    if not os.path.isfile(filelist_path) or self.refresh_metadata:
-                        result = requests.get(tar_files_list_url)
-                        if result.ok:
-                            result.encoding = "UTF-8"
-                            filelist_raw_text = result.text
-                            if not self.discard_soft:
-                                try:
-                                    with open(filelist_path, "w") as f:
-                                        f.write(filelist_raw_text)
-                                except OSError:
-                                    _LOGGER.warning(
-                                        f"{filelist_path} not found. File won't be saved.."
-                                    )
-
-                        else:
-                            raise Exception("error in requesting tar_files_list")
+        # information about files in all tar archives of the series
+        file_info_add = None
+        for record in as_soft_document(file_gse_content):
+            # adding metadata to the experiment file
+            if record.entity is not None:
+                add_soft_value(meta_processed_series, record.entity, record.accession)
+            for entry in record.entries:
+                if entry.key == "Series_geo_accession":
+                    gse_numb = _get_value(entry.value)
+                    meta_processed_series["GSE"] = gse_numb
+
+                if SER_SUPP_FILE_PATTERN.search(entry.key):
+                    file_url = entry.value.rstrip()
+                    filename = os.path.basename(file_url)
+                    _LOGGER.debug(f"Processed GSE file found: {str(file_url)}")
+
+                    # search for tar file:
+                    if tar_re.search(filename):
+                        # find and download filelist - file with information about files in tar
+                        filelist_raw_text = self._get_tar_filelist(file_url, gse_numb)
+                        if file_info_add is None:
+                            file_info_add = {}
+                        file_info_add.update(_read_tar_filelist(filelist_raw_text))
+
+                    # other files than .tar: saving them into meta_processed_series list
                     else:
-                        _LOGGER.info(f"Found previous GSM file: {filelist_path}")
-                        filelist_obj = open(filelist_path, "r")
-                        filelist_raw_text = filelist_obj.read()
-
-                    nb = len(meta_processed_samples) - 1
-                    sample_table = False
-                    for line_gsm in file_gsm_content:
-                        # handles #103
-                        if line_gsm == "!sample_table_begin":
-                            sample_table = True
-                        if sample_table:
-                            if line_gsm == "!sample_table_end":
-                                sample_table = False
-                            continue
-
-                        if line_gsm[0] == "^":
-                            nb = len(_check_file_existance(meta_processed_samples))
-                            meta_processed_samples.append(
-                                {"files": [], "GSE": gse_numb}
-                            )
-                        else:
-                            try:
-                                pl = parse_SOFT_line(line_gsm.strip("\n"))
-                            except IndexError:
-                                continue
-                            element_keys = list(pl.keys())[0]
-                            element_values = list(pl.values())[0]
-                            if not re.findall(SUPP_FILE_PATTERN, line_gsm):
-                                if (
-                                    element_keys
-                                    not in meta_processed_samples[nb].keys()
-                                ):
-                                    meta_processed_samples[nb].update(pl)
-                                else:
-                                    if not isinstance(
-                                        meta_processed_samples[nb][element_keys], list
-                                    ):
-                                        meta_processed_samples[nb][element_keys] = [
-                                            meta_processed_samples[nb][element_keys]
-                                        ]
-                                        meta_processed_samples[nb][element_keys].append(
-                                            element_values
-                                        )
-                                    else:
-                                        meta_processed_samples[nb][element_keys].append(
-                                            element_values
-                                        )
-
-                        found_gsm = re.findall(SUPP_FILE_PATTERN, line_gsm)
-
-                        if found_gsm:
-                            pl = parse_SOFT_line(line_gsm)
-                            file_url_gsm = pl[list(pl.keys())[0]].rstrip()
-                            _LOGGER.debug(
-                                f"Processed GSM file found: {str(file_url_gsm)}"
-                            )
-                            if file_url_gsm != "NONE":
-                                meta_processed_samples[nb]["files"].append(file_url_gsm)
+                        meta_processed_series["files"].append(file_url)
 
-                    _check_file_existance(meta_processed_samples)
-                    meta_processed_samples = _separate_list_of_files(
-                        meta_processed_samples
-                    )
-                    meta_processed_samples = _separate_file_url(meta_processed_samples)
+                add_soft_value(meta_processed_series, entry.key, entry.value)
 
-                    _LOGGER.info(
-                        f"\nTotal number of processed SAMPLES files found is: {str(len(meta_processed_samples))}"
-                    )
+        if file_info_add is not None:
+            # samples are parsed only once, no matter how many tar files series has
+            for record in as_soft_document(file_gsm_content):
+                if record.entity is None or not record.supplementary_files:
+                    continue
+                sample = {"files": list(record.supplementary_files), "GSE": gse_numb}
+                for entry in record.entries:
+                    if not SUPP_FILE_PATTERN.search(entry.key):
+                        add_soft_value(sample, entry.key, entry.value)
+                _LOGGER.debug(f"Processed GSM files found: {sample['files']}")
+                meta_processed_samples.append(sample)
 
-                    # expand meta_processed_samples with information about type and size
-                    file_info_add = _read_tar_filelist(filelist_raw_text)
-                    for index_nr in range(len(meta_processed_samples)):
-                        file_name = meta_processed_samples[index_nr]["file"]
-                        meta_processed_samples[index_nr].update(
-                            file_info_add[file_name]
-                        )
-
-                    if self.filter_re:
-                        meta_processed_samples = self._run_filter(
-                            meta_processed_samples
-                        )
-                    if self.filter_size:
-                        meta_processed_samples = self._run_size_filter(
-                            meta_processed_samples
-                        )
-
-                # other files than .tar: saving them into meta_processed_series list
-                else:
-                    meta_processed_series["files"].append(file_url)
+            meta_processed_samples = _separate_list_of_files(meta_processed_samples)
+            meta_processed_samples = _separate_file_url(meta_processed_samples)
 
-            # adding metadata to the experiment file
-            try:
-                bl = parse_SOFT_line(line.rstrip("\n"))
-                bl_key = list(bl.keys())[0]
-                bl_value = list(bl.values())[0]
+            _LOGGER.info(
+                f"\nTotal number of processed SAMPLES files found is: {str(len(meta_processed_samples))}"
+            )
 
-                if bl_key not in meta_processed_series.keys():
-                    meta_processed_series.update(bl)
-                else:
-                    if not isinstance(meta_processed_series[bl_key], list):
-                        meta_processed_series[bl_key] = [meta_processed_series[bl_key]]
-                        meta_processed_series[bl_key].append(bl_value)
-                    else:
-                        meta_processed_series[bl_key].append(bl_value)
-            except IndexError as ind_err:
-                _LOGGER.debug(
-                    f"IndexError in adding value to meta_processed_series: {ind_err}"
-                )
+            # expand meta_processed_samples with information about type and size
+            for sample in meta_processed_samples:
+                sample.update(file_info_add[sample["file"]])
+
+            if self.filter_re:
+                meta_processed_samples = self._run_filter(meta_processed_samples)
+            if self.filter_size:
+                meta_processed_samples = self._run_size_filter(meta_processed_samples)
 
         meta_processed_series = _separate_list_of_files(meta_processed_series)
         meta_processed_series = _separate_file_url(meta_processed_series)
@@ -1787,6 +2308,43 @@ class Geofetcher:
 
         return meta_processed_samples, meta_processed_series
 
+    def _get_tar_filelist(self, file_url: str, gse_numb: str) -> str:
+        """
+        Get filelist - file with information about files in tar archive of the series
+        :param file_url: url of the tar file
+        :param gse_numb: GSE accession
+        :return: raw text of the filelist
+        """
+        index = file_url.rfind("/")
+        tar_files_list_url = "https" + file_url[3 : index + 1] + "filelist.txt"
+        # file_list_name
+        filelist_path = os.path.join(
+            self.metadata_expanded, gse_numb + "_file_list.txt"
+        )
+
+        if not os.path.isfile(filelist_path) or self.refresh_metadata:
+            if self.cache is not None:
+                filelist_raw_text = self.cache.fetch(
+                    tar_files_list_url, gse_numb, "filelist", client=self.client
+                )
+            else:
+                result = self.client.get(tar_files_list_url)
+                if not result.ok:
+                    raise Exception("error in requesting tar_files_list")
+                result.encoding = "UTF-8"
+                filelist_raw_text = result.text
+            if not self.discard_soft:
+                try:
+                    with open(filelist_path, "w") as f:
+                        f.write(filelist_raw_text)
+                except OSError:
+                    _LOGGER.warning(f"{filelist_path} not found. File won't be saved..")
+        else:
+            _LOGGER.info(f"Found previous GSM file: {filelist_path}")
+            with open(filelist_path, "r") as filelist_obj:
+                filelist_raw_text = filelist_obj.read()
+        return filelist_raw_text
+
     def _run_filter(self, meta_list: list, col_name: str = "file") -> list:
         """
         Filters files and metadata using Regular expression filter
@@ -1842,51 +2400,29 @@ class Geofetcher:
             sys.exit(1)
 
         filename = os.path.basename(file_url)
-        ntry = 0
+        self._download_file(file_url, data_folder)
+        _LOGGER.info(
+            "\033[92mFile %s has been downloaded successfully\033[0m"
+            % f"{data_folder}/{filename}"
+        )
+        return True
 
-        while ntry < 10:
-            try:
-                self._download_file(file_url, data_folder)
-                _LOGGER.info(
-                    "\033[92mFile %s has been downloaded successfully\033[0m"
-                    % f"{data_folder}/{filename}"
-                )
-                return True
-
-            except IOError as e:
-                if os.name == "nt":
-                    _LOGGER.error(f"{e}")
-                    raise OSError(
-                        "Windows may not have wget command. "
-                        "Check if `wget` command is installed correctly."
-                    )
-                else:
-                    _LOGGER.error(str(e))
-                    # The server times out if we are hitting it too frequently,
-                    # so we should sleep a bit to reduce frequency
-                    sleeptime = (ntry + 1) ** 3
-                    _LOGGER.info(f"Sleeping for {sleeptime} seconds")
-                    time.sleep(sleeptime)
-                    ntry += 1
-                    if ntry > 4:
-                        raise e
-
-    def _get_SRA_meta(self, file_gse_content: list, gsm_metadata, file_sra=None):
+    def _get_SRA_meta(
+        self,
+        file_gse_content: Union[SoftDocument, list],
+        gsm_metadata,
+        file_sra=None,
+    ):
         """
         Parse out the SRA project identifier from the GSE file
 
-        :param list file_gse_content: list of content of file_sde_content
+        :param file_gse_content: parsed gse soft file, or list of content of file_sde_content
         :param dict gsm_metadata: dict of GSM metadata
         :param str file_sra: full path to SRA.csv metafile that has to be downloaded
         """
-        #
-        acc_SRP = None
-        for line in file_gse_content:
-            found = re.findall(PROJECT_PATTERN, line)
-            if found:
-                acc_SRP = found[0]
-                _LOGGER.info(f"Found SRA Project accession: {acc_SRP}")
-                break
+        acc_SRP = as_soft_document(file_gse_content).srp
+        if acc_SRP:
+            _LOGGER.info(f"Found SRA Project accession: {acc_SRP}")
 
         if not acc_SRP:
             # If I can't get an SRA accession, maybe raw data wasn't submitted to SRA
@@ -1966,133 +2502,67 @@ class Geofetcher:
         :param str srp_number: SRP number
         :return: list of dicts of SRRs
         """
-        if not srp_number:
-            _LOGGER.info("No srp number in this accession found")
-            return []
-        _LOGGER.info(f"Downloading {srp_number} sra metadata")
-        ncbi_esearch = NCBI_ESEARCH.format(SRP_NUMBER=srp_number)
-
-        # searching ids responding to srp
-        x = requests.post(ncbi_esearch)
-
-        if x.status_code != 200:
-            x.encoding = "UTF-8"
-            _LOGGER.error(f"Error in ncbi esearch response: {x.status_code}")
-            raise x.raise_for_status()
-        id_results = x.json()["esearchresult"]["idlist"]
-        if len(id_results) > 500:
-            id_results = [
-                id_results[x : x + 100] for x in range(0, len(id_results), 100)
-            ]
-        else:
-            id_results = [id_results]
-
-        SRP_list = []
-        for result in id_results:
-            id_r_string = ",".join(result)
-            id_api = NCBI_EFETCH.format(ID=id_r_string)
-
-            y = requests.get(id_api)
-            if y.status_code != 200:
-                _LOGGER.error(
-                    f"Error in ncbi efetch response in SRA fetching: {x.status_code}"
-                )
-                raise y.raise_for_status()
-            xml_result = y.text
-            SRP_list.extend(xmltodict.parse(xml_result)["SraRunInfo"]["Row"])
-
-        return SRP_list
+        prefetched = self._prefetched.pop(("SRA", srp_number), None)
+        if prefetched is not None:
+            return prefetched
+        return fetch_sra_runinfo(
+            srp_number,
+            client=self.client,
+            cache=self.cache,
+            page_size=self.sra_page_size,
+        )
 
     def _read_gsm_metadata(
-        self, acc_GSE: str, acc_GSE_list: dict, file_gsm_content: list
+        self,
+        acc_GSE: str,
+        acc_GSE_list: dict,
+        file_gsm_content: Union[SoftDocument, Iterable[str]],
     ) -> dict:
         """
-        A simple state machine to parse SOFT formatted files (Here, the GSM file)
+        Collect experiment information of samples from parsed GSM soft file
 
         :param str acc_GSE: GSE number (Series accession)
         :param dict acc_GSE_list: list of GSE
-        :param list file_gsm_content: list of contents of gsm file
+        :param file_gsm_content: parsed gsm soft file, or lines of gsm file
         :return dict: dictionary of experiment information (gsm_metadata)
         """
         gsm_metadata = {}
 
         # Get GSM#s (away from sample_name)
         GSM_limit_list = list(acc_GSE_list[acc_GSE].keys())
-
-        # save the state
-        current_sample_id = None
-        current_sample_srx = False
         samples_list = []
-        sample_table = False
-
-        for line in file_gsm_content:
-            # handles #103
-            if line == "!sample_table_begin":
-                sample_table = True
-            if sample_table:
-                if line == "!sample_table_end":
-                    sample_table = False
-                continue
 
-            line = line.rstrip()
-            if len(line) == 0:  # Apparently SOFT files can contain blank lines
+        for record in as_soft_document(file_gsm_content):
+            if record.entity is None:
                 continue
-            if line[0] == "^":
-                pl = parse_SOFT_line(line)
-                if (
-                    len(acc_GSE_list[acc_GSE]) > 0
-                    and pl["SAMPLE"] not in GSM_limit_list
-                ):
-                    # sys.stdout.write("  Skipping " + a['SAMPLE'] + ".")
-                    current_sample_id = None
-                    continue
-                current_sample_id = pl["SAMPLE"]
-                current_sample_srx = False
-                gsm_metadata[current_sample_id] = {
-                    "sample_name": "",
-                    "protocol": "",
-                    "organism": "",
-                    "read_type": "",
-                    "data_source": None,
-                    "SRR": None,
-                    "SRX": None,
-                }
-
-                _LOGGER.debug(f"Found sample: {current_sample_id}")
-                samples_list.append(current_sample_id)
-            elif current_sample_id is not None:
-                try:
-                    pl = parse_SOFT_line(line)
-                except IndexError:
-                    _LOGGER.debug(
-                        f"Failed to parse alleged SOFT line for sample ID {current_sample_id}; "
-                        f"line: {line}"
-                    )
-                    continue
-                new_key = list(pl.keys())[0]
-                if new_key in gsm_metadata[current_sample_id]:
-                    if isinstance(gsm_metadata[current_sample_id][new_key], list):
-                        gsm_metadata[current_sample_id][new_key].append(pl[new_key])
-                    else:
-                        gsm_metadata[current_sample_id][new_key] = [
-                            gsm_metadata[current_sample_id][new_key]
-                        ]
-                        gsm_metadata[current_sample_id][new_key].append(pl[new_key])
-                else:
-                    gsm_metadata[current_sample_id].update(pl)
-
-                # Now convert the ids GEO accessions into SRX accessions
-                if not current_sample_srx:
-                    found = re.findall(EXPERIMENT_PATTERN, line)
-                    if found:
-                        _LOGGER.debug(f"(SRX accession: {found[0]})")
-                        srx_id = found[0]
-                        gsm_metadata[srx_id] = gsm_metadata.pop(current_sample_id)
-                        gsm_metadata[srx_id][
-                            "gsm_id"
-                        ] = current_sample_id  # save the GSM id
-                        current_sample_id = srx_id
-                        current_sample_srx = True
+            if (
+                len(acc_GSE_list[acc_GSE]) > 0
+                and record.accession not in GSM_limit_list
+            ):
+                continue
+            sample = {
+                "sample_name": "",
+                "protocol": "",
+                "organism": "",
+                "read_type": "",
+                "data_source": None,
+                "SRR": None,
+                "SRX": None,
+            }
+            _LOGGER.debug(f"Found sample: {record.accession}")
+            samples_list.append(record.accession)
+
+            for index, entry in enumerate(record.entries):
+                add_soft_value(sample, entry.key, entry.value.rstrip())
+                if index == record.srx_index:
+                    sample["gsm_id"] = record.accession  # save the GSM id
+
+            # Now convert the ids GEO accessions into SRX accessions
+            if record.srx:
+                _LOGGER.debug(f"(SRX accession: {record.srx})")
+                gsm_metadata[record.srx] = sample
+            else:
+                gsm_metadata[record.accession] = sample
         # GSM SOFT file parsed, save it in a list
         _LOGGER.info(f"Processed {len(samples_list)} samples.")
         gsm_metadata = self._expand_metadata_dict(gsm_metadata)
@@ -2120,9 +2590,14 @@ class Geofetcher:
                 f.write("\n")
 
 
-def main():
-    """Run the script."""
-    args = _parse_cmdl(sys.argv[1:])
+def main(args: argparse.Namespace = None):
+    """
+    Run the script.
+
+    :param args: parsed command line arguments. Parsed from sys.argv if not provided
+    """
+    if args is None:
+        args = _parse_cmdl(sys.argv[1:])
     args_dict = vars(args)
     args_dict["args"] = args
     Geofetcher(**args_dict).fetch_all(args_dict["input"])
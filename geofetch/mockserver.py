@@ -0,0 +1,329 @@
+"""
+Local stand-in of NCBI servers, for reproducible offline and load testing.
+
+In record mode, requests are forwarded to NCBI and responses are saved in the
+recordings directory. In replay mode, only saved responses are served, without
+any network access. Latency and errors (e.g. 503, or 429 with Retry-After) can
+be injected into responses, to test throughput, concurrency and retries.
+
+geofetch sends requests to the server, if its url is set as NCBI base url:
+    python -m geofetch.mockserver recordings --record
+    geofetch -i GSE67303 --just-metadata --ncbi-base-url http://127.0.0.1:8765
+"""
+
+import hashlib
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+
+from geofetch.cli import _parse_mockserver_cmdl
+from geofetch.const import (
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT,
+    MOCK_ERROR_STATUS,
+    NCBI_HOSTS,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# headers of upstream responses that are recorded
+RECORDED_HEADERS = ("Content-Type", "Content-Length", "Last-Modified", "ETag")
+# query parameters that are not part of recording key
+IGNORED_PARAMS = ("api_key",)
+
+
+def recording_url(path: str) -> str:
+    """
+    :param path: path of the request on the mock server, with query (/host/path?query)
+    :return: original url of the request, without NCBI API key
+    """
+    url = urlsplit(path)
+    query = urlencode(
+        [(k, v) for k, v in parse_qsl(url.query) if k not in IGNORED_PARAMS]
+    )
+    return f"https:/{url.path}" + (f"?{query}" if query else "")
+
+
+def recording_key(method: str, path: str, body: bytes = b"") -> str:
+    """
+    Key of the recorded response. NCBI API key is not part of the key,
+    so responses recorded with a key can be replayed without it.
+
+    :param method: HTTP method
+    :param path: path of the request on the mock server, with query (/host/path?query)
+    :param body: body of the request
+    :return: hex digest identifying the request
+    """
+    digest = hashlib.sha256(f"{method.upper()} {recording_url(path)}\n".encode())
+    digest.update(body or b"")
+    return digest.hexdigest()
+
+
+class MockNCBIServer:
+    """
+    HTTP server, that serves recorded responses of NCBI. Requests are expected
+    with the NCBI host as the first segment of the path, as they are sent by
+    NCBIClient with base_url set to the url of the server.
+    """
+
+    def __init__(
+        self,
+        recordings_dir: str,
+        record: bool = False,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = MOCK_ERROR_STATUS,
+        retry_after: float = None,
+        seed: int = None,
+        session: requests.Session = None,
+    ):
+        """
+        :param recordings_dir: directory of recorded responses
+        :param record: forward requests, that were not recorded yet, to NCBI and record responses
+        :param host: address the server listens on
+        :param port: port the server listens on. Free port is chosen if 0
+        :param latency: delay (in seconds) added to every response
+        :param jitter: max random delay (in seconds) added to latency
+        :param error_rate: fraction of requests (0-1) answered with error_status
+        :param error_status: status code of injected errors, e.g. 503 or 429
+        :param retry_after: value of Retry-After header of injected errors [Optional]
+        :param seed: seed of the random generator of jitter and errors, for reproducible runs [Optional]
+        :param session: session used to forward requests to NCBI in record mode [Optional]
+        """
+        self.recordings_dir = recordings_dir
+        self.record = record
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.session = session or requests.Session()
+        self.stats = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        os.makedirs(recordings_dir, exist_ok=True)
+
+        handler = type("MockNCBIHandler", (_MockNCBIHandler,), {"mock": self})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_port}"
+        self._thread = None
+
+    def respond(
+        self, method: str, path: str, body: bytes = b""
+    ) -> Tuple[int, dict, bytes]:
+        """
+        Get response to the request
+
+        :param method: HTTP method
+        :param path: path of the request, with query (/host/path?query)
+        :param body: body of the request
+        :return: status code, headers and body of the response
+        """
+        with self._lock:
+            self.stats["requests"] += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            inject_error = self._random.random() < self.error_rate
+        if delay > 0:
+            time.sleep(delay)
+        if inject_error:
+            self._count("errors")
+            headers = {}
+            if self.retry_after is not None:
+                headers["Retry-After"] = str(self.retry_after)
+            return self.error_status, headers, b""
+
+        key = recording_key(method, path, body)
+        response = self._load(key)
+        if response is not None:
+            self._count("replayed")
+            return response
+        if self.record:
+            response = self._forward(method, path, body)
+            if response[0] < 500 and response[0] != 429:
+                self._save(key, method, path, response)
+                self._count("recorded")
+            return response
+        self._count("missing")
+        _LOGGER.warning(f"No recorded response: {method} {path}")
+        return 404, {}, f"No recorded response: {method} {path}".encode("utf-8")
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def _forward(
+        self, method: str, path: str, body: bytes = b""
+    ) -> Tuple[int, dict, bytes]:
+        """
+        Send request to NCBI
+
+        :param method: HTTP method
+        :param path: path of the request, with query (/host/path?query)
+        :param body: body of the request
+        :return: status code, headers and body of the response
+        """
+        host = path.lstrip("/").split("/", 1)[0]
+        if host not in NCBI_HOSTS:
+            return 404, {}, f"Unknown NCBI host: {host}".encode("utf-8")
+        response = self.session.request(
+            method,
+            f"https://{path.lstrip('/')}",
+            data=body or None,
+            timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT),
+        )
+        headers = {
+            name: response.headers[name]
+            for name in RECORDED_HEADERS
+            if name in response.headers
+        }
+        content = response.content
+        if method != "HEAD":
+            headers["Content-Length"] = str(len(content))
+        return response.status_code, headers, content
+
+    def _load(self, key: str) -> Tuple[int, dict, bytes]:
+        """
+        :param key: recording key of the request
+        :return: recorded status code, headers and body, or None if request wasn't recorded
+        """
+        meta_path = os.path.join(self.recordings_dir, f"{key}.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        with open(os.path.join(self.recordings_dir, f"{key}.body"), "rb") as f:
+            return meta["status"], meta["headers"], f.read()
+
+    def _save(
+        self, key: str, method: str, path: str, response: Tuple[int, dict, bytes]
+    ) -> None:
+        """
+        Save response. Body is saved before metadata, so response is either
+        recorded completely or not at all.
+
+        :param key: recording key of the request
+        :param method: HTTP method
+        :param path: path of the request, with query (/host/path?query)
+        :param response: status code, headers and body of the response
+        """
+        status, headers, content = response
+        body_path = os.path.join(self.recordings_dir, f"{key}.body")
+        meta_path = os.path.join(self.recordings_dir, f"{key}.json")
+        with open(f"{body_path}.tmp", "wb") as f:
+            f.write(content)
+        os.replace(f"{body_path}.tmp", body_path)
+        with open(f"{meta_path}.tmp", "w") as f:
+            json.dump(
+                {
+                    "method": method,
+                    "url": recording_url(path),
+                    "status": status,
+                    "headers": headers,
+                },
+                f,
+                indent=2,
+            )
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    def start(self) -> "MockNCBIServer":
+        """Start serving in a background thread"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop serving and close the socket"""
+        if self._thread is not None:
+            self.httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class _MockNCBIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    mock = None
+
+    def _respond(self, method: str):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        status, headers, content = self.mock.respond(method, self.path, body)
+        self.send_response(status)
+        for name, value in headers.items():
+            if name != "Content-Length":
+                self.send_header(name, value)
+        self.send_header(
+            "Content-Length",
+            (
+                headers.get("Content-Length", str(len(content)))
+                if method == "HEAD"
+                else str(len(content))
+            ),
+        )
+        self.end_headers()
+        if method != "HEAD":
+            self.wfile.write(content)
+
+    def do_GET(self):
+        self._respond("GET")
+
+    def do_HEAD(self):
+        self._respond("HEAD")
+
+    def do_POST(self):
+        self._respond("POST")
+
+    def log_message(self, format, *args):
+        _LOGGER.debug(format % args)
+
+
+def main():
+    """Run the mock server."""
+    args = _parse_mockserver_cmdl(sys.argv[1:])
+    server = MockNCBIServer(
+        args.recordings,
+        record=args.record,
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    mode = "Recording" if args.record else "Replaying"
+    print(f"{mode} NCBI responses in '{args.recordings}' at {server.url}")
+    print(f"Run geofetch with: --ncbi-base-url {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(f"Served: {dict(server.stats)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""Scheduler running SRA Toolkit 'prefetch' for many runs concurrently."""
+
+import heapq
+import logging
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, Iterable, List, Tuple, Union
+
+from geofetch.const import (
+    NUM_RETRIES,
+    PREFETCH_BACKOFF,
+    PREFETCH_JOBS,
+    PREFETCH_POLL_INTERVAL,
+)
+from geofetch.utils import build_prefetch_command
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def run_size_mb(value: Union[str, float, None]) -> Union[float, None]:
+    """
+    Parse size_MB column of SRA run info
+
+    :param value: value of size_MB column
+    :return: size of the run in MB, None if it is unknown
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class PrefetchJob:
+    """Prefetch of one SRA run"""
+
+    def __init__(self, run_name: str, size_mb: float = None):
+        """
+        :param run_name: SRR number of the run
+        :param size_mb: size of the run in MB, from SRA run info [Optional]
+        """
+        self.run_name = run_name
+        self.size_mb = size_mb or 0
+        self.attempts = 0
+        self.returncode = None
+
+    def __repr__(self):
+        return f"PrefetchJob({self.run_name}, attempts={self.attempts})"
+
+
+class PrefetchScheduler:
+    """
+    Runs up to `jobs` prefetch processes at the same time. Runs are started in
+    the given order, as long as total size of runs being downloaded fits in
+    `budget_mb` (a run larger than the budget is downloaded alone). Failed runs
+    are retried with exponential backoff, without blocking other runs.
+    """
+
+    def __init__(
+        self,
+        jobs: int = PREFETCH_JOBS,
+        budget_mb: float = None,
+        retries: int = NUM_RETRIES,
+        backoff: float = PREFETCH_BACKOFF,
+        max_size: Union[str, int] = None,
+        prefetch_path: str = "prefetch",
+    ):
+        """
+        :param jobs: max number of prefetch processes run at the same time
+        :param budget_mb: max total size (MB) of runs downloaded at the same time [Optional]
+        :param retries: number of attempts of each run
+        :param backoff: delay (seconds) before the second attempt, doubled on every next one
+        :param max_size: argument to prefetch command's --max-size option [Optional]
+        :param prefetch_path: path to prefetch executable
+        """
+        self.jobs = max(1, jobs)
+        self.budget_mb = budget_mb
+        self.retries = max(1, retries)
+        self.backoff = backoff
+        self.max_size = max_size
+        self.prefetch_path = prefetch_path
+
+    def _fits(self, job: PrefetchJob, running: Dict[subprocess.Popen, PrefetchJob]):
+        """
+        :return: True if job can be started next to the running ones
+        """
+        if len(running) >= self.jobs:
+            return False
+        if self.budget_mb is None or not running:
+            return True
+        in_flight = sum(running_job.size_mb for running_job in running.values())
+        return in_flight + job.size_mb <= self.budget_mb
+
+    def _start(self, job: PrefetchJob) -> subprocess.Popen:
+        job.attempts += 1
+        _LOGGER.info(
+            f"Prefetching {job.run_name} (attempt {job.attempts} of {self.retries})"
+        )
+        return subprocess.Popen(
+            build_prefetch_command(
+                run_id=job.run_name,
+                prefetch_path=self.prefetch_path,
+                max_size=self.max_size,
+            )
+        )
+
+    def run(
+        self,
+        runs: Iterable[Union[str, Tuple[str, float]]],
+        on_done: Callable[[str], None] = None,
+    ) -> Dict[str, int]:
+        """
+        Prefetch runs and wait until all of them are downloaded or failed
+
+        :param runs: SRR numbers of runs, or (SRR number, size in MB) tuples
+        :param on_done: function called with SRR number of each successfully downloaded run,
+            as soon as it is downloaded [Optional]
+        :return: dict of SRR numbers of runs that couldn't be downloaded and
+            return codes of their last attempts
+        """
+        pending: List[PrefetchJob] = [
+            PrefetchJob(*run) if isinstance(run, tuple) else PrefetchJob(run)
+            for run in runs
+        ]
+        pending.reverse()  # pop from the end, in input order
+        # heap of (not before, id of job, job)
+        retrying: List[Tuple[float, int, PrefetchJob]] = []
+        running: Dict[subprocess.Popen, PrefetchJob] = {}
+        failed = {}
+
+        try:
+            while pending or retrying or running:
+                now = time.time()
+                while retrying and retrying[0][0] <= now:
+                    pending.append(heapq.heappop(retrying)[2])
+                while pending and self._fits(pending[-1], running):
+                    job = pending.pop()
+                    running[self._start(job)] = job
+
+                time.sleep(PREFETCH_POLL_INTERVAL)
+                for process, job in list(running.items()):
+                    returncode = process.poll()
+                    if returncode is None:
+                        continue
+                    del running[process]
+                    job.returncode = returncode
+                    if returncode == 0:
+                        if on_done is not None:
+                            on_done(job.run_name)
+                    elif job.attempts < self.retries:
+                        delay = self.backoff * 2 ** (job.attempts - 1)
+                        _LOGGER.info(
+                            f"Prefetch of {job.run_name} failed, "
+                            f"trying again in {delay} seconds"
+                        )
+                        heapq.heappush(retrying, (time.time() + delay, id(job), job))
+                    else:
+                        _LOGGER.warning(
+                            f"Prefetch retries of {job.run_name} failed. "
+                            f"Try this sample later"
+                        )
+                        failed[job.run_name] = returncode
+        except KeyboardInterrupt:
+            for process in running:
+                _LOGGER.info(
+                    f"Terminating subprocess: {process.pid} | ({process.args})"
+                )
+                try:
+                    process.terminate()
+                except OSError as ose:
+                    _LOGGER.warning(
+                        f"Exception raised during subprocess termination: {ose}"
+                    )
+            _LOGGER.info("Pipeline aborted.")
+            sys.exit(1)
+
+        return failed
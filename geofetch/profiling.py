@@ -0,0 +1,223 @@
+"""Profiling of geofetch runs with cProfile, pyinstrument or tracemalloc."""
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+
+from geofetch.const import PROFILE_TOP_N, PROFILERS
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# extensions of profile files saved by each profiler
+PROFILE_SUFFIXES = {
+    "cprofile": ".prof",
+    "pyinstrument": ".html",
+    "tracemalloc": ".tracemalloc",
+}
+
+
+class ProfilerException(Exception):
+    """Exception raised, if profiler is not supported or not installed."""
+
+    def __init__(self, msg):
+        super().__init__(msg)
+
+
+def peak_rss() -> int:
+    """
+    :return: peak resident memory (in bytes) of the process, or 0 if it is unknown
+    """
+    if resource is None:
+        return 0
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux, and in bytes on macOS
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+class RunProfiler:
+    """
+    Profiler of one run. Profile is saved in the format of the profiler
+    (.prof for cProfile, loadable with pstats or snakeviz; .html for
+    pyinstrument; .tracemalloc snapshot, loadable with tracemalloc.Snapshot.load),
+    together with a text summary of top hot functions (or allocating lines)
+    and peak memory.
+
+    cProfile and pyinstrument profile only the thread that starts the run, so
+    metadata fetched by workers (workers > 1) is not included in their profiles.
+    tracemalloc traces memory allocated by all threads.
+    """
+
+    def __init__(self, kind: str, file_prefix: str, top_n: int = PROFILE_TOP_N):
+        """
+        :param kind: profiler: cprofile, pyinstrument or tracemalloc
+        :param file_prefix: path of profile files without extension
+        :param top_n: number of hot functions (or allocating lines) in the summary
+        """
+        if kind not in PROFILERS:
+            raise ProfilerException(
+                f"Unsupported profiler: {kind}. Supported profilers: {', '.join(PROFILERS)}"
+            )
+        self.kind = kind
+        self.profile_path = file_prefix + PROFILE_SUFFIXES[kind]
+        self.summary_path = file_prefix + ".txt"
+        self.top_n = top_n
+        self.summary = None
+        self._profiler = None
+        self._start = None
+        # whether tracemalloc was already tracing before the run
+        self._tracing = False
+
+    def start(self) -> None:
+        """Start profiling"""
+        if self.kind == "cprofile":
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.kind == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                raise ProfilerException(
+                    "For pyinstrument profiles, pyinstrument should be installed "
+                    "(pip install geofetch[profile])."
+                )
+            self._profiler = Profiler()
+            self._profiler.start()
+        else:
+            self._tracing = tracemalloc.is_tracing()
+            if not self._tracing:
+                tracemalloc.start(10)
+            tracemalloc.reset_peak()
+        self._start = time.perf_counter()
+
+    def stop(self) -> dict:
+        """
+        Stop profiling, and save the profile and its summary
+
+        :return: summary: profiler, paths of files, duration, peak memory and top hot functions
+        """
+        duration = time.perf_counter() - self._start
+        if self.kind == "cprofile":
+            self._profiler.disable()
+            self._profiler.dump_stats(self.profile_path)
+            top, text = self._cprofile_top()
+            peak_memory = peak_rss()
+        elif self.kind == "pyinstrument":
+            self._profiler.stop()
+            with open(self.profile_path, "w") as f:
+                f.write(self._profiler.output_html())
+            top, text = self._pyinstrument_top()
+            peak_memory = peak_rss()
+        else:
+            snapshot = tracemalloc.take_snapshot()
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            if not self._tracing:
+                tracemalloc.stop()
+            snapshot.dump(self.profile_path)
+            top, text = self._tracemalloc_top(snapshot)
+
+        self.summary = {
+            "profiler": self.kind,
+            "profile": self.profile_path,
+            "summary": self.summary_path,
+            "duration": round(duration, 6),
+            "peak_memory": peak_memory,
+            "top": top,
+        }
+        with open(self.summary_path, "w") as f:
+            f.write(
+                f"Profiler: {self.kind}\n"
+                f"Duration: {duration:.3f}s\n"
+                f"Peak memory: {peak_memory / 1024 ** 2:.1f}MB"
+                f"{' (traced)' if self.kind == 'tracemalloc' else ''}\n\n"
+                f"{text}"
+            )
+        return self.summary
+
+    def _cprofile_top(self) -> tuple:
+        """
+        :return: list of top functions by cumulative time, and their pstats listing
+        """
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profiler, stream=stream)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top_n)
+        top = []
+        for func in stats.fcn_list[: self.top_n]:
+            _, ncalls, tottime, cumtime, _ = stats.stats[func]
+            top.append(
+                {
+                    "function": pstats.func_std_string(func),
+                    "calls": ncalls,
+                    "self": round(tottime, 6),
+                    "cumulative": round(cumtime, 6),
+                }
+            )
+        return top, stream.getvalue()
+
+    def _pyinstrument_top(self) -> tuple:
+        """
+        :return: list of top functions by self time, and the call tree
+        """
+        self_times = {}
+        root = self._profiler.last_session.root_frame()
+        frames = [root] if root is not None else []
+        while frames:
+            frame = frames.pop()
+            # synthetic frames (e.g. [self], [await]) repeat time of their parents
+            if frame.function and not frame.function.startswith("["):
+                key = f"{frame.file_path_short}:{frame.line_no}({frame.function})"
+                self_times[key] = self_times.get(key, 0.0) + frame.total_self_time
+            frames.extend(frame.children)
+        top = [
+            {"function": function, "self": round(self_time, 6)}
+            for function, self_time in sorted(
+                self_times.items(), key=lambda item: item[1], reverse=True
+            )[: self.top_n]
+        ]
+        return top, self._profiler.output_text()
+
+    def _tracemalloc_top(self, snapshot: tracemalloc.Snapshot) -> tuple:
+        """
+        :param snapshot: snapshot of memory allocations at the end of the run
+        :return: list of top lines by allocated memory, and their listing
+        """
+        statistics = snapshot.filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        ).statistics("lineno")[: self.top_n]
+        top = [
+            {
+                "line": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "size": stat.size,
+                "count": stat.count,
+            }
+            for stat in statistics
+        ]
+        return top, "\n".join(str(stat) for stat in statistics) + "\n"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def profile_file_prefix(profile_dir: str, name: str) -> str:
+    """
+    :param profile_dir: directory of profile files. Created, if it doesn't exist
+    :param name: name of the profiled run, e.g. name of the method
+    :return: path of profile files of the run, without extension
+    """
+    os.makedirs(profile_dir, exist_ok=True)
+    now = time.time()
+    stamp = (
+        time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+        + f"-{int(now * 1000) % 1000:03d}"
+    )
+    return os.path.join(profile_dir, f"geofetch_{name}_{stamp}_{os.getpid()}")
@@ -0,0 +1,122 @@
+"""Token bucket rate limiter for NCBI E-utilities requests."""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter. Every request takes one token, tokens are
+    refilled at `rate` tokens per second, up to `burst` tokens.
+
+    If lock_file is provided, the bucket state is stored in this file and
+    guarded by an exclusive file lock, so that all processes using the same
+    lock file share one budget.
+    """
+
+    _shared: Dict[Tuple[float, int, str], "RateLimiter"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, rate: float, burst: int = 1, lock_file: str = None):
+        """
+        :param rate: number of allowed requests per second
+        :param burst: max number of requests that can be sent at once
+        :param lock_file: path to the file used to coordinate rate between processes [Optional]
+        """
+        if rate <= 0:
+            raise ValueError(f"Rate has to be positive, got: {rate}")
+        self.rate = rate
+        self.burst = burst
+        self.lock_file = lock_file
+        if lock_file and fcntl is None:
+            _LOGGER.warning(
+                "File locks are not supported on this platform, "
+                "rate limit will be applied only within this process"
+            )
+            self.lock_file = None
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._timestamp = time.time()
+
+    @classmethod
+    def shared(cls, rate: float, burst: int = 1, lock_file: str = None):
+        """
+        Get rate limiter shared by all callers in this process with the same settings
+
+        :param rate: number of allowed requests per second
+        :param burst: max number of requests that can be sent at once
+        :param lock_file: path to the file used to coordinate rate between processes [Optional]
+        :return: RateLimiter instance
+        """
+        key = (rate, burst, os.path.abspath(lock_file) if lock_file else None)
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(rate, burst=burst, lock_file=lock_file)
+            return cls._shared[key]
+
+    def acquire(self) -> float:
+        """
+        Block until the request is allowed to be sent
+
+        :return: number of seconds spent waiting
+        """
+        with self._lock:
+            if self.lock_file:
+                wait = self._reserve_in_file()
+            else:
+                self._tokens, self._timestamp, wait = self._reserve(
+                    self._tokens, self._timestamp
+                )
+        if wait > 0:
+            _LOGGER.debug(f"Rate limit reached, waiting {wait:.3f}s")
+            time.sleep(wait)
+        return wait
+
+    def _reserve(self, tokens: float, timestamp: float) -> Tuple[float, float, float]:
+        """
+        Take one token from the bucket. If there is no token available, the token
+        is borrowed from the future, and caller has to wait until it is refilled.
+
+        :param tokens: number of tokens in the bucket at timestamp
+        :param timestamp: time of the last update of the bucket
+        :return: new number of tokens, new timestamp and time to wait
+        """
+        now = time.time()
+        tokens = min(self.burst, tokens + (now - timestamp) * self.rate) - 1
+        wait = -tokens / self.rate if tokens < 0 else 0.0
+        return tokens, now, wait
+
+    def _reserve_in_file(self) -> float:
+        """
+        Take one token from the bucket stored in the lock file
+
+        :return: time to wait
+        """
+        with open(self.lock_file, "a+") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                lock_file.seek(0)
+                try:
+                    state = json.loads(lock_file.read())
+                    tokens, timestamp = state["tokens"], state["timestamp"]
+                except (ValueError, KeyError, TypeError):
+                    tokens, timestamp = float(self.burst), time.time()
+                tokens, timestamp, wait = self._reserve(tokens, timestamp)
+                lock_file.seek(0)
+                lock_file.truncate()
+                lock_file.write(json.dumps({"tokens": tokens, "timestamp": timestamp}))
+                lock_file.flush()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return wait
@@ -0,0 +1,184 @@
+"""Timing spans of stages of a geofetch run, and the run report built from them."""
+
+import json
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Iterator
+
+from geofetch._version import __version__
+from geofetch.const import PROMETHEUS_SUFFIX
+
+
+class RunReport:
+    """
+    Collects timing spans of stages of the run (e.g. soft file download, SRA run info,
+    expansion of metadata, writing), per accession, together with counters of
+    HTTP requests of the client and hits of the metadata cache.
+
+    Spans can be nested (e.g. separation of common metadata is a part of writing),
+    and can be recorded from many threads at once.
+    """
+
+    def __init__(self, client=None, cache=None):
+        """
+        :param NCBIClient client: client, which requests, retries and received bytes are counted [Optional]
+        :param MetadataCache cache: cache, which hits and misses are counted [Optional]
+        """
+        self.client = client
+        self.cache = cache
+        self.started = datetime.now(timezone.utc)
+        self.spans = []
+        self._start = time.perf_counter()
+        self._end = None
+        self._lock = threading.Lock()
+        self._baseline = {"http": self._client_stats(), "cache": self._cache_stats()}
+        self._final = None
+        # summary of the profile of the run, if it was profiled
+        self.profile = None
+
+    def _client_stats(self) -> Counter:
+        return Counter(self.client.stats) if self.client is not None else Counter()
+
+    def _cache_stats(self) -> Counter:
+        return Counter(self.cache.stats) if self.cache is not None else Counter()
+
+    @contextmanager
+    def span(self, stage: str, accession: str = None) -> Iterator[None]:
+        """
+        Measure time spent in the block
+
+        :param stage: name of the stage
+        :param accession: accession processed in the stage [Optional]
+        """
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            end = time.perf_counter()
+            span = {
+                "stage": stage,
+                "accession": accession,
+                "start": round(start - self._start, 6),
+                "duration": round(end - start, 6),
+                "status": status,
+            }
+            with self._lock:
+                self.spans.append(span)
+
+    def finish(self) -> None:
+        """Stop the run clock and take final values of counters"""
+        self._end = time.perf_counter()
+        self._final = {
+            "http": self._client_stats() - self._baseline["http"],
+            "cache": self._cache_stats() - self._baseline["cache"],
+        }
+
+    def counters(self) -> dict:
+        """
+        :return: dict of counters of HTTP requests and cache lookups during the run
+        """
+        if self._final is not None:
+            return {name: dict(values) for name, values in self._final.items()}
+        return {
+            "http": dict(self._client_stats() - self._baseline["http"]),
+            "cache": dict(self._cache_stats() - self._baseline["cache"]),
+        }
+
+    def stages(self) -> dict:
+        """
+        :return: dict of stages and their number of spans, total and max duration (seconds)
+        """
+        stages = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            stage = stages.setdefault(
+                span["stage"], {"count": 0, "total": 0.0, "max": 0.0, "errors": 0}
+            )
+            stage["count"] += 1
+            stage["total"] += span["duration"]
+            stage["max"] = max(stage["max"], span["duration"])
+            stage["errors"] += span["status"] == "error"
+        for stage in stages.values():
+            stage["total"] = round(stage["total"], 6)
+        return stages
+
+    def accessions(self) -> dict:
+        """
+        :return: dict of accessions and time (seconds) spent in each stage of them
+        """
+        accessions = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            if span["accession"] is None:
+                continue
+            stages = accessions.setdefault(span["accession"], {})
+            stages[span["stage"]] = round(
+                stages.get(span["stage"], 0.0) + span["duration"], 6
+            )
+        return accessions
+
+    def to_dict(self) -> dict:
+        """
+        :return: run report: duration of the run, totals of stages and accessions,
+            counters and all spans
+        """
+        end = self._end if self._end is not None else time.perf_counter()
+        return {
+            "geofetch_version": __version__,
+            "started": self.started.isoformat(),
+            "duration": round(end - self._start, 6),
+            "stages": self.stages(),
+            "accessions": self.accessions(),
+            **self.counters(),
+            **({"profile": self.profile} if self.profile is not None else {}),
+            "spans": list(self.spans),
+        }
+
+    def to_prometheus(self) -> str:
+        """
+        :return: report in Prometheus text exposition format (e.g. for node_exporter textfile collector)
+        """
+        report = self.to_dict()
+        lines = [
+            "# HELP geofetch_run_duration_seconds Duration of the geofetch run",
+            "# TYPE geofetch_run_duration_seconds gauge",
+            f"geofetch_run_duration_seconds {report['duration']}",
+            "# HELP geofetch_stage_duration_seconds Time spent in stages of the run",
+            "# TYPE geofetch_stage_duration_seconds summary",
+        ]
+        for name, stage in report["stages"].items():
+            lines.append(
+                f'geofetch_stage_duration_seconds_sum{{stage="{name}"}} {stage["total"]}'
+            )
+            lines.append(
+                f'geofetch_stage_duration_seconds_count{{stage="{name}"}} {stage["count"]}'
+            )
+        for group in ("http", "cache"):
+            for name, value in sorted(report[group].items()):
+                metric = f"geofetch_{group}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, file_path: str) -> str:
+        """
+        Save the report as JSON, or in Prometheus text format if file has .prom extension
+
+        :param file_path: path to the report file
+        :return: path to the report file
+        """
+        with open(file_path, "w") as f:
+            if file_path.endswith(PROMETHEUS_SUFFIX):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.to_dict(), f, indent=2)
+        return file_path
@@ -0,0 +1,160 @@
+"""Single-pass parser of SOFT formatted files into series and sample records."""
+
+from typing import Iterable, List, NamedTuple, Union
+
+from geofetch.const import EXPERIMENT_PATTERN, PROJECT_PATTERN, SUPP_FILE_PATTERN
+
+
+class SoftEntry(NamedTuple):
+    """One key-value line of SOFT file"""
+
+    key: str
+    value: str
+    # True for attribute lines (!key = value), False for other lines (e.g. #column = description)
+    is_attribute: bool
+
+
+class SoftRecord:
+    """
+    One entity of SOFT file (e.g. ^SERIES or ^SAMPLE) with all its lines,
+    and values, that are needed by geofetch, extracted in advance.
+    """
+
+    __slots__ = (
+        "entity",
+        "accession",
+        "entries",
+        "supplementary_files",
+        "srx",
+        "srx_index",
+    )
+
+    def __init__(self, entity: Union[str, None], accession: Union[str, None]):
+        """
+        :param entity: entity type, e.g. SERIES or SAMPLE. None for lines before first entity
+        :param accession: accession of the entity, e.g. GSM123456
+        """
+        self.entity = entity
+        self.accession = accession
+        self.entries: List[SoftEntry] = []
+        # urls of supplementary files, without 'NONE' values
+        self.supplementary_files: List[str] = []
+        # first SRX accession found in the record, and index of the entry where it was found
+        self.srx = None
+        self.srx_index = None
+
+    def __repr__(self):
+        return (
+            f"SoftRecord({self.entity}={self.accession}, {len(self.entries)} entries)"
+        )
+
+
+class SoftDocument:
+    """Parsed SOFT file: list of records and SRA project linked to it"""
+
+    __slots__ = ("records", "srp")
+
+    def __init__(self):
+        self.records: List[SoftRecord] = []
+        # first SRP accession found in the file
+        self.srp = None
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+
+def split_soft_line(line: str) -> tuple:
+    """
+    Split SOFT formatted line into key and value (same as utils.parse_SOFT_line)
+
+    :param line: A SOFT-formatted line to parse ( !key = value )
+    :return: key and value
+    """
+    key, _, value = line[1:].partition("=")
+    return key.rstrip(), value.lstrip()
+
+
+def parse_soft(lines: Iterable[str]) -> SoftDocument:
+    """
+    Tokenise SOFT file in one pass. Sample data tables and blank lines are skipped.
+
+    :param lines: lines of SOFT file (e.g. stream from Accession.stream_metadata)
+    :return: parsed document
+    """
+    document = SoftDocument()
+    record = None
+    sample_table = False
+
+    for line in lines:
+        # handles #103
+        if line == "!sample_table_begin":
+            sample_table = True
+        if sample_table:
+            if line == "!sample_table_end":
+                sample_table = False
+            continue
+
+        if not line.strip():
+            continue
+
+        if document.srp is None:
+            found = PROJECT_PATTERN.search(line)
+            if found:
+                document.srp = found.group(1)
+
+        if line[0] == "^":
+            record = SoftRecord(*split_soft_line(line.rstrip()))
+            document.records.append(record)
+            continue
+
+        if record is None:
+            record = SoftRecord(None, None)
+            document.records.append(record)
+
+        key, value = split_soft_line(line)
+        record.entries.append(SoftEntry(key, value, line[0] == "!"))
+
+        if record.srx is None:
+            found = EXPERIMENT_PATTERN.search(line)
+            if found:
+                record.srx = found.group(1)
+                record.srx_index = len(record.entries) - 1
+
+        if SUPP_FILE_PATTERN.search(key):
+            file_url = value.rstrip()
+            if file_url != "NONE":
+                record.supplementary_files.append(file_url)
+
+    return document
+
+
+def as_soft_document(content: Union[SoftDocument, Iterable[str]]) -> SoftDocument:
+    """
+    Parse content of SOFT file, unless it was already parsed
+
+    :param content: parsed document, or lines of SOFT file
+    :return: parsed document
+    """
+    if isinstance(content, SoftDocument):
+        return content
+    return parse_soft(content)
+
+
+def add_soft_value(metadata: dict, key: str, value: str) -> None:
+    """
+    Add value to metadata dict. If the key is already there,
+    values are collected in a list.
+
+    :param metadata: metadata dict to update
+    :param key: key of the value
+    :param value: value to add
+    """
+    if key not in metadata:
+        metadata[key] = value
+    elif isinstance(metadata[key], list):
+        metadata[key].append(value)
+    else:
+        metadata[key] = [metadata[key], value]
@@ -1,15 +1,37 @@
 """Independently-importable utilities to circumvent true scripts."""
 
+import copy
 import csv
+import json
 import logging
 import os
 import re
 import subprocess
 import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from io import StringIO
-from typing import Dict, List, NoReturn, Union
-
-import requests
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, NoReturn, Union
+from urllib.parse import quote
+
+import xmltodict
+import yaml
+
+from geofetch.cache import MetadataCache
+from geofetch.client import NCBIClient, get_default_client
+from geofetch.const import (
+    CONFIG_SRA_TEMPLATE_NAME,
+    NCBI_EFETCH,
+    NCBI_ESEARCH,
+    SOFT_CHUNK_SIZE,
+    SRA_BATCH_SIZE,
+    SRA_RUNINFO_MAX_PAGE_SIZE,
+    SRA_RUNINFO_PAGE_SIZE,
+    TEMPLATES_DIR,
+)
+from geofetch.soft import SoftDocument, as_soft_document
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -22,6 +44,9 @@ URL_BY_ACC = {
     "GSM": "https://www.ncbi.nlm.nih.gov/geo/query/acc.cgi?targ=gsm&acc={ACCESSION}&form=text&view=full",
 }
 
+# Endpoint under which SRA run info is stored in metadata cache
+SRA_RUNINFO_ENDPOINT = "sra_runinfo"
+
 
 def build_prefetch_command(
     run_id: str, prefetch_path: str = "prefetch", max_size: Union[str, int] = None
@@ -133,6 +158,62 @@ def parse_accessions(input_arg, metadata_folder, just_metadata=False, max_size=N
     return acc_GSE_list
 
 
+def iter_soft_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    Split stream of text chunks into lines. Carriage returns are removed
+    and empty lines are skipped.
+
+    :param chunks: iterable of text chunks, e.g. decoded http response content
+    :return: iterator of non-empty lines
+    """
+    rest = ""
+    for chunk in chunks:
+        lines = (rest + chunk.replace("\r", "")).split("\n")
+        rest = lines.pop()
+        for line in lines:
+            if line:
+                yield line
+    if rest:
+        yield rest
+
+
+def iter_soft_file(file_path: str) -> Iterator[str]:
+    """
+    Read soft file from disk line by line
+
+    :param file_path: path to the soft file
+    :return: iterator of non-empty lines
+    """
+    with open(file_path, "r") as soft_file_obj:
+        for line in soft_file_obj:
+            line = line.rstrip("\n")
+            if line:
+                yield line
+
+
+def _write_through(chunks: Iterable[str], file_path: str) -> Iterator[str]:
+    """
+    Write text chunks to the file, while passing them on. Chunks are written to
+    a temporary file, that is renamed to file_path once all chunks were consumed.
+
+    :param chunks: iterable of text chunks
+    :param file_path: path to the file
+    :return: iterator of the same chunks
+    """
+    tmp_path = f"{file_path}.tmp"
+    completed = False
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+        os.replace(tmp_path, file_path)
+        completed = True
+    finally:
+        if not completed and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
 def parse_SOFT_line(line: str) -> dict:
     """
     Parse SOFT formatted line, returning a dictionary with the key-value pair.
@@ -202,6 +283,8 @@ class Accession(object):
         typename: str = None,
         clean: bool = False,
         max_soft_size: int = 1073741824,
+        client: NCBIClient = None,
+        cache: MetadataCache = None,
     ) -> list:
         """
         Fetch the metadata associated with this accession.
@@ -211,8 +294,49 @@ class Accession(object):
         :param str outpath: path to file to which to write output, optional
         :param bool clean: if true, files won't be saved
         :param int max_soft_size: max soft file size in bytes
+        :param NCBIClient client: http client used to send requests.
+            Shared default client is used if unspecified
+        :param MetadataCache cache: cache of metadata responses [Optional]
         :return: list of lines in soft file
         """
+        return list(
+            self.stream_metadata(
+                outpath=outpath,
+                typename=typename,
+                clean=clean,
+                max_soft_size=max_soft_size,
+                client=client,
+                cache=cache,
+            )
+        )
+
+    def stream_metadata(
+        self,
+        outpath: str = None,
+        typename: str = None,
+        clean: bool = False,
+        max_soft_size: int = 1073741824,
+        client: NCBIClient = None,
+        cache: MetadataCache = None,
+    ) -> Iterator[str]:
+        """
+        Stream the metadata associated with this accession, line by line.
+        The response is read in chunks and written to outpath while it is
+        consumed, so memory usage doesn't depend on the size of the soft file.
+        The file appears at outpath only once it was read completely.
+
+        :param str typename: type indicating URL format, use type
+            parsed at construction if unspecified
+        :param str outpath: path to file to which to write output, optional
+        :param bool clean: if true, files won't be saved
+        :param int max_soft_size: max soft file size in bytes
+        :param NCBIClient client: http client used to send requests.
+            Shared default client is used if unspecified
+        :param MetadataCache cache: cache of metadata responses. If provided, soft file
+            is streamed from the cache, or saved there while it is streamed [Optional]
+        :return: iterator of non-empty lines in soft file
+        """
+        client = client or get_default_client()
 
         typename = (typename or self.typename).upper()
         if not is_known_type(typename=typename):
@@ -230,12 +354,13 @@ class Accession(object):
             )
             raise
         _LOGGER.debug("Fetching: '%s'", full_url)
-        if typename == "GSM":
+        entry = None if cache is None else cache.get(self.accn, typename)
+        if typename == "GSM" and not (cache is not None and cache.is_fresh(entry)):
             # check size of the file
             check_head_url = f"https://ftp.ncbi.nlm.nih.gov/geo/series/{self.accn[:-3]}nnn/{self.accn}/soft/{self.accn}_family.soft.gz"
 
             try:
-                head_response = requests.head(check_head_url)
+                head_response = client.head(check_head_url)
                 file_size = head_response.headers["Content-Length"]
 
                 if int(file_size) > max_soft_size:
@@ -249,37 +374,51 @@ class Accession(object):
                 )
             except SoftFileException as err:
                 self._LOGGER.error(f"Soft file is too large. {err}")
-                return []
-
-        result = requests.get(full_url)
+                return
 
-        if result.ok:
-            result.encoding = "UTF-8"
-            result_text = result.text
-            result_list = result_text.replace("\r", "").split("\n")
-            result_list = [elem for elem in result_list if len(elem) > 0]
+        if cache is not None:
+            chunks = cache.stream_entry(
+                full_url, self.accn, typename, entry, client=client
+            )
+            if outpath and not clean:
+                chunks = _write_through(chunks, self._prepare_outpath(outpath))
+            yield from iter_soft_lines(chunks)
+            return
 
-        else:
+        result = client.get(full_url, stream=True)
+        if not result.ok:
+            result.close()
             raise Exception(f"Error in requesting file: {full_url}")
 
-        if outpath and not clean:
-            # Ensure we have filepath and that needed directories exist.
-            if not os.path.splitext(outpath)[1]:
-                _LOGGER.debug("Looks like folder, not file: %s", outpath)
-                dirpath = outpath
-                filename = "{}.csv".format(self.accn)
-                outpath = os.path.join(dirpath, filename)
-            else:
-                dirpath = os.path.dirname(outpath)
-            if not os.path.exists(dirpath):
-                _LOGGER.debug("Forging path to '%s'", dirpath)
-                os.makedirs(dirpath)
+        result.encoding = "UTF-8"
+        try:
+            chunks = result.iter_content(
+                chunk_size=SOFT_CHUNK_SIZE, decode_unicode=True
+            )
+            if outpath and not clean:
+                chunks = _write_through(chunks, self._prepare_outpath(outpath))
+            yield from iter_soft_lines(chunks)
+        finally:
+            result.close()
 
-            # save file:
-            with open(outpath, "w", encoding="utf-8") as f:
-                f.write(result_text)
+    def _prepare_outpath(self, outpath: str) -> str:
+        """
+        Ensure we have filepath and that needed directories exist.
 
-        return result_list
+        :param str outpath: path to file or folder, where metadata should be saved
+        :return str: path to file
+        """
+        if not os.path.splitext(outpath)[1]:
+            _LOGGER.debug("Looks like folder, not file: %s", outpath)
+            dirpath = outpath
+            filename = "{}.csv".format(self.accn)
+            outpath = os.path.join(dirpath, filename)
+        else:
+            dirpath = os.path.dirname(outpath)
+        if dirpath and not os.path.exists(dirpath):
+            _LOGGER.debug("Forging path to '%s'", dirpath)
+            os.makedirs(dirpath, exist_ok=True)
+        return outpath
 
     @staticmethod
     def _validate(accn: str):
@@ -322,6 +461,161 @@ class Accession(object):
         return AccessionException(message)
 
 
+def fetch_sra_runinfo(
+    srp_number: str,
+    client: NCBIClient = None,
+    cache: MetadataCache = None,
+    page_size: int = SRA_RUNINFO_PAGE_SIZE,
+) -> list:
+    """
+    Get SRA run info of SRA project (or experiment) by using E-utilities
+    esearch and efetch
+
+    :param str srp_number: SRP number
+    :param NCBIClient client: http client used to send requests.
+        Shared default client is used if unspecified
+    :param MetadataCache cache: cache of metadata responses. E-utilities responses
+        can't be revalidated, so cached run info is refetched once it is older than ttl [Optional]
+    :param int page_size: number of runs fetched in one efetch request
+    :return: list of dicts of SRRs
+    """
+    if not srp_number:
+        _LOGGER.info("No srp number in this accession found")
+        return []
+    if cache is not None:
+        entry = cache.lookup(srp_number, SRA_RUNINFO_ENDPOINT)
+        if entry is not None:
+            _LOGGER.info(f"Using cached {srp_number} sra metadata")
+            return json.loads(entry.body)
+        SRP_list = fetch_sra_runinfo(srp_number, client=client, page_size=page_size)
+        cache.put(srp_number, SRA_RUNINFO_ENDPOINT, json.dumps(SRP_list))
+        return SRP_list
+    _LOGGER.info(f"Downloading {srp_number} sra metadata")
+    return _fetch_runinfo_rows(srp_number, client=client, page_size=page_size)
+
+
+def fetch_sra_runinfo_many(
+    srp_numbers: Iterable[str],
+    client: NCBIClient = None,
+    cache: MetadataCache = None,
+    batch_size: int = SRA_BATCH_SIZE,
+    page_size: int = SRA_RUNINFO_PAGE_SIZE,
+) -> Dict[str, list]:
+    """
+    Get SRA run info of many SRA projects (or experiments). Projects are searched
+    in batches, with one E-utilities query of OR-joined accessions per batch,
+    and runs are assigned back to projects by SRAStudy (or Experiment)
+
+    :param srp_numbers: SRP numbers
+    :param NCBIClient client: http client used to send requests.
+        Shared default client is used if unspecified
+    :param MetadataCache cache: cache of metadata responses [Optional]
+    :param int batch_size: number of projects searched in one query
+    :param int page_size: number of runs fetched in one efetch request
+    :return: dict of SRP numbers and lists of dicts of their SRRs. Projects, which
+        run info couldn't be fetched or assigned, are omitted, so they can be
+        fetched one by one with fetch_sra_runinfo
+    """
+    SRP_dict = {}
+    to_fetch = []
+    for srp_number in dict.fromkeys(srp_numbers):
+        if not srp_number:
+            continue
+        entry = (
+            None if cache is None else cache.lookup(srp_number, SRA_RUNINFO_ENDPOINT)
+        )
+        if entry is not None:
+            _LOGGER.info(f"Using cached {srp_number} sra metadata")
+            SRP_dict[srp_number] = json.loads(entry.body)
+        else:
+            to_fetch.append(srp_number)
+
+    for start in range(0, len(to_fetch), batch_size):
+        batch = dict.fromkeys(to_fetch[start : start + batch_size])
+        _LOGGER.info(f"Downloading sra metadata of {len(batch)} projects")
+        try:
+            rows = _fetch_runinfo_rows(
+                " OR ".join(batch), client=client, page_size=page_size
+            )
+        except Exception as err:
+            _LOGGER.warning(
+                f"Couldn't download sra metadata of {', '.join(batch)}: {err}"
+            )
+            continue
+        batch_runs = {srp_number: [] for srp_number in batch}
+        for row in rows:
+            for key in ("SRAStudy", "Experiment"):
+                if row.get(key) in batch_runs:
+                    batch_runs[row[key]].append(row)
+                    break
+        for srp_number, SRP_list in batch_runs.items():
+            if not SRP_list:
+                continue
+            if cache is not None:
+                cache.put(srp_number, SRA_RUNINFO_ENDPOINT, json.dumps(SRP_list))
+            SRP_dict[srp_number] = SRP_list
+    return SRP_dict
+
+
+def _fetch_runinfo_rows(
+    term: str, client: NCBIClient = None, page_size: int = SRA_RUNINFO_PAGE_SIZE
+) -> list:
+    """
+    Search SRA with esearch, keeping found ids on the E-utilities history server
+    (WebEnv, query_key), and fetch run info of all of them with efetch, in pages.
+    All runs are fetched, however many runs project has.
+
+    :param str term: E-utilities search term, e.g. SRP number
+    :param NCBIClient client: http client used to send requests.
+        Shared default client is used if unspecified
+    :param int page_size: number of runs fetched in one efetch request (1-10000)
+    :return: list of dicts of SRRs
+    """
+    client = client or get_default_client()
+    page_size = max(1, min(page_size, SRA_RUNINFO_MAX_PAGE_SIZE))
+    ncbi_esearch = NCBI_ESEARCH.format(SRP_NUMBER=quote(term))
+
+    # searching ids responding to term
+    x = client.post(ncbi_esearch)
+
+    if x.status_code != 200:
+        x.encoding = "UTF-8"
+        _LOGGER.error(f"Error in ncbi esearch response: {x.status_code}")
+        raise x.raise_for_status()
+    search_result = x.json()["esearchresult"]
+    count = int(search_result["count"])
+
+    SRP_list = []
+    # pages are advanced by runs actually returned, so runs are not skipped
+    # if server returns fewer runs than requested
+    while len(SRP_list) < count:
+        retstart = len(SRP_list)
+        id_api = NCBI_EFETCH.format(
+            WEBENV=search_result["webenv"],
+            QUERY_KEY=search_result["querykey"],
+            RETSTART=retstart,
+            RETMAX=page_size,
+        )
+
+        y = client.get(id_api)
+        if y.status_code != 200:
+            _LOGGER.error(
+                f"Error in ncbi efetch response in SRA fetching: {y.status_code}"
+            )
+            raise y.raise_for_status()
+        run_info = xmltodict.parse(y.text, force_list=("Row",))["SraRunInfo"]
+        rows = run_info.get("Row", []) if run_info else []
+        if not rows:
+            _LOGGER.warning(
+                f"SRA run info of {term} is incomplete: "
+                f"{len(SRP_list)} of {count} runs fetched"
+            )
+            break
+        SRP_list.extend(rows)
+
+    return SRP_list
+
+
 def split_accn(accn: str):
     """
     Split accession into prefix and number, leaving suffix as text
@@ -414,6 +708,99 @@ def _get_list_of_keys(list_of_dict: list):
     return list(dict_keys.keys())
 
 
+def _is_expandable(value) -> bool:
+    """
+    Check if metadata value has to be expanded: it is a list, or a "key: value" string
+    :param value: value of metadata
+    :return bool: True if value has to be expanded
+    """
+    if isinstance(value, str):
+        return ": " in value and value.count(": ") == 1
+    return isinstance(value, list)
+
+
+def _expand_metadata_columns(metadata_list: list) -> list:
+    """
+    Expand lists and "key: value" strings of all keys in the list of dicts,
+    by creating new keys or joining elements into one string.
+    Keys are expanded in order of their first appearance. Key is expanded in all
+    samples if it has to be expanded in at least one of them. Each element of
+    expanded value, that looks like "key: value", is moved to its own key
+    (values of existing keys are concatenated), unless key is longer than 40
+    characters or contains "(". Other elements are joined back into one string
+    (with ", ", or with "(" if element key contains "(").
+
+    Number of samples where key has to be expanded is counted in one pass over
+    all values and kept up to date while keys are expanded, so samples are
+    scanned only for keys that have to be expanded.
+
+    :param list metadata_list: list of dicts that store metadata
+    :return list: expanded metadata list
+    """
+    list_of_keys = _get_list_of_keys(metadata_list)
+    expandable_count = {}
+    for sample in metadata_list:
+        for key, value in sample.items():
+            if _is_expandable(value):
+                expandable_count[key] = expandable_count.get(key, 0) + 1
+    not_expanded = set(list_of_keys)
+
+    def set_value(sample: dict, key: str, value: str):
+        old_value = sample.get(key)
+        sample[key] = str(old_value) + value if key in sample else value
+        if key in not_expanded:
+            change = _is_expandable(sample[key]) - _is_expandable(old_value)
+            expandable_count[key] = expandable_count.get(key, 0) + change
+
+    for dict_key in list_of_keys:
+        not_expanded.discard(dict_key)
+        if not expandable_count.get(dict_key):
+            _LOGGER.debug(
+                f"Metadata with {dict_key} was not expanded, as item is not list"
+            )
+            continue
+
+        for sample in metadata_list:
+            if dict_key not in sample:
+                continue
+            values = sample[dict_key]
+            if not isinstance(values, list):
+                values = [values]
+
+            just_string = False
+            string_parts = []
+            for elem in values:
+                separated_elements = elem.split(": ")
+                if len(separated_elements) >= 2:
+                    # if first element is larger than 40 then treat it like simple string
+                    if len(separated_elements[0]) > 40:
+                        separator = ", "
+                    # additional elem for all bed files
+                    elif "(" in separated_elements[0]:
+                        separator = "("
+                    else:
+                        set_value(
+                            sample,
+                            separated_elements[0],
+                            ": ".join(separated_elements[1:]),
+                        )
+                        continue
+                else:
+                    separator = ", "
+                just_string = True
+                if any(string_parts):
+                    string_parts.extend([separator, elem])
+                else:
+                    string_parts = [elem]
+
+            if just_string:
+                sample[dict_key] = "".join(string_parts)
+            else:
+                del sample[dict_key]
+
+    return metadata_list
+
+
 def _get_value(all_line: str):
     """
     :param all_line: string with key value. (e.g. '!Series_geo_accession = GSE188720')
@@ -449,6 +836,18 @@ def _read_tar_filelist(raw_text: str) -> dict:
     return files_info
 
 
+def _file_size(meta_elem: dict) -> Union[int, None]:
+    """
+    Get size of processed file, that was read from "filelist.txt"
+    :param dict meta_elem: metadata of processed file
+    :return int: size of the file in bytes, None if it is unknown
+    """
+    try:
+        return int(meta_elem.get("file_size"))
+    except (TypeError, ValueError):
+        return None
+
+
 def _check_file_existance(meta_processed_sample: list) -> list:
     """
     Checking if last element of the list has files. If list of files is empty deleting it
@@ -549,6 +948,82 @@ def _sanitize_config_string(text: str) -> str:
     return new_str
 
 
+_PLAIN_SCALAR_PATTERN = re.compile(r"[\w./][\w./ -]*(?<! )")
+_YAML_RESOLVER = yaml.resolver.Resolver()
+_YAML_STR_TAG = "tag:yaml.org,2002:str"
+
+
+def _yaml_plain_scalar(text, is_key: bool = False):
+    """
+    Value of plain (not quoted) scalar, as it is loaded from config file.
+    Simple strings are returned as they are, other values (numbers, booleans,
+    strings with special characters) are loaded with YAML loader.
+    :param text: scalar that is written in config file
+    :param is_key: True, if scalar is a key of mapping
+    :return: loaded value
+    """
+    text = str(text)
+    if (
+        _PLAIN_SCALAR_PATTERN.fullmatch(text)
+        and _YAML_RESOLVER.resolve(yaml.ScalarNode, text, (True, False))
+        == _YAML_STR_TAG
+    ):
+        return text
+    if is_key:
+        return next(iter(yaml.load(f'{text}: ""', Loader=yaml.Loader)))
+    return yaml.load(f"value: {text}", Loader=yaml.Loader)["value"]
+
+
+def _yaml_quoted_scalar(text: str) -> str:
+    """
+    Value of sanitized, double-quoted string, as it is loaded from config file
+    :param text: string that is sanitized and written in config file in double quotes
+    :return: loaded string
+    """
+    if "\\" not in text and text.isprintable():
+        return text.replace("'", "''")
+    return yaml.load(f'value: "{_sanitize_config_string(text)}"', Loader=yaml.Loader)[
+        "value"
+    ]
+
+
+def _yaml_dumped(value):
+    """
+    Value as it is loaded from yaml.dump output (keys of mappings are sorted)
+    :param value: value to dump
+    :return: loaded value
+    """
+    if isinstance(value, dict):
+        return {key: _yaml_dumped(value[key]) for key in sorted(value)}
+    if isinstance(value, list):
+        return [_yaml_dumped(item) for item in value]
+    return value
+
+
+def _load_sra_convert_modifiers() -> dict:
+    """
+    Sample modifiers of sra convert template, as they are loaded from raw data config file
+    :return: dict of sample modifiers (append, derive, imply)
+    """
+    return copy.deepcopy(_parse_sra_convert_modifiers())
+
+
+@lru_cache(maxsize=1)
+def _parse_sra_convert_modifiers() -> dict:
+    """
+    Parse sra convert template once, as it is inserted in the sample modifiers of config
+    :return: dict of sample modifiers
+    """
+    template_path = os.path.join(
+        os.path.dirname(__file__), TEMPLATES_DIR, CONFIG_SRA_TEMPLATE_NAME
+    )
+    with open(template_path, "r") as template_file:
+        template = template_file.read()
+    return yaml.load(f"sample_modifiers:\n  append:\n{template}", Loader=yaml.Loader)[
+        "sample_modifiers"
+    ]
+
+
 def _sanitize_name(name_str: str) -> str:
     """
     Function that sanitizes strings. (Replace all odd characters)
@@ -663,6 +1138,7 @@ def _separate_file_url(meta_list):
     This method is adding dict key without file_name without path
     """
     separated_list = []
+    sample_names = SampleNameAllocator()
     for meta_elem in meta_list:
         new_dict = meta_elem.copy()
         new_dict["file_url"] = meta_elem["file"]
@@ -677,24 +1153,53 @@ def _separate_file_url(meta_list):
 
         # sanitize sample names
         sanit_name = _sanitize_name(new_dict["sample_name"])
-        new_dict["sample_name"] = make_sample_name_unique(sanit_name, separated_list)
+        new_dict["sample_name"] = sample_names.allocate(sanit_name)
 
         separated_list.append(new_dict)
     return separated_list
 
 
+class SampleNameAllocator:
+    """
+    Allocates unique sample names. Name that is already taken gets the lowest
+    free numeric suffix: name_1, name_2, ...
+    Taken names are kept in a set, and the last suffix of each name is remembered,
+    so each name is allocated in O(1) amortised time.
+    """
+
+    def __init__(self, taken: Iterable[str] = ()):
+        """
+        :param taken: names that are already taken
+        """
+        self.taken = set(taken)
+        self._next_number = {}
+
+    def allocate(self, sanit_name: str) -> str:
+        """
+        Allocate unique name for the sample
+
+        :param sanit_name: sanitized sample name
+        :return: sanit_name, or sanit_name with the lowest free suffix
+        """
+        if sanit_name in self.taken:
+            new_number = self._next_number.get(sanit_name, 1)
+            while f"{sanit_name}_{new_number}" in self.taken:
+                new_number += 1
+            self._next_number[sanit_name] = new_number + 1
+            sanit_name = f"{sanit_name}_{new_number}"
+        self.taken.add(sanit_name)
+        return sanit_name
+
+
 def make_sample_name_unique(
     sanit_name: str, separated_list: list, new_number: int = 1
 ) -> str:
     """
     Check if name is unique for current sample
     """
-    if sanit_name not in [f["sample_name"] for f in separated_list]:
-        return sanit_name
-    elif f"{sanit_name}_{new_number}" not in [f["sample_name"] for f in separated_list]:
-        return f"{sanit_name}_{new_number}"
-    else:
-        return make_sample_name_unique(sanit_name, separated_list, new_number + 1)
+    allocator = SampleNameAllocator(f["sample_name"] for f in separated_list)
+    allocator._next_number[sanit_name] = new_number
+    return allocator.allocate(sanit_name)
 
 
 def _filter_gsm(meta_processed_samples: list, gsm_list: dict) -> list:
@@ -738,21 +1243,20 @@ def _unify_list_keys(processed_meta_list: list) -> list:
     return processed_meta_list
 
 
-def gse_content_to_dict(gse_content: List[str]) -> Dict[str, dict]:
+def gse_content_to_dict(gse_content: Union[SoftDocument, List[str]]) -> Dict[str, dict]:
     """
     Unpack gse soft file to dict
-    :param gse_content: list of strings of gse soft file
+    :param gse_content: parsed gse soft file, or list of strings of gse soft file
     :return: dict of gse content
     """
     gse_dict = {}
-    for line in gse_content:
-        if line.startswith("^"):
-            pass
-        elif line.startswith("!"):
-            key_value = line.split(" = ")
-            new_key = _sanitize_name(key_value[0][1:])
-            new_value = _sanitize_config_string(" ".join(key_value[1:]))
-            if new_key in gse_dict.keys():
+    for record in as_soft_document(gse_content):
+        for entry in record.entries:
+            if not entry.is_attribute:
+                continue
+            new_key = _sanitize_name(entry.key)
+            new_value = _sanitize_config_string(entry.value.replace(" = ", " "))
+            if new_key in gse_dict:
                 gse_dict[new_key] = f"{gse_dict[new_key]} + {new_value}"
             else:
                 gse_dict[new_key] = new_value
@@ -760,6 +1264,33 @@ def gse_content_to_dict(gse_content: List[str]) -> Dict[str, dict]:
     return {"experiment_metadata": gse_dict}
 
 
+def _map_ordered(func: Callable, items: Iterable, workers: int = 1) -> Iterator:
+    """
+    Lazily apply function to every item, using a pool of threads if workers > 1.
+    Results are yielded in the order of items, regardless of the order in which
+    they were completed. At most 2 * workers items are processed ahead of
+    the consumer, so results don't pile up in memory.
+
+    :param func: function to apply
+    :param items: items to process
+    :param workers: number of threads
+    :return: iterator of results
+    """
+    if workers is None or workers <= 1:
+        yield from map(func, items)
+        return
+
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque(
+            executor.submit(func, item) for item in islice(items, 2 * workers)
+        )
+        while pending:
+            result = pending.popleft().result()
+            pending.extend(executor.submit(func, item) for item in islice(items, 1))
+            yield result
+
+
 def is_prefetch_callable() -> bool:
     """
     Test if the prefetch command can be run.
@@ -27,6 +27,7 @@ def read_reqs(reqs_name):
 
 DEPENDENCIES = read_reqs("all")
 extra["install_requires"] = DEPENDENCIES
+extra["extras_require"] = {"parquet": ["pyarrow"], "profile": ["pyinstrument"]}
 
 scripts = None
 
@@ -46,7 +47,6 @@ setup(
     classifiers=[
         "Development Status :: 4 - Beta",
         "License :: OSI Approved :: BSD License",
-        "Programming Language :: Python :: 3.8",
         "Programming Language :: Python :: 3.9",
         "Programming Language :: Python :: 3.10",
         "Programming Language :: Python :: 3.11",
@@ -62,9 +62,11 @@ setup(
         "console_scripts": [
             "geofetch = geofetch.__main__:main",
             "sraconvert = geofetch.sraconvert:main",
+            "geofinder = geofetch.finder:main",
         ],
     },
     package_data={PACKAGE: ["templates/*"]},
+    python_requires=">=3.9",
     scripts=scripts,
     include_package_data=True,
     test_suite="tests",
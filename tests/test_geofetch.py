@@ -1,17 +1,47 @@
+import asyncio
+import http.server
+import json
 import os
+import re
 import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from functools import partial
+from urllib.parse import parse_qs, urlparse
 
+import pandas as pd
 import peppy
 import pytest
+import requests
+import yaml
 
 import geofetch
-from geofetch import Geofetcher, utils
+from geofetch import (
+    Finder,
+    Geofetcher,
+    NCBIClient,
+    aio,
+    download,
+    mockserver,
+    prefetch,
+    soft,
+    utils,
+)
+from geofetch.cache import MetadataCache
+from geofetch.finder import FinderException
+from geofetch.ratelimit import RateLimiter
+from geofetch.report import RunReport
 from geofetch.utils import parse_accessions
 
 INPUT_ACC_FILE = "tests/test_files/input_acc.txt"
 GSE_FILES = "tests/test_files/soft_files"
 GSE_SOFT_NAME = "GSE.soft"
 GSM_SOFT_NAME = "GSM.soft"
+GSE_URL = "https://www.ncbi.nlm.nih.gov/geo/query/acc.cgi?targ=gse&acc=GSE1&form=text"
 
 
 def get_soft_path(gse_numb, sample_len, series_len):
@@ -303,6 +333,33 @@ class TestFilters:
         assert samp == result_sample
         assert proj == result_proj
 
+    def test_meta_separation_limits(self, initiate_geofetcher):
+        long_value = "x" * 60
+        samp, proj = initiate_geofetcher._separate_common_meta(
+            [
+                {
+                    "name": "a",
+                    "protocol": long_value,
+                    "huge": "y" * 80,
+                    "note": "n" * 9,
+                },
+                {
+                    "name": "b",
+                    "protocol": long_value,
+                    "huge": "y" * 80,
+                    "note": "short",
+                },
+            ],
+            max_len=10,
+            del_limit=70,
+            attr_limit_truncate=8,
+        )
+        assert samp == [
+            {"name": "a", "note": "nnnnnnnn ..."},
+            {"name": "b", "note": "short"},
+        ]
+        assert proj == [{"protocol": long_value}]
+
 
 class TestPeppyInitProcessed:
     """
@@ -376,6 +433,81 @@ class TestPeppyInitRaw:
         assert peppy_obj["_config"]["description"] is not None
 
 
+@pytest.mark.parametrize(
+    "options",
+    [
+        {},
+        {"pipeline_samples": "/pi/samples.yaml", "pipeline_project": "project.yaml"},
+        {"add_convert_modifier": True, "pipeline_samples": "123"},
+    ],
+)
+def test_config_dict_equals_loaded_template(options, tmpdir):
+    geof = Geofetcher(name="GSE1", metadata_folder=tmpdir, just_object=True, **options)
+    proj_meta = [{"protocol": "it's a \\test"}, {"yes": "x" * 60}]
+    series_meta = {"experiment_metadata": {"series_title": "t", "a": ["2", "1"]}}
+
+    processed = geof._create_config_processed(
+        "/pep/GSE1_samples.csv", proj_meta, meta_in_series=series_meta
+    )
+    assert geof._create_config_processed_dict(
+        "/pep/GSE1_samples.csv", proj_meta, meta_in_series=series_meta
+    ) == yaml.load(processed, Loader=yaml.Loader)
+
+    raw = geof._create_config_raw(
+        proj_meta, "/pep/GSE1_raw.csv", "subsample_table: GSE1_sub.csv", series_meta
+    )
+    assert geof._create_config_raw_dict(
+        proj_meta, "/pep/GSE1_raw.csv", "/pep/GSE1_sub.csv", series_meta
+    ) == yaml.load(raw, Loader=yaml.Loader)
+
+
+def test_parquet_tables(tmpdir):
+    pytest.importorskip("pyarrow")
+    geof = Geofetcher(name="GSE1", metadata_folder=tmpdir, output_format="parquet")
+    assert geof._parquet_path("/pep/GSE1_raw.csv") == "/pep/GSE1_raw.parquet"
+
+    sample_path = geof._write_gsm_annotation(
+        {
+            "GSM1": {"sample_name": "a", "size": 1},
+            "GSM2": {"sample_name": "b", "size": "2 MB"},
+        },
+        os.path.join(tmpdir, "samples.csv"),
+    )
+    assert sample_path.endswith(".csv")
+    samples = pd.read_parquet(geof._parquet_path(sample_path))
+    assert samples.to_dict("list") == {"sample_name": ["a", "b"], "size": ["1", "2 MB"]}
+
+    subsample_path = geof._write_subannotation(
+        {"GSM1": [["a", "SRX1", "SRR1"], ["a", "SRX1", "SRR2"]]},
+        os.path.join(tmpdir, "subsamples.csv"),
+    )
+    assert list(pd.read_parquet(geof._parquet_path(subsample_path))["SRR"]) == [
+        "SRR1",
+        "SRR2",
+    ]
+
+    with pytest.raises(SystemExit):
+        Geofetcher(name="GSE1", metadata_folder=tmpdir, output_format="tsv")
+
+
+def test_parquet_pep_is_loadable(tmpdir):
+    pytest.importorskip("pyarrow")
+    geof = Geofetcher(name="GSE1", metadata_folder=str(tmpdir), output_format="parquet")
+    geof._write_raw_annotation_new(
+        "GSE1_PEP",
+        {
+            "SRX1": {"sample_name": "a", "gsm_id": "GSM1", "SRR": "SRR1"},
+            "SRX2": {"sample_name": "b", "gsm_id": "GSM2", "SRR": "SRR2"},
+        },
+        {"GSM1": [["a", "SRX1", "SRR1"], ["a", "SRX1", "SRR3"]]},
+    )
+    pep_folder = os.path.join(geof.metadata_root_full, "GSE1_PEP")
+    project = peppy.Project(os.path.join(pep_folder, "GSE1_PEP.yaml"))
+    assert [sample.sample_name for sample in project.samples] == ["a", "b"]
+    assert os.path.isfile(os.path.join(pep_folder, "GSE1_PEP_raw.parquet"))
+    assert os.path.isfile(os.path.join(pep_folder, "GSE1_PEP_raw_subtable.parquet"))
+
+
 def test_clean_func(tmpdir):
     """
     Testing deleting soft files
@@ -386,3 +518,976 @@ def test_clean_func(tmpdir):
             os.path.join(files_dir, file_name), os.path.join(tmpdir, file_name)
         )
     utils.clean_soft_files(tmpdir)
+
+
+class TestNCBIClient:
+    """
+    Testing shared http client
+    """
+
+    def test_client_is_injected(self, tmpdir):
+        client = NCBIClient(pool_size=2, timeout=5)
+        geofetcher = Geofetcher(metadata_folder=tmpdir, client=client)
+        finder = Finder(client=client)
+        assert geofetcher.client is client
+        assert finder.client is client
+
+    def test_pool_size(self):
+        client = NCBIClient(pool_size=3)
+        adapter = client.session.get_adapter("https://www.ncbi.nlm.nih.gov")
+        assert adapter._pool_maxsize == 3
+
+    def test_base_url(self, monkeypatch):
+        client = NCBIClient(base_url="http://127.0.0.1:8765/")
+        assert (
+            client.routed_url("https://eutils.ncbi.nlm.nih.gov/entrez/esearch.fcgi?a=1")
+            == "http://127.0.0.1:8765/eutils.ncbi.nlm.nih.gov/entrez/esearch.fcgi?a=1"
+        )
+        assert (
+            client.routed_url("https://example.com/f.bed")
+            == "https://example.com/f.bed"
+        )
+        assert NCBIClient().routed_url(GSE_URL) == GSE_URL
+        monkeypatch.setenv("GEOFETCH_NCBI_BASE_URL", "http://mock")
+        assert NCBIClient().routed_url(GSE_URL).startswith("http://mock/www.ncbi")
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_map_ordered_keeps_input_order(workers):
+    def slow_square(x):
+        time.sleep(0.01 * (10 - x))
+        return x * x
+
+    assert list(utils._map_ordered(slow_square, range(10), workers=workers)) == [
+        x * x for x in range(10)
+    ]
+
+
+def test_expand_metadata_columns():
+    long_key = "k" * 41
+    metadata = [
+        {
+            "sample_name": "s1",
+            "Sample_characteristics_ch1": ["cell type: B", "tissue: blood"],
+            "Sample_description": "treatment: none",
+        },
+        {
+            "sample_name": "s2",
+            "Sample_characteristics_ch1": [
+                f"{long_key}: x",
+                "genome build (bed): hg38",
+                "plain",
+            ],
+            "tissue": "liver",
+        },
+    ]
+    assert utils._expand_metadata_columns(metadata) == [
+        {
+            "sample_name": "s1",
+            "cell type": "B",
+            "tissue": "blood",
+            "treatment": "none",
+        },
+        {
+            "sample_name": "s2",
+            "Sample_characteristics_ch1": f"{long_key}: x(genome build (bed): hg38, plain",
+            "tissue": "liver",
+        },
+    ]
+
+
+def test_sample_names_are_unique():
+    meta_list = [
+        {"file": f"ftp://host/file{i}.bed", "Sample_title": "a"} for i in range(3)
+    ]
+    meta_list.insert(1, {"file": "ftp://host/a_1.bed", "Sample_title": "a_1"})
+    names = [meta["sample_name"] for meta in utils._separate_file_url(meta_list)]
+    assert names == ["a", "a_1", "a_2", "a_3"]
+
+    many = utils._separate_file_url([{"file": "f.bed", "Sample_title": "a"}] * 5000)
+    assert len({meta["sample_name"] for meta in many}) == 5000
+
+
+class TestRateLimiter:
+    """
+    Testing E-utilities rate limiter
+    """
+
+    def test_rate_is_limited(self):
+        limiter = RateLimiter(rate=50)
+        start = time.time()
+        for _ in range(6):
+            limiter.acquire()
+        assert time.time() - start >= 0.09
+
+    def test_lock_file_is_shared(self, tmpdir):
+        lock_file = os.path.join(tmpdir, "eutils.lock")
+        limiters = [RateLimiter(rate=50, lock_file=lock_file) for _ in range(2)]
+        start = time.time()
+        for _ in range(3):
+            for limiter in limiters:
+                limiter.acquire()
+        assert time.time() - start >= 0.09
+
+    def test_api_key_raises_rate(self):
+        assert NCBIClient(api_key="key").rate_limiter.rate == 10
+
+
+class FakeResponse:
+    def __init__(self, text="", headers=None):
+        self.text = text
+        self.headers = headers or {}
+        self.ok = True
+        self.status_code = 200
+        self.encoding = None
+
+    def json(self):
+        return json.loads(self.text)
+
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        for start in range(0, len(self.text), chunk_size):
+            yield self.text[start : start + chunk_size]
+
+    def close(self):
+        pass
+
+
+class FakeClient:
+    """
+    Client that serves GSE/GSM soft files from memory
+    """
+
+    def __init__(self, soft_files: dict):
+        self.soft_files = soft_files
+        self.urls = []
+
+    def head(self, url, **kwargs):
+        return FakeResponse(headers={"Content-Length": "10"})
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        acc = url.split("acc=")[1].split("&")[0]
+        typename = url.split("targ=")[1].split("&")[0].upper()
+        return FakeResponse(self.soft_files[(acc, typename)])
+
+
+def test_aio_fetch_metadata_many():
+    soft_files = {
+        (f"GSE{n}", typename): f"^SERIES = GSE{n}\r\n!Series_title = {typename} {n}\r\n"
+        for n in range(100, 120)
+        for typename in ["GSE", "GSM"]
+    }
+    client = FakeClient(soft_files)
+    result = asyncio.run(
+        aio.fetch_metadata_many(soft_files.keys(), concurrency=4, client=client)
+    )
+    assert len(client.urls) == 40
+    assert result[("GSE101", "GSM")] == ["^SERIES = GSE101", "!Series_title = GSM 101"]
+
+
+def test_aio_fetch_metadata_many_is_cancelled_without_waiting():
+    class SlowClient(FakeClient):
+        def get(self, url, **kwargs):
+            time.sleep(1)
+            return super().get(url, **kwargs)
+
+    client = SlowClient({("GSE1", "GSE"): "^SERIES = GSE1\r\n"})
+
+    async def cancelled_fetch():
+        task = asyncio.ensure_future(
+            aio.fetch_metadata_many([("GSE1", "GSE")] * 4, client=client)
+        )
+        await asyncio.sleep(0.1)
+        task.cancel()
+        start = time.perf_counter()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return time.perf_counter() - start
+
+    # running requests are not waited for in the event loop
+    assert asyncio.run(cancelled_fetch()) < 0.5
+
+
+def test_aio_prefetch_window_is_bounded():
+    soft_files = {
+        (f"GSE{n}", typename): f"^SERIES = GSE{n}\r\n!Series_title = {typename} {n}\r\n"
+        for n in range(100, 120)
+        for typename in ["GSE", "GSM"]
+    }
+    client = FakeClient(soft_files)
+    window = aio.PrefetchWindow(soft_files.keys(), size=3)
+    fetched_ahead = []
+
+    def take_all():
+        result = {}
+        for position, (accession, typename) in enumerate(soft_files):
+            time.sleep(0.005)
+            requested = {url.split("acc=")[1].split("&")[0] for url in client.urls}
+            # accessions fetched after the last accession taken
+            fetched_ahead.append(len(requested) - ((position - 1) // 2 + 1))
+            result[(accession, typename)] = window.take(accession, typename)
+        return result
+
+    async def prefetch_and_take():
+        prefetch = asyncio.ensure_future(window.run(client=client))
+        result = await asyncio.get_running_loop().run_in_executor(None, take_all)
+        await prefetch
+        return result
+
+    result = asyncio.run(prefetch_and_take())
+    assert len(client.urls) == 40
+    assert result[("GSE101", "GSM")] == ["^SERIES = GSE101", "!Series_title = GSM 101"]
+    # at most 3 accessions were fetched ahead of the taken one
+    assert max(fetched_ahead) <= 3
+    # metadata is taken once, and items not in the window are not fetched
+    assert window.take("GSE101", "GSM") is None
+    assert window.take("GSE1", "GSE") is None
+
+
+class FakeEutilsClient:
+    """
+    Client that serves SRA run info of projects from memory, through the
+    E-utilities history server (esearch with usehistory=y, efetch in pages)
+    """
+
+    def __init__(self, runs: dict):
+        self.runs = runs
+        self.urls = []
+
+    def post(self, url, **kwargs):
+        self.urls.append(url)
+        query = parse_qs(urlparse(url).query)
+        projects = re.findall(r"SRP\d+", query["term"][0])
+        webenv = ",".join(projects)
+        count = sum(len(self.runs.get(srp, [])) for srp in projects)
+        return FakeResponse(
+            json.dumps(
+                {
+                    "esearchresult": {
+                        "count": str(count),
+                        "webenv": webenv,
+                        "querykey": "1",
+                    }
+                }
+            )
+        )
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        query = parse_qs(urlparse(url).query)
+        rows = [
+            {"Run": run, "SRAStudy": srp}
+            for srp in query["WebEnv"][0].split(",")
+            for run in self.runs.get(srp, [])
+        ]
+        start = int(query["retstart"][0])
+        rows = rows[start : start + int(query["retmax"][0])]
+        return FakeResponse(
+            "<SraRunInfo>"
+            + "".join(
+                f"<Row><Run>{row['Run']}</Run><SRAStudy>{row['SRAStudy']}</SRAStudy></Row>"
+                for row in rows
+            )
+            + "</SraRunInfo>"
+        )
+
+
+def test_sra_runinfo_is_paged():
+    client = FakeEutilsClient({"SRP1": [f"SRR{n}" for n in range(2500)]})
+    runs = utils.fetch_sra_runinfo("SRP1", client=client, page_size=1000)
+    assert [run["Run"] for run in runs] == [f"SRR{n}" for n in range(2500)]
+    assert len(client.urls) == 4
+
+    client = FakeEutilsClient({"SRP2": ["SRR1"]})
+    assert utils.fetch_sra_runinfo("SRP2", client=client) == [
+        {"Run": "SRR1", "SRAStudy": "SRP2"}
+    ]
+    assert utils.fetch_sra_runinfo("SRP3", client=client) == []
+
+
+def test_sra_runinfo_pages_follow_returned_runs():
+    class CappedEutilsClient(FakeEutilsClient):
+        # server returns at most 700 runs, whatever retmax is
+        def get(self, url, **kwargs):
+            assert "retmax=10000&" in url
+            return super().get(url.replace("retmax=10000&", "retmax=700&"))
+
+    client = CappedEutilsClient({"SRP1": [f"SRR{n}" for n in range(2500)]})
+    runs = utils.fetch_sra_runinfo("SRP1", client=client, page_size=20000)
+    assert [run["Run"] for run in runs] == [f"SRR{n}" for n in range(2500)]
+    assert len(client.urls) == 5
+
+    client = FakeEutilsClient({"SRP1": ["SRR1", "SRR2"]})
+    assert len(utils.fetch_sra_runinfo("SRP1", client=client, page_size=0)) == 2
+    assert Geofetcher(sra_page_size=0).sra_page_size == 1
+    assert Geofetcher(sra_page_size=50000).sra_page_size == 10000
+
+
+def test_sra_runinfo_of_many_projects_is_batched():
+    runs = {f"SRP{n}": [f"SRR{n}{r}" for r in range(n)] for n in range(1, 6)}
+    client = FakeEutilsClient(runs)
+    result = utils.fetch_sra_runinfo_many(
+        [*runs, "SRP1", "SRP9"], client=client, batch_size=2
+    )
+    # 3 batches: one esearch and one efetch each
+    assert len(client.urls) == 6
+    assert {srp: [run["Run"] for run in rows] for srp, rows in result.items()} == runs
+
+
+class FakeGdsClient:
+    """
+    Client that serves esearch results of gds uids from memory,
+    paged through the E-utilities history server
+    """
+
+    def __init__(self, uids: list, fail_after: int = None):
+        self.uids = uids
+        self.fail_after = fail_after
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        if self.fail_after is not None and len(self.urls) > self.fail_after:
+            response = FakeResponse()
+            response.status_code = 500
+            return response
+        query = parse_qs(urlparse(url).query)
+        start = int(query["retstart"][0])
+        ids = self.uids[start : start + int(query["retmax"][0])]
+        return FakeResponse(
+            f"<eSearchResult><Count>{len(self.uids)}</Count>"
+            f"<RetStart>{start}</RetStart><QueryKey>1</QueryKey><WebEnv>MCID</WebEnv>"
+            f"<IdList>{''.join(f'<Id>{uid}</Id>' for uid in ids)}</IdList>"
+            "</eSearchResult>"
+        )
+
+
+def test_finder_iter_gse_is_paged():
+    uids = [f"2000{n}" for n in range(1, 2501)]
+    client = FakeGdsClient(uids)
+    gse_iter = Finder(client=client).iter_gse(page_size=1000)
+    assert next(gse_iter) == "GSE1"
+    assert len(client.urls) == 1
+    assert [*gse_iter][-1] == "GSE2500"
+    assert len(client.urls) == 3
+    assert "term=%231&WebEnv=MCID&retstart=2000&retmax=500" in client.urls[-1]
+
+    client = FakeGdsClient(uids)
+    gse_list = list(Finder(retmax=1500, client=client).iter_gse("2020/01/01"))
+    assert gse_list == [f"GSE{n}" for n in range(1, 1501)]
+    assert "Publication%20Date" in client.urls[0]
+    assert list(Finder(client=FakeGdsClient([])).iter_gse()) == []
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        "import geofetch",
+        "from geofetch import Finder",
+        "from geofetch.utils import parse_accessions",
+    ],
+)
+def test_light_imports_dont_load_pandas(statement):
+    code = f"{statement}; import sys; print(sorted({{'pandas', 'peppy'}} & set(sys.modules)))"
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert output.stdout.strip() == "[]"
+
+
+def test_finder_sync_advances_watermark(tmp_path):
+    state_file = str(tmp_path / "state.json")
+    client = FakeGdsClient(["2001", "2002"])
+    assert Finder(client=client).sync(state_file, start_date="2020/01/01") == (
+        ["GSE1", "GSE2"],
+        [],
+    )
+    assert '"2020/01/01"[Publication%20Date]' in client.urls[0]
+    with open(state_file) as fp:
+        state = json.load(fp)
+    assert state["gse"] == ["GSE1", "GSE2"]
+    assert state["window"]["start"] == "2020/01/01"
+    # window, that was queried, is persisted
+    assert f'"{state["window"]["end"]}"[Publication%20Date]' in client.urls[0]
+
+    client = FakeGdsClient(["2002", "2003"])
+    finder = Finder(client=client)
+    assert finder.sync(state_file) == (["GSE3"], ["GSE2"])
+    assert f'"{state["watermark"]}"[Publication%20Date]' in client.urls[0]
+
+    with open(state_file) as fp:
+        state = json.load(fp)
+    failing_client = FakeGdsClient([f"2000{n}" for n in range(1, 11)], fail_after=1)
+    with pytest.raises(FinderException):
+        Finder(client=failing_client).sync(state_file, page_size=5)
+    with open(state_file) as fp:
+        assert json.load(fp) == state
+    with pytest.raises(FinderException):
+        Finder(filters="bed", client=client).sync(state_file)
+
+
+class TestSoftStreaming:
+    """
+    Testing streaming of soft files
+    """
+
+    soft_text = "^SAMPLE = GSM1\r\n!Sample_title = a\r\n\r\n!Sample_title = b = c\r\n"
+
+    @pytest.mark.parametrize("chunk_size", [1, 3, 1000])
+    def test_iter_soft_lines(self, chunk_size):
+        chunks = [
+            self.soft_text[i : i + chunk_size]
+            for i in range(0, len(self.soft_text), chunk_size)
+        ]
+        assert list(utils.iter_soft_lines(chunks)) == [
+            "^SAMPLE = GSM1",
+            "!Sample_title = a",
+            "!Sample_title = b = c",
+        ]
+
+    def test_stream_is_saved_when_consumed(self, tmpdir):
+        client = FakeClient({("GSE1", "GSM"): self.soft_text})
+        soft_path = os.path.join(tmpdir, "GSE1_GSM.soft")
+        stream = utils.Accession("GSE1").stream_metadata(
+            soft_path, typename="GSM", client=client
+        )
+        next(stream)
+        assert not os.path.exists(soft_path)
+        lines = ["^SAMPLE = GSM1"] + list(stream)
+        assert list(utils.iter_soft_file(soft_path)) == lines
+
+
+class TestSoftParser:
+    """
+    Testing single-pass parser of soft files
+    """
+
+    gsm_lines = [
+        "^SAMPLE = GSM1",
+        "!Sample_title = a",
+        "!Sample_relation = SRA: https://www.ncbi.nlm.nih.gov/sra?term=SRX000001",
+        "!Sample_supplementary_file_1 = ftp://x/GSM1_a.bed.gz",
+        "!Sample_supplementary_file_2 = NONE",
+        "#VALUE = normalized",
+        "!sample_table_begin",
+        "ID_REF\tVALUE",
+        "!sample_table_end",
+        "^SAMPLE = GSM2",
+        "!Sample_title = b = c",
+    ]
+
+    def test_records(self):
+        document = soft.parse_soft(self.gsm_lines)
+        assert [(r.entity, r.accession) for r in document] == [
+            ("SAMPLE", "GSM1"),
+            ("SAMPLE", "GSM2"),
+        ]
+        first, second = document.records
+        assert first.srx == "SRX000001" and first.srx_index == 1
+        assert first.supplementary_files == ["ftp://x/GSM1_a.bed.gz"]
+        assert first.entries[-1] == ("VALUE", "normalized", False)
+        assert second.entries == [("Sample_title", "b = c", True)]
+        assert second.srx is None
+
+    def test_gsm_metadata_keyed_by_srx(self):
+        gsm_metadata = Geofetcher()._read_gsm_metadata(
+            "GSE1", {"GSE1": {}}, self.gsm_lines
+        )
+        assert list(gsm_metadata) == ["SRX000001", "GSM2"]
+        assert gsm_metadata["SRX000001"]["gsm_id"] == "GSM1"
+
+
+class TestMetadataCache:
+    """
+    Testing persistent metadata cache
+    """
+
+    class RevalidatingClient(FakeClient):
+        def get(self, url, **kwargs):
+            self.urls.append((url, kwargs.get("headers")))
+            if kwargs.get("headers", {}).get("If-None-Match") == '"v1"':
+                response = FakeResponse()
+                response.status_code = 304
+                return response
+            return FakeResponse("^SERIES = GSE1", headers={"ETag": '"v1"'})
+
+    def test_fresh_entry_is_not_requested(self, tmpdir):
+        client = self.RevalidatingClient({})
+        cache = MetadataCache(str(tmpdir), ttl=3600)
+        for _ in range(3):
+            assert cache.fetch("url", "GSE1", "GSE", client=client) == "^SERIES = GSE1"
+        assert len(client.urls) == 1
+
+    def test_stale_entry_is_revalidated(self, tmpdir):
+        client = self.RevalidatingClient({})
+        cache = MetadataCache(str(tmpdir), ttl=0)
+        cache.fetch("url", "GSE1", "GSE", client=client)
+        assert cache.fetch("url", "GSE1", "GSE", client=client) == "^SERIES = GSE1"
+        assert client.urls[1][1] == {"If-None-Match": '"v1"'}
+
+    def test_stats(self, tmpdir):
+        client = self.RevalidatingClient({})
+        cache = MetadataCache(str(tmpdir), ttl=0)
+        cache.fetch("url", "GSE1", "GSE", client=client)
+        cache.fetch("url", "GSE1", "GSE", client=client)
+        assert cache.lookup("GSE1", "GSE") is None
+        assert cache.stats == {"misses": 2, "revalidated": 1}
+
+    def test_response_is_streamed_into_cache(self, tmpdir):
+        client = self.RevalidatingClient({})
+        cache = MetadataCache(str(tmpdir), ttl=3600)
+        stream = cache.stream("url", "GSE1", "GSE", client=client, chunk_size=4)
+        assert next(stream) == "^SER"
+        stream.close()
+        # incomplete responses are not cached
+        assert cache.get("GSE1", "GSE") is None
+        chunks = list(cache.stream("url", "GSE1", "GSE", client=client, chunk_size=4))
+        assert chunks == ["^SER", "IES ", "= GS", "E1"]
+        assert cache.get("GSE1", "GSE").body == "^SERIES = GSE1"
+
+    def test_soft_file_is_looked_up_once(self, tmpdir, monkeypatch):
+        client = FakeClient({("GSE1", "GSM"): "^SAMPLE = GSM1\r\n"})
+        cache = MetadataCache(str(tmpdir), ttl=3600)
+        lookups = []
+        get = cache.get
+        monkeypatch.setattr(
+            cache, "get", lambda *args: lookups.append(args) or get(*args)
+        )
+        for _ in range(2):
+            lines = utils.Accession("GSE1").fetch_metadata(
+                typename="GSM", client=client, cache=cache
+            )
+            assert lines == ["^SAMPLE = GSM1"]
+        assert len(lookups) == 2
+        assert len(client.urls) == 1
+
+    def test_lru_eviction(self, tmpdir):
+        cache = MetadataCache(str(tmpdir), max_size=25)
+        cache.put("GSE1", "GSE", "a" * 10)
+        cache.put("GSE2", "GSE", "b" * 10)
+        cache.get("GSE1", "GSE")
+        cache.put("GSE3", "GSE", "c" * 10)
+        assert cache.get("GSE2", "GSE") is None
+        assert cache.get("GSE1", "GSE").body == "a" * 10
+        assert cache.size == 20
+
+
+class TestDownloader:
+    """
+    Testing concurrent downloader of processed files
+    """
+
+    class RangeRequestHandler(http.server.SimpleHTTPRequestHandler):
+        """Serves files, supporting 'Range: bytes=N-' requests"""
+
+        def do_GET(self):
+            offset = self.headers.get("Range", "bytes=0-")[6:-1]
+            if offset == "0":
+                return super().do_GET()
+            with open(self.translate_path(self.path), "rb") as f:
+                data = f.read()
+            if int(offset) >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(data)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Length", str(len(data) - int(offset)))
+            self.send_header(
+                "Content-Range", f"bytes {offset}-{len(data) - 1}/{len(data)}"
+            )
+            self.end_headers()
+            self.wfile.write(data[int(offset) :])
+
+        def log_message(self, *args):
+            pass
+
+    @pytest.fixture
+    def served_dir(self, tmpdir):
+        served = tmpdir.mkdir("served")
+        handler = partial(self.RangeRequestHandler, directory=str(served))
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield served, f"http://127.0.0.1:{server.server_address[1]}"
+        server.shutdown()
+
+    def test_https_url(self):
+        assert (
+            download.https_url("ftp://ftp.ncbi.nlm.nih.gov/geo/samples/a.bed.gz")
+            == "https://ftp.ncbi.nlm.nih.gov/geo/samples/a.bed.gz"
+        )
+        assert download.https_url("ftp://example.org/a") == "ftp://example.org/a"
+
+    def test_download_many(self, served_dir, tmpdir):
+        served, base_url = served_dir
+        for n in range(6):
+            served.join(f"GSM{n}.bed").write(str(n) * 1000)
+        downloader = download.Downloader(
+            workers=3, per_host=2, retries=0, disable_progressbar=True
+        )
+        files = [
+            (f"{base_url}/GSM{n}.bed", os.path.join(tmpdir, "out", f"GSM{n}.bed"))
+            for n in range(7)
+        ]
+        failed = downloader.download_many(files)
+        assert list(failed) == [f"{base_url}/GSM6.bed"]
+        assert sorted(os.listdir(os.path.join(tmpdir, "out"))) == [
+            f"GSM{n}.bed" for n in range(6)
+        ]
+
+    def test_partial_download_is_resumed(self, served_dir, tmpdir):
+        served, base_url = served_dir
+        served.join("GSM1.bed").write("a" * 500 + "b" * 500)
+        file_path = os.path.join(tmpdir, "GSM1.bed")
+        with open(file_path + ".part", "w") as f:
+            f.write("a" * 500)
+        downloader = download.Downloader(retries=0, disable_progressbar=True)
+        downloader.download(f"{base_url}/GSM1.bed", file_path, expected_size=1000)
+        assert not os.path.exists(file_path + ".part")
+        with open(file_path) as f:
+            assert f.read() == "a" * 500 + "b" * 500
+
+    def test_complete_partial_download_is_kept(self, served_dir, tmpdir):
+        served, base_url = served_dir
+        served.join("GSM1.bed").write("a" * 1000)
+        file_path = os.path.join(tmpdir, "GSM1.bed")
+        downloader = download.Downloader(retries=0, disable_progressbar=True)
+        # complete file, that wasn't renamed (e.g. after a crash)
+        with open(file_path + ".part", "w") as f:
+            f.write("a" * 1000)
+        downloader.download(f"{base_url}/GSM1.bed", file_path)
+        assert not os.path.exists(file_path + ".part")
+        assert os.path.getsize(file_path) == 1000
+        # partial file longer than the file on the server is downloaded again
+        os.remove(file_path)
+        with open(file_path + ".part", "w") as f:
+            f.write("b" * 1200)
+        downloader.download(f"{base_url}/GSM1.bed", file_path)
+        with open(file_path) as f:
+            assert f.read() == "a" * 1000
+
+    def test_size_is_verified(self, served_dir, tmpdir):
+        served, base_url = served_dir
+        served.join("GSM1.bed").write("a" * 1000)
+        file_path = os.path.join(tmpdir, "GSM1.bed")
+        downloader = download.Downloader(retries=0, disable_progressbar=True)
+        with pytest.raises(download.DownloadException):
+            downloader.download(f"{base_url}/GSM1.bed", file_path, expected_size=999)
+        assert not os.path.exists(file_path)
+        # truncated file from previous run is completed
+        with open(file_path, "w") as f:
+            f.write("a" * 10)
+        downloader.download(f"{base_url}/GSM1.bed", file_path, expected_size=1000)
+        assert os.path.getsize(file_path) == 1000
+
+    def test_larger_existing_file_is_kept(self, tmpdir, caplog, monkeypatch):
+        def unexpected_transfer(*args):
+            raise AssertionError("existing file shouldn't be downloaded")
+
+        file_path = os.path.join(tmpdir, "GSM1.bed")
+        with open(file_path, "w") as f:
+            f.write("a" * 1000)
+        downloader = download.Downloader(retries=0, disable_progressbar=True)
+        monkeypatch.setattr(downloader, "_transfer", unexpected_transfer)
+        assert (
+            downloader.download(
+                "http://127.0.0.1/GSM1.bed", file_path, expected_size=10
+            )
+            == file_path
+        )
+        with open(file_path) as f:
+            assert f.read() == "a" * 1000
+        assert "larger than expected" in caplog.text
+
+    def test_permanent_errors_are_not_retried(self, served_dir, tmpdir, monkeypatch):
+        sleeps = []
+        monkeypatch.setattr(download.time, "sleep", sleeps.append)
+        _, base_url = served_dir
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            closed_port = sock.getsockname()[1]
+        downloader = download.Downloader(retries=4, disable_progressbar=True)
+        for url in [f"{base_url}/missing.bed", f"http://127.0.0.1:{closed_port}/a"]:
+            with pytest.raises(download.DownloadException) as err:
+                downloader.download(url, os.path.join(tmpdir, "a.bed"))
+            assert not err.value.transient
+        assert sleeps == []
+
+    def test_transient_errors_are_retried_with_capped_backoff(
+        self, tmpdir, monkeypatch
+    ):
+        sleeps = []
+        monkeypatch.setattr(download.time, "sleep", sleeps.append)
+
+        def reset_transfer(*args):
+            raise ConnectionResetError("connection reset by peer")
+
+        downloader = download.Downloader(retries=6, disable_progressbar=True)
+        monkeypatch.setattr(downloader, "_transfer", reset_transfer)
+        with pytest.raises(download.DownloadException):
+            downloader.download("http://127.0.0.1/a", os.path.join(tmpdir, "a.bed"))
+        assert sleeps == [1, 2, 4, 8, 10, 10]
+
+
+class FakeUpstreamSession:
+    """Session that answers requests forwarded by the mock server to NCBI"""
+
+    def __init__(self):
+        self.urls = []
+
+    def request(self, method, url, data=None, **kwargs):
+        self.urls.append(url)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b"" if method == "HEAD" else f"body of {url}".encode()
+        response.headers.update({"Content-Type": "text/plain", "Content-Length": "42"})
+        return response
+
+
+class TestMockServer:
+    """
+    Testing recording and replaying of NCBI responses
+    """
+
+    def test_record_and_replay(self, tmpdir):
+        upstream = FakeUpstreamSession()
+        with mockserver.MockNCBIServer(
+            str(tmpdir), record=True, session=upstream
+        ) as server:
+            client = NCBIClient(base_url=server.url, api_key="secret")
+            recorded = client.get(GSE_URL).text
+            assert client.head(GSE_URL).headers["Content-Length"] == "42"
+        assert recorded == f"body of {GSE_URL}"
+        assert upstream.urls[0].startswith(GSE_URL)
+
+        with mockserver.MockNCBIServer(str(tmpdir)) as server:
+            client = NCBIClient(base_url=server.url)
+            assert client.get(GSE_URL).text == recorded
+            assert client.get(GSE_URL + "x").status_code == 404
+            assert server.stats["replayed"] == 1
+            assert server.stats["missing"] == 1
+
+    def test_latency_and_errors(self, tmpdir):
+        with mockserver.MockNCBIServer(
+            str(tmpdir), latency=0.05, error_rate=1, error_status=429, retry_after=0
+        ) as server:
+            client = NCBIClient(base_url=server.url)
+            start = time.time()
+            response = client.get(GSE_URL)
+            assert response.status_code == 429
+            # 429 is retried by the client
+            assert server.stats["errors"] == server.stats["requests"] > 1
+            assert time.time() - start >= 0.05 * server.stats["requests"]
+            assert client.stats["requests"] == server.stats["requests"]
+            assert client.stats["retries"] == client.stats["requests"] - 1
+
+
+class TestRunReport:
+    """
+    Testing timing spans of stages and the run report
+    """
+
+    class CountingClient(FakeClient):
+        def __init__(self, soft_files: dict):
+            super().__init__(soft_files)
+            self.stats = Counter()
+
+        def get(self, url, **kwargs):
+            self.stats["requests"] += 1
+            return super().get(url, **kwargs)
+
+    def test_spans_and_counters(self, tmpdir):
+        client = self.CountingClient({})
+        report = RunReport(client)
+        with report.span("soft_gse", "GSE1"):
+            client.stats["requests"] += 2
+        with pytest.raises(ValueError):
+            with report.span("soft_gsm", "GSE1"):
+                raise ValueError
+        report.finish()
+        client.stats["requests"] += 1
+        assert report.stages()["soft_gsm"]["errors"] == 1
+        assert set(report.accessions()["GSE1"]) == {"soft_gse", "soft_gsm"}
+        assert report.counters() == {"http": {"requests": 2}, "cache": {}}
+        report.write(str(tmpdir.join("report.prom")))
+        assert "geofetch_http_requests_total 2" in tmpdir.join("report.prom").read()
+
+    def test_run_report_is_written(self, tmpdir):
+        client = self.CountingClient(
+            {
+                ("GSE1", "GSE"): "^SERIES = GSE1\r\n!Series_title = a\r\n",
+                ("GSE1", "GSM"): "^SAMPLE = GSM1\r\n!Sample_title = a\r\n",
+            }
+        )
+        report_path = tmpdir.join("report.json")
+        geofetcher = Geofetcher(
+            metadata_folder=str(tmpdir),
+            processed=True,
+            client=client,
+            run_report=str(report_path),
+        )
+        geofetcher.get_projects("GSE1")
+        report = json.loads(report_path.read())
+        assert {"soft_gse", "soft_gsm", "processed_files"} <= set(
+            report["accessions"]["GSE1"]
+        )
+        assert report["stages"]["write"]["count"] == 1
+        assert report["http"] == {"requests": 2}
+
+    def test_async_run_report(self, tmpdir):
+        client = self.CountingClient(
+            {
+                ("GSE1", "GSE"): "^SERIES = GSE1\r\n!Series_title = a\r\n",
+                ("GSE1", "GSM"): "^SAMPLE = GSM1\r\n!Sample_title = a\r\n",
+            }
+        )
+        geofetcher = Geofetcher(
+            metadata_folder=str(tmpdir), processed=True, client=client
+        )
+        asyncio.run(geofetcher.get_projects_async("GSE1"))
+        report = geofetcher.report.to_dict()
+        # soft files are fetched before projects are created, in the same run
+        assert report["stages"]["prefetch_metadata"]["count"] == 1
+        assert "processed_files" in report["accessions"]["GSE1"]
+        assert report["http"] == {"requests": 2}
+
+    def test_prefetched_metadata_is_dropped_after_run(self, tmpdir, monkeypatch):
+        client = self.CountingClient(
+            {
+                ("GSE1", "GSE"): "^SERIES = GSE1\r\n!Series_title = a\r\n",
+                ("GSE1", "GSM"): "^SAMPLE = GSM1\r\n!Sample_title = a\r\n",
+            }
+        )
+        geofetcher = Geofetcher(
+            metadata_folder=str(tmpdir), processed=True, client=client
+        )
+        fetch_accession_meta = geofetcher._fetch_accession_meta
+
+        def prefetching_fetch_accession_meta(*args):
+            # run info prefetched for a project, that is never processed
+            geofetcher._prefetched[("SRA", "SRP1")] = [{"Run": "SRR1"}]
+            return fetch_accession_meta(*args)
+
+        monkeypatch.setattr(
+            geofetcher, "_fetch_accession_meta", prefetching_fetch_accession_meta
+        )
+        geofetcher.get_projects("GSE1")
+        assert geofetcher._prefetched == {}
+
+    def test_overlapping_async_runs_are_rejected(self, tmpdir):
+        client = self.CountingClient(
+            {
+                ("GSE1", "GSE"): "^SERIES = GSE1\r\n!Series_title = a\r\n",
+                ("GSE1", "GSM"): "^SAMPLE = GSM1\r\n!Sample_title = a\r\n",
+            }
+        )
+        geofetcher = Geofetcher(
+            metadata_folder=str(tmpdir), processed=True, client=client
+        )
+
+        async def overlapping_runs():
+            return await asyncio.gather(
+                geofetcher.get_projects_async("GSE1"),
+                geofetcher.get_projects_async("GSE1"),
+                return_exceptions=True,
+            )
+
+        first, second = asyncio.run(overlapping_runs())
+        assert first == {}
+        assert isinstance(second, RuntimeError)
+        assert "processed_files" in geofetcher.report.accessions()["GSE1"]
+        # prefetched metadata of the first run wasn't touched by the second one
+        assert client.stats["requests"] == 2
+        # geofetcher can be used again, once the run is finished
+        assert geofetcher.get_projects("GSE1") == {}
+
+    @pytest.mark.parametrize("profiler", ["cprofile", "tracemalloc"])
+    def test_run_is_profiled(self, tmpdir, profiler):
+        client = self.CountingClient(
+            {
+                ("GSE1", "GSE"): "^SERIES = GSE1\r\n!Series_title = a\r\n",
+                ("GSE1", "GSM"): "^SAMPLE = GSM1\r\n!Sample_title = a\r\n",
+            }
+        )
+        geofetcher = Geofetcher(
+            metadata_folder=str(tmpdir),
+            processed=True,
+            client=client,
+            profile=profiler,
+            profile_dir=str(tmpdir.join("profiles")),
+            profile_top=5,
+        )
+        geofetcher.get_projects("GSE1")
+        profile = geofetcher.report.to_dict()["profile"]
+        assert os.path.isfile(profile["profile"])
+        assert "Peak memory" in open(profile["summary"]).read()
+        assert 0 < len(profile["top"]) <= 5
+        assert profile["peak_memory"] > 0
+        assert len(tmpdir.join("profiles").listdir()) == 2
+
+    def test_unsupported_profiler(self, tmpdir):
+        with pytest.raises(SystemExit):
+            Geofetcher(metadata_folder=str(tmpdir), profile="perf")
+
+
+class TestPrefetchScheduler:
+    """
+    Testing scheduler of prefetch processes
+    """
+
+    def test_retries_and_failures(self, tmpdir):
+        fake_prefetch = tmpdir.join("prefetch")
+        fake_prefetch.write(
+            f"#!/bin/sh\necho $1 >> {tmpdir.join('calls')}\n"
+            '[ "$1" = "SRR2" ] && exit 1\nexit 0\n'
+        )
+        fake_prefetch.chmod(0o755)
+        scheduler = prefetch.PrefetchScheduler(
+            jobs=2, retries=2, backoff=0, prefetch_path=str(fake_prefetch)
+        )
+        done = []
+        failed = scheduler.run(["SRR1", ("SRR2", 10.0), "SRR3"], on_done=done.append)
+        assert failed == {"SRR2": 1}
+        assert sorted(done) == ["SRR1", "SRR3"]
+        assert sorted(tmpdir.join("calls").read().split()) == [
+            "SRR1",
+            "SRR2",
+            "SRR2",
+            "SRR3",
+        ]
+
+    def test_budget(self):
+        scheduler = prefetch.PrefetchScheduler(jobs=3, budget_mb=100)
+        running = {"process": prefetch.PrefetchJob("SRR1", 60)}
+        assert not scheduler._fits(prefetch.PrefetchJob("SRR2", 60), running)
+        assert scheduler._fits(prefetch.PrefetchJob("SRR2", 40), running)
+        # run larger than the budget is downloaded alone
+        assert scheduler._fits(prefetch.PrefetchJob("SRR3", 500), {})
+
+    def test_conversion_overlaps_download(self, tmpdir, monkeypatch):
+        events = tmpdir.join("events")
+        fake_prefetch = tmpdir.join("prefetch")
+        fake_prefetch.write(
+            '#!/bin/sh\n[ "$1" = "SRR2" ] && sleep 1\n' f"echo done $1 >> {events}\n"
+        )
+        fake_prefetch.chmod(0o755)
+        geofetcher = Geofetcher(
+            just_metadata=True, bam_conversion=True, bam_folder=str(tmpdir)
+        )
+        geofetcher.prefetch_scheduler = prefetch.PrefetchScheduler(
+            jobs=1, prefetch_path=str(fake_prefetch)
+        )
+        monkeypatch.setattr(
+            geofetcher,
+            "_convert_raw_data",
+            lambda run_name: events.write(f"convert {run_name}\n", mode="a"),
+        )
+        assert geofetcher._download_raw_runs("GSE1", ["SRR1", "SRR2"]) == {}
+        assert events.read().splitlines() == [
+            "done SRR1",
+            "convert SRR1",
+            "done SRR2",
+            "convert SRR2",
+        ]